@@ -0,0 +1,158 @@
+# attachment_cache.py
+# V30.5 - Fix: 懒加载附件的位置过期 (服务器上移动 / UIDVALIDITY 变化) 时按 email_folders + Message-ID 重新定位，不再一直报 "请重新同步"
+import os
+import time
+import threading
+import imaplib
+import config
+import db_manager
+import attachment_store
+import imap_parser
+import mail_fetcher
+
+MB = 1024 * 1024
+CACHE_BUDGET = int(getattr(config, 'ATTACHMENT_CACHE_MB', 1024)) * MB   # 可淘汰附件的磁盘上限
+PREFETCH_DAYS = 3            # 预取最近几天的邮件里的附件
+PREFETCH_MAX_BYTES = 5 * MB  # 单个附件超过这个大小不预取
+PREFETCH_MAX_FILES = 20      # 每轮最多预取几个
+PREFETCH_BUDGET_RATIO = 0.8  # 缓存占用超过上限的 80% 就不再预取
+PREFETCH_EXTS = (".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".txt", ".csv", ".zip")
+
+pool = None   # main.py 启动时设置成 CalendarApp 的 ImapPool，下载时复用长连接
+_lock = threading.Lock()   # 同一时间只下载一个，避免同一附件被并发下两次
+
+def _row(locator):
+    account, folder, uidvalidity, uid, section = attachment_store.parse_locator(locator)
+    return db_manager.query_one("""SELECT a.filename, a.encoding, a.mime_type, a.file_size, b.path, a.id, a.email_id FROM attachments a
+                                   LEFT JOIN blobs b ON b.sha256 = a.sha256
+                                   WHERE a.account_email=? AND a.folder=? AND a.uidvalidity=? AND a.uid=? AND a.section=?""",
+                                (account, folder, uidvalidity, uid, section))
+
+def _touch(path):
+    with db_manager.transaction() as c: c.execute("UPDATE blobs SET last_access=? WHERE path=?", (time.time(), path))
+
+def cached_path(locator):
+    """已经下载过就返回本地路径 (并刷新 LRU 时间)，否则 None；只查库，不联网"""
+    row = _row(locator)
+    if row and row[4] and os.path.exists(row[4]):
+        _touch(row[4]); return row[4]
+    return None
+
+def is_cached(locator):
+    """界面显示用：本地有没有 (只读，不刷新 LRU 时间)"""
+    row = _row(locator)
+    return bool(row and row[4] and os.path.exists(row[4]))
+
+def _account(email_addr):
+    for acc in config.ACCOUNTS:
+        if acc['email'] == email_addr: return acc
+    raise Exception(f"找不到账号 {email_addr}")
+
+def _locate(mail, account, email_id, folder, uidvalidity, uid):
+    """选中附件所在的文件夹，返回邮件现在的 UID；找不到返回 None
+    定位串里的文件夹 / UID 是入库时的，服务器上移走了或 UIDVALIDITY 变了就对不上：
+    先试原来的位置，再试 email_folders 里这封邮件现在在的文件夹，UID 对不上时按 Message-ID 搜"""
+    row = db_manager.query_one("SELECT message_id FROM emails WHERE id=?", (email_id,))
+    msg_id = row[0] if row and row[0] and row[0].startswith("<") else None   # 没有 Message-ID 的邮件入库时用的是合成的，搜不到
+    places = [(folder, uidvalidity, uid)]
+    for f, u, v in db_manager.query("""SELECT f.folder, f.uid, s.uidvalidity FROM email_folders f
+                                       LEFT JOIN sync_state s ON s.account_email = f.account_email AND (s.folder = f.folder OR (f.folder = 'inbox' AND s.folder = ?))
+                                       WHERE f.email_id=? AND f.account_email=?""", (mail_fetcher.SYNC_FOLDER, email_id, account)):
+        f = mail_fetcher.SYNC_FOLDER if f == 'inbox' else f
+        if (f, u) != (folder, uid): places.append((f, v, u))
+    for f, v, u in places:
+        status, _ = mail.select(imap_parser.quote_mailbox(f), readonly=True)
+        if status != 'OK': continue
+        if mail_fetcher.get_uidvalidity(mail) == v:
+            status, data = mail.uid('search', None, f'UID {u}')
+            if status == 'OK' and data and data[0] and u in [int(x) for x in data[0].split()]: return u
+        if msg_id:
+            status, data = mail.uid('search', None, 'HEADER', 'Message-ID', imap_parser.quote_mailbox(msg_id))
+            if status == 'OK' and data and data[0]: return int(data[0].split()[-1])
+    return None
+
+def fetch(locator):
+    """下载一个懒加载附件到附件仓库，返回本地路径 (阻塞，不要在 GUI 线程调用)
+    locator 只当附件记录的标识用；服务器上的位置过期了 (移动文件夹 / UIDVALIDITY 变化) 由 _locate 重新找"""
+    with _lock:
+        path = cached_path(locator)
+        if path: return path
+        row = _row(locator)
+        if row is None: raise Exception("附件记录不存在")
+        filename, encoding, mime, size, _, att_id, email_id = row
+        account, folder, uidvalidity, uid, section = attachment_store.parse_locator(locator)
+        part = {"section": section, "encoding": encoding or "", "filename": filename, "type": mime or "", "size": size or 0}
+        with mail_fetcher.open_connection(_account(account), pool) as mail:
+            uid = _locate(mail, account, email_id, folder, uidvalidity, uid)
+            if uid is None: raise Exception("服务器上找不到这封邮件了 (已删除或移到了不同步的文件夹)")
+            saved = mail_fetcher.stream_attachment(mail, uid, part)
+        with db_manager.transaction() as c:
+            c.execute("UPDATE attachments SET sha256=?, file_path=?, file_size=? WHERE id=?", (saved['sha256'], saved['path'], saved['size'], att_id))
+            c.execute("""INSERT INTO blobs (sha256, path, size, refcount, last_access) VALUES (?, ?, ?, 1, ?)
+                         ON CONFLICT(sha256) DO UPDATE SET refcount = refcount + 1, last_access = excluded.last_access""",
+                      (saved['sha256'], saved['path'], saved['size'], time.time()))
+        evict(keep=saved['sha256'])
+        return saved['path']
+
+def cache_usage():
+    return db_manager.query_one("SELECT COALESCE(SUM(size), 0) FROM blobs")[0]
+
+def evict(budget=None, keep=None):
+    """超出容量上限时，按最近访问时间从旧到新删掉能重新下载的 blob；返回释放的字节数
+    (被旧格式 / 非懒加载附件引用的 blob 删了就找不回来，不参与淘汰)"""
+    budget = CACHE_BUDGET if budget is None else budget
+    used = cache_usage(); freed = 0
+    if used <= budget: return 0
+    rows = db_manager.query("""SELECT b.sha256, b.path, b.size FROM blobs b
+                               WHERE NOT EXISTS (SELECT 1 FROM attachments a WHERE a.sha256 = b.sha256 AND a.uid IS NULL)
+                               ORDER BY b.last_access""")
+    for sha, path, size in rows:
+        if used - freed <= budget: break
+        if sha == keep: continue
+        with db_manager.transaction() as c:
+            c.execute("UPDATE attachments SET sha256=NULL, file_path=NULL WHERE sha256=?", (sha,))
+            c.execute("DELETE FROM blobs WHERE sha256=?", (sha,))
+        try: os.remove(path)
+        except OSError: pass
+        freed += size or 0
+    return freed
+
+# === 后台预取 ===
+def prefetch_candidates(limit=PREFETCH_MAX_FILES):
+    """猜测马上会被打开的附件：最近几天的邮件里、不太大的文档类附件 (签名图片之类不算)"""
+    since = (time.time() - PREFETCH_DAYS * 86400)
+    since_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(since))
+    rows = db_manager.query("""SELECT a.account_email, a.folder, a.uidvalidity, a.uid, a.section, a.filename FROM attachments a
+                               JOIN emails e ON e.id = a.email_id
+                               WHERE a.sha256 IS NULL AND a.uid IS NOT NULL AND a.file_size <= ? AND e.date_received >= ?
+                               ORDER BY e.date_received DESC LIMIT ?""", (PREFETCH_MAX_BYTES, since_str, limit * 4))
+    out = []
+    for account, folder, uidvalidity, uid, section, filename in rows:
+        if not (filename or "").lower().endswith(PREFETCH_EXTS): continue
+        out.append(attachment_store.make_locator(account, folder, uidvalidity, uid, section))
+        if len(out) >= limit: break
+    return out
+
+class Prefetcher(threading.Thread):
+    """同步完成后在后台预取附件；用户打开附件时 (fetch 抢同一把锁) 自然让路"""
+    def __init__(self):
+        super().__init__(daemon=True)
+
+    def run(self):
+        try:
+            for locator in prefetch_candidates():
+                if cache_usage() > CACHE_BUDGET * PREFETCH_BUDGET_RATIO: break
+                try: fetch(locator)
+                except (imaplib.IMAP4.abort, OSError) as e:
+                    print(f"附件预取中断: {e}"); break
+                except Exception as e: print(f"附件预取失败: {e}")
+        finally:
+            db_manager.close_thread()
+
+_prefetcher = None
+
+def prefetch_async():
+    """启动一轮后台预取 (上一轮还没结束就跳过)"""
+    global _prefetcher
+    if _prefetcher is not None and _prefetcher.is_alive(): return
+    _prefetcher = Prefetcher(); _prefetcher.start()
@@ -0,0 +1,138 @@
+# attachment_store.py
+# V29.2 - New: 懒加载附件的 IMAP 定位串 (imap:账号/文件夹/UIDVALIDITY/UID/part)
+import os
+import shutil
+import hashlib
+import tempfile
+import time
+
+STORE_DIR = os.path.join("attachments", "store")
+GC_GRACE = 3600            # 刚写进仓库、还没来得及入库的文件，1 小时内 gc 不删
+
+def _ext(filename):
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if 0 < len(ext) <= 10 and ext[1:].isalnum() else ""
+
+def blob_dir(sha):
+    return os.path.join(STORE_DIR, sha[:2])
+
+def find(sha):
+    """已存在的 blob 路径 (扩展名以第一次入库时为准)，没有返回 None"""
+    d = blob_dir(sha)
+    try: names = os.listdir(d)
+    except FileNotFoundError: return None
+    for name in names:
+        if name == sha or (name.startswith(sha) and name[len(sha)] == "."): return os.path.abspath(os.path.join(d, name))
+    return None
+
+def put(payload, filename):
+    """存一份附件内容 -> (sha256, 绝对路径)。内容已存在时直接返回，不写盘"""
+    sha = hashlib.sha256(payload).hexdigest()
+    path = find(sha)
+    if path: return sha, path
+    d = blob_dir(sha); os.makedirs(d, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=d, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f: f.write(payload)
+        path = os.path.join(d, sha + _ext(filename))
+        os.replace(tmp, path)   # 原子落盘：不会留下写了一半的 blob
+    except:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+    return sha, os.path.abspath(path)
+
+def sha256_file(path, bufsize=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(bufsize), b""): h.update(chunk)
+    return h.hexdigest()
+
+def put_file(src, filename, sha=None, move=True):
+    """把一个已经写好的文件收进仓库 -> (sha256, 绝对路径)
+    move=True: 移动 (内容已存在时删掉 src)；move=False: 硬链接 (不支持时复制)，src 原样保留"""
+    sha = sha or sha256_file(src)
+    path = find(sha)
+    if path:
+        if move: os.remove(src)
+        return sha, path
+    d = blob_dir(sha); os.makedirs(d, exist_ok=True)
+    path = os.path.join(d, sha + _ext(filename))
+    if move: os.replace(src, path)
+    else:
+        try: os.link(src, path)
+        except OSError: shutil.copy2(src, path)
+    return sha, os.path.abspath(path)
+
+class BlobWriter:
+    """流式写入：边写临时文件边算 SHA-256，commit 时收进仓库 (内容已存在就丢掉临时文件)"""
+    def __init__(self):
+        os.makedirs(STORE_DIR, exist_ok=True)
+        fd, self.tmp = tempfile.mkstemp(dir=STORE_DIR, suffix=".part")
+        self.f = os.fdopen(fd, "wb"); self.h = hashlib.sha256(); self.size = 0
+
+    def write(self, data):
+        if not data: return
+        self.f.write(data); self.h.update(data); self.size += len(data)
+
+    def commit(self, filename):
+        self.f.close()
+        return put_file(self.tmp, filename, self.h.hexdigest())
+
+    def abort(self):
+        self.f.close()
+        if os.path.exists(self.tmp): os.remove(self.tmp)
+
+# === 懒加载附件定位串 ===
+# 写在 emails.attachments 的路径位置上: "文件名|imap:账号/文件夹/UIDVALIDITY/UID/part号|大小"
+LOCATOR_PREFIX = "imap:"
+
+def make_locator(account_email, folder, uidvalidity, uid, section):
+    return f"{LOCATOR_PREFIX}{account_email}/{folder}/{uidvalidity}/{uid}/{section}"
+
+def is_locator(path): return bool(path) and path.startswith(LOCATOR_PREFIX)
+
+def parse_locator(locator):
+    """-> (account_email, folder, uidvalidity, uid, section)；文件夹名里可能有 '/'，所以两头拆"""
+    account, rest = locator[len(LOCATOR_PREFIX):].split("/", 1)
+    folder, uidvalidity, uid, section = rest.rsplit("/", 3)
+    return account, folder, int(uidvalidity), int(uid), section
+
+# === 数据库记录 (在写线程的事务里调用) ===
+def add_refs(c, email_id, files):
+    """files: [{'name', 'path', 'size', 'sha256'}]；写 attachments 行并给 blob 引用计数 +1
+    懒加载的附件 sha256/path 为空，另带 locator/encoding/mime，下载后才有 blob"""
+    if not files: return
+    rows = []
+    for f in files:
+        loc = parse_locator(f['locator']) if f.get('locator') else (None,) * 5
+        rows.append((email_id, f['name'], f['path'], f['size'], f['sha256'], loc[0], loc[1], loc[2], loc[3], loc[4], f.get('encoding'), f.get('mime')))
+    c.executemany("""INSERT INTO attachments (email_id, filename, file_path, file_size, sha256, account_email, folder, uidvalidity, uid, section, encoding, mime_type)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+    stored = [f for f in files if f['sha256']]
+    c.executemany("""INSERT INTO blobs (sha256, path, size, refcount, last_access) VALUES (?, ?, ?, 1, ?)
+                     ON CONFLICT(sha256) DO UPDATE SET refcount = refcount + 1""",
+                  [(f['sha256'], f['path'], f['size'], time.time()) for f in stored])
+
+def gc(conn, dry_run=False):
+    """按 attachments 表重算引用计数，删掉没人引用的 blob 和仓库里的孤儿文件；返回 (删除文件数, 释放字节数)"""
+    c = conn.cursor()
+    c.execute("UPDATE blobs SET refcount = (SELECT COUNT(*) FROM attachments a WHERE a.sha256 = blobs.sha256)")
+    c.execute("SELECT sha256 FROM blobs WHERE refcount > 0")
+    live = {row[0] for row in c.fetchall()}
+    removed = 0; freed = 0; cutoff = time.time() - GC_GRACE
+    for root, _, names in os.walk(STORE_DIR):
+        for name in names:
+            path = os.path.join(root, name)
+            sha = name.split(".")[0]
+            if sha in live: continue
+            try:
+                st = os.stat(path)
+                if st.st_mtime > cutoff: continue
+                if not dry_run: os.remove(path)
+                removed += 1; freed += st.st_size
+            except OSError: pass
+    if not dry_run:
+        c.execute("DELETE FROM blobs WHERE refcount = 0")
+        conn.commit()
+    else: conn.rollback()
+    return removed, freed
@@ -0,0 +1,192 @@
+# bench_meeting.py
+# V30.1 - 会议识别：邀请正文语料上的准确率 + 耗时 (旧的三套正则 vs meeting_parser)，有识别错误时退出码非 0
+# 用法: python bench_meeting.py [重复次数]
+import re
+import sys
+import html
+import time
+from datetime import datetime, timedelta
+import meeting_parser
+
+# === 语料：(说明, 主题, 正文, 期望) ；期望 = (平台, 链接, 开始, 结束) / None (不是会议邀请) ===
+CORPUS = [
+    ("腾讯会议 中文邀请", "Q1 经营分析会", """张三 邀请您参加腾讯会议
+会议主题：Q1 经营分析会
+会议时间：2026/01/15 14:00-15:00 (GMT+08:00) 中国标准时间 - 北京
+
+点击链接入会，或添加至会议列表：
+https://meeting.tencent.com/dm/AbCdEf123456
+
+#腾讯会议：123-456-789
+会议密码：1234
+
+手机一键拨号入会
++8675536550000,,123456789# (中国大陆)""",
+     ("tencent", "https://meeting.tencent.com/dm/AbCdEf123456", "2026-01-15 14:00", "2026-01-15 15:00")),
+
+    ("VooV 英文邀请", "Design review", """Li Si invited you to a VooV Meeting
+Meeting Topic: Design review
+Meeting Time: 2026/01/20 09:30-10:30 (GMT+08:00) China Standard Time - Beijing
+
+Click the link to join the meeting or add it to your meeting list:
+https://voovmeeting.com/dm/Xy9ZkLmN0p
+
+#VooV Meeting: 987-654-321""",
+     ("tencent", "https://voovmeeting.com/dm/Xy9ZkLmN0p", "2026-01-20 09:30", "2026-01-20 10:30")),
+
+    ("Teams HTML 邀请", "周会", """<html><body><div>会议时间：2026-01-16 10:00-11:00</div>
+<div style="width:100%"><span style="white-space:nowrap;color:#5F5F5F">________________________________________________________________________________</span></div>
+<div style="margin-bottom:24px"><span style="font-size:24px;color:#252424">Microsoft Teams meeting</span></div>
+<div><a href="https://teams.microsoft.com/l/meetup-join/19%3ameeting_NjQ4ZTk2ZDMt%40thread.v2/0?context=%7b%22Tid%22%3a%2272f988bf%22%2c%22Oid%22%3a%22a1b2%22%7d" target="_blank">Click here to join the meeting</a></div>
+<div>Meeting ID: 234 567 890 123 <br>Passcode: aB3cD4</div>
+<div><a href="https://aka.ms/JoinTeamsMeeting">Learn More</a> | <a href="https://teams.microsoft.com/meetingOptions/?organizerId=a1b2&amp;tenantId=72f9">Meeting options</a></div>
+</body></html>""",
+     ("teams", "https://teams.microsoft.com/l/meetup-join/19%3ameeting_NjQ4ZTk2ZDMt%40thread.v2/0?context=%7b%22Tid%22%3a%2272f988bf%22%2c%22Oid%22%3a%22a1b2%22%7d", "2026-01-16 10:00", "2026-01-16 11:00")),
+
+    ("Teams 安全链接 (Outlook Safe Links)", "Sprint planning", """<p>Meeting Time: 2026-01-19 15:00 - 16:30</p>
+<a href="https://nam12.safelinks.protection.outlook.com/?url=https%3A%2F%2Fteams.microsoft.com%2Fl%2Fmeetup-join%2F19%253ameeting_ZmQx%2540thread.v2%2F0&amp;data=05%7C02%7C&amp;sdata=abc%3D&amp;reserved=0">Join the meeting now</a>""",
+     ("teams", "https://teams.microsoft.com/l/meetup-join/19%3ameeting_ZmQx%40thread.v2/0", "2026-01-19 15:00", "2026-01-19 16:30")),
+
+    ("Teams 启动器链接优先", "OKR 对齐", """会议时间：2026年1月21日 周三 13:00 至 14:00
+Join: https://teams.microsoft.com/l/meetup-join/19%3ameeting_OTk5%40thread.v2/0
+Alt: https://teams.microsoft.com/dl/launcher/launcher.html?url=%2F_%23%2Fl%2Fmeetup-join%2F19%3Ameeting_OTk5&type=meetup-join""",
+     ("teams", "https://teams.microsoft.com/dl/launcher/launcher.html?url=%2F_%23%2Fl%2Fmeetup-join%2F19%3Ameeting_OTk5&type=meetup-join", "2026-01-21 13:00", "2026-01-21 14:00")),
+
+    ("Zoom 英文邀请", "Weekly Sync", """Wang Wu is inviting you to a scheduled Zoom meeting.
+
+Topic: Weekly Sync
+Time: Jan 22, 2026 02:00 PM Beijing, Shanghai
+
+Join Zoom Meeting
+https://us06web.zoom.us/j/81234567890?pwd=AbCdEfGh.1
+
+Meeting ID: 812 3456 7890
+Passcode: 445566""",
+     ("zoom", "https://us06web.zoom.us/j/81234567890?pwd=AbCdEfGh.1", "2026-01-22 14:00", "2026-01-22 15:00")),
+
+    ("Zoom 中文邀请", "项目评审", """王五 正在邀请您参加预定的 Zoom 会议。
+
+主题：项目评审
+时间：2026年1月23日 02:30 下午 北京，上海
+
+加入 Zoom 会议
+https://zoom.us/j/98765432100?pwd=xYz123
+
+会议号：987 6543 2100""",
+     ("zoom", "https://zoom.us/j/98765432100?pwd=xYz123", "2026-01-23 14:30", "2026-01-23 15:30")),
+
+    ("链接后紧跟中文标点", "供应商沟通", """链接：https://meeting.tencent.com/dm/QwErTy，密码 1234；
+时间：2026-02-03 16:00""",
+     ("tencent", "https://meeting.tencent.com/dm/QwErTy", "2026-02-03 16:00", "2026-02-03 17:00")),
+
+    ("跨零点的会", "海外同步", """Meeting Time: 2026-01-30 23:30-00:30
+https://teams.microsoft.com/l/meetup-join/19%3ameeting_MzAx%40thread.v2/0""",
+     ("teams", "https://teams.microsoft.com/l/meetup-join/19%3ameeting_MzAx%40thread.v2/0", "2026-01-30 23:30", "2026-01-31 00:30")),
+
+    ("没有链接的线下会", "部门例会", """各位好，
+会议时间：2026-02-05 09:00-10:00
+地点：3 楼大会议室""",
+     ("", "", "2026-02-05 09:00", "2026-02-05 10:00")),
+
+    ("中文回复里的邮件头 (不是会议)", "回复: 报销", """好的，收到。
+
+发件人: 李四 <ls@example.com>
+发送时间: 2026年1月10日 9:00
+收件人: 张三
+主题: 报销""", None),
+
+    ("英文转发头 (不是会议)", "FW: Invoice", """Please see below.
+
+From: Finance <fin@example.com>
+Sent: Monday, January 12, 2026 10:00 AM
+To: Team
+Subject: Invoice""", None),
+
+    ("只有链接没有时间 (不是会议)", "Webinar recording", """The recording of last week's webinar is available:
+https://us02web.zoom.us/rec/share/AbC123""", None),
+]
+
+def got_of(info):
+    if info is None: return None
+    return (info.get("provider", ""), info.get("join_url", ""), info["start_time"], info["end_time"])
+
+# === 旧实现 (对照用，照抄优化前的三套正则) ===
+def legacy_ingest(subject, raw_text):
+    info = {"uid": "", "summary": subject, "start_time": "", "end_time": "", "location": "", "description": ""}
+    link_patterns = [
+        r'(https?://teams\.microsoft(?:online)?\.(?:com|cn)/dl/launcher/launcher\.html\?[^\s"\'<>]+)',
+        r'(https?://teams\.microsoft(?:online)?\.(?:com|cn)/[^\s"\'<>]+)',
+        r'(https?://(?:meeting\.tencent\.com|voovmeeting\.com)/[A-Za-z0-9/_?=&%.-]+)',
+        r'(https?://\w+\.zoom\.us/[A-Za-z0-9/_?=&%.-]+)'
+    ]
+    for pat in link_patterns:
+        match = re.search(pat, raw_text)
+        if match:
+            info["location"] = html.unescape(match.group(1))
+            break
+    clean_text = re.sub(r'<[^>]+>', ' ', raw_text)
+    info["description"] = clean_text[:200].strip()
+    date_part = r'\d{4}[-/年]\d{1,2}[-/月]\d{1,2}'
+    time_part = r'\d{1,2}:\d{2}'
+    strong = rf'(?:会议时间|Meeting Time)[：:]\s*({date_part}.*?{time_part})'
+    weak = rf'(?<!发送)(?<!Sent\s)(?<!Date:\s)(?:时间|Time)[：:]\s*({date_part}.*?{time_part})'
+    match = re.search(strong, clean_text, re.IGNORECASE)
+    if not match: match = re.search(weak, clean_text, re.IGNORECASE)
+    if match:
+        try:
+            nums = re.findall(r'\d+', match.group(1).strip())
+            if len(nums) >= 5:
+                y, m, d, h, mn = map(int, nums[:5])
+                s_dt = datetime(y, m, d, h, mn)
+                info["start_time"] = s_dt.strftime("%Y-%m-%d %H:%M")
+                info["end_time"] = (s_dt + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M")
+        except: pass
+    return info if info["start_time"] else None
+
+def legacy_card(loc, desc):
+    # ui_calendar.EventCard.find_url：每张卡片渲染时对地点 / 描述各跑一遍
+    patterns = [
+        (r'(https?://teams\.microsoft\.com/[^\s<>"]+)', 'teams'),
+        (r'(https?://teams\.live\.com/[^\s<>"]+)', 'teams'),
+        (r'(https?://teams\.microsoftonline\.cn/[^\s<>"]+)', 'teams'),
+        (r'(https?://meeting\.tencent\.com/[^\s<>"]+)', 'tencent'),
+        (r'(https?://voovmeeting\.com/[^\s<>"]+)', 'tencent'),
+        (r'(https?://[a-zA-Z0-9-]+\.zoom\.us/[^\s<>"]+)', 'zoom')
+    ]
+    for text in (loc, desc):
+        if not text: continue
+        for pat, m_type in patterns:
+            match = re.search(pat, text)
+            if match: return (match.group(1), m_type)
+    return None
+
+def legacy(subject, body):
+    info = legacy_ingest(subject, body)
+    if info is None: return None
+    link = legacy_card(info["location"], info["description"])
+    info["join_url"], info["provider"] = (link[0], link[1]) if link else ("", "")
+    return info
+
+def accuracy(name, fn):
+    ok = 0
+    for label, subject, body, want in CORPUS:
+        got = got_of(fn(subject, body))
+        if got == want: ok += 1
+        else: print(f"   ❌ [{name}] {label}\n      期望 {want}\n      得到 {got}")
+    print(f"🎯 {name}: {ok}/{len(CORPUS)} 正确")
+    return ok
+
+def timed(fn, rounds):
+    t = time.perf_counter()
+    for _ in range(rounds):
+        for _, subject, body, _ in CORPUS: fn(subject, body)
+    return (time.perf_counter() - t) / (rounds * len(CORPUS)) * 1e6
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    old_ok = accuracy("旧实现", legacy)
+    new_ok = accuracy("meeting_parser", lambda s, b: meeting_parser.parse_invite(s, b))
+    print(f"⏱️ 旧实现 (入库 + 卡片渲染):  {timed(legacy, rounds):7.1f} µs/封")
+    print(f"   其中卡片渲染 (每次点日期都重跑): {timed(lambda s, b: legacy_card('', b[:200]), rounds):7.1f} µs/张")
+    print(f"⏱️ meeting_parser (只在入库): {timed(lambda s, b: meeting_parser.parse_invite(s, b), rounds):7.1f} µs/封  (卡片渲染: 0，读 events.join_url)")
+    sys.exit(0 if new_ok == len(CORPUS) else 1)
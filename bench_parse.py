@@ -0,0 +1,98 @@
+# bench_parse.py
+# V30.4 - 改用 _sync_folder (多文件夹同步后 INBOX 也走它)；解析进程池的检查 + 计时 (python bench_parse.py [封数])
+import io
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import contextlib
+import db_manager
+import mail_fetcher
+
+BASE_UID = 1000   # 假装上次同步到这里，之后的都是新邮件 (last_uid=0 会被 FETCH_LIMIT 截断)
+
+def make_mail(i):
+    """和 bench_sync 一样的正文，每 10 封带一个会议；-> (头部字节, 正文字节)"""
+    body = "<p>" + "正文内容 " * 200 + "</p>"
+    if i % 10 == 0: body += f"<p>会议时间：2026-01-{i // 10 % 28 + 1:02d} 10:00-11:00</p><p>https://meeting.tencent.com/dm/bench{i}</p>"
+    header = (f"Subject: =?utf-8?b?5rWL6K+V6YKu5Lu2?= {i}\r\nFrom: a@example.com\r\nTo: b@example.com\r\n"
+              f"Date: Thu, 01 Jan 2026 10:00:00 +0800\r\nMessage-ID: <parse-{i}@example.com>\r\n"
+              "Content-Type: text/html; charset=utf-8\r\nContent-Transfer-Encoding: 8bit\r\n\r\n").encode()
+    return header, body.encode()
+
+class FakeMail:
+    """只会回答 _sync_folder 用到的 SELECT / UID SEARCH / 两种 UID FETCH (头部+结构 / 正文)，回包格式和 imaplib 一样"""
+    def __init__(self, n): self.mails = {BASE_UID + i: make_mail(i) for i in range(1, n + 1)}
+
+    def select(self, folder): return 'OK', [str(len(self.mails)).encode()]
+    def response(self, code): return code, [b'1']
+
+    def uid(self, cmd, *args):
+        if cmd.lower() == 'search': return 'OK', [" ".join(map(str, self.mails)).encode()]
+        uids, items = args; out = []
+        for seq, uid in enumerate(self._uids(uids), 1):
+            header, body = self.mails[uid]
+            if "HEADER" in items:
+                bs = f'("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "8BIT" {len(body)} 1 NIL NIL)'
+                out += [(f'{seq} (UID {uid} RFC822.SIZE {len(header) + len(body)} BODYSTRUCTURE {bs} BODY[HEADER] {{{len(header)}}}'.encode(), header), b')']
+            else: out += [(f'{seq} (UID {uid} BODY[1] {{{len(body)}}}'.encode(), body), b')']
+        return 'OK', out
+
+    @staticmethod
+    def _uids(spec):
+        for piece in spec.split(","):
+            a, _, b = piece.partition(":")
+            yield from range(int(a), int(b or a) + 1)
+
+class CountingStage(mail_fetcher.ParseStage):
+    """记下有多少次 executor() 真的给出了进程池"""
+    used = 0
+    def executor(self, pending):
+        pool = super().executor(pending)
+        if pool is not None: self.used += 1
+        return pool
+
+def run(name, n, workers):
+    fd, path = tempfile.mkstemp(suffix=".db"); os.close(fd)
+    db_manager.DB_NAME = path; db_manager.init_db()
+    stage = CountingStage(workers); mail = FakeMail(n)
+    acc = {"email": "a@example.com", "name": "bench"}
+    try:
+        conn = sqlite3.connect(path)
+        mail_fetcher.save_sync_state(conn.cursor(), acc["email"], mail_fetcher.SYNC_FOLDER, 1, BASE_UID)
+        conn.commit(); conn.close()
+        writer = mail_fetcher.DbWriter(path); writer.start()
+        c = db_manager.get_conn().cursor()
+        t = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):   # 不要 "发现会议" 刷屏
+            failed = mail_fetcher._sync_folder(acc, mail, c, writer, lambda v, m: None, stage)
+            writer.close()
+        dt = time.perf_counter() - t
+        stage.close()
+        conn = sqlite3.connect(path)
+        count = conn.execute("SELECT COUNT(*) FROM emails").fetchone()[0]
+        events = conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        last_uid = conn.execute("SELECT last_uid FROM sync_state").fetchone()[0]
+        conn.close()
+        assert not failed and count == n and last_uid == BASE_UID + n, f"{name}: 入库 {count}/{n}, last_uid={last_uid}"
+        print(f"{name:<10} {n:>5} 封  {n / dt:>7.0f} 封/秒  ({dt:.2f}s, 会议 {events}, 用进程池 {'是' if stage.used else '否'})")
+        return stage.used
+    finally:
+        db_manager.close_thread()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix): os.remove(path + suffix)
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    workers = mail_fetcher.PARSE_WORKERS or 2
+    cores = os.cpu_count() or 1
+    print(f"📊 {cores} 核，解析 {workers} 个进程，PARSE_POOL_MIN={mail_fetcher.PARSE_POOL_MIN} (FETCH_LIMIT={mail_fetcher.FETCH_LIMIT})")
+    # 日常几封新邮件 / 首次同步的一批都不值得起进程
+    assert not run("日常新邮件", 5, workers), "几封新邮件不应该启动进程池"
+    assert not run("首次同步", mail_fetcher.FETCH_LIMIT, workers), "一批首次同步不应该启动进程池"
+    run("同步线程", n, 0)
+    used = run("进程池", n, workers)
+    if cores < 2: assert not used, "单核机器不应该启动进程池"
+    elif n >= mail_fetcher.PARSE_POOL_MIN: assert used, "大批量没有用上进程池"
+    print("✅ 进程池按核数和批量启用")
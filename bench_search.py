@@ -0,0 +1,50 @@
+# bench_search.py
+# V29.3 - 全文搜索耗时：N 封合成邮件 (中英混合)，FTS5 trigram vs LIKE 全表扫描 (python bench_search.py [封数])
+import os
+import sys
+import time
+import random
+import tempfile
+import db_manager
+import mail_search
+
+# 常见词 + 大量低频词 (近似真实邮箱：少数词到处都是，大多数词只出现在少数邮件里)
+COMMON = ["周报", "会议纪要", "项目进度", "报销", "meeting", "review", "feedback", "请查收", "谢谢"]
+RARE = ["礼来方更新反馈", "实施工作总结", "合同审批", "客户拜访", "季度复盘", "上线计划", "budget", "invoice", "release", "roadmap"]
+QUERIES = [("礼来方", ("subject", "sender", "body")), ("更新反馈 周报", ("subject", "body")), ("invoice", ("body",)),
+           ("会议纪要", ("subject", "body")), ("周报", ("subject",)), ("张三", ("sender",)), ("不存在的词语", ("subject", "sender", "body"))]
+
+def fill(n):
+    rnd = random.Random(42)
+    cjk = [chr(c) for c in range(0x4E00, 0x4E00 + 3000)]
+    vocab = ["".join(rnd.choice(cjk) for _ in range(rnd.randint(2, 4))) for _ in range(20000)]
+    conn = db_manager.get_conn()
+    with conn:
+        rows = []
+        for i in range(1, n + 1):
+            words = [rnd.choice(vocab) for _ in range(120)] + [rnd.choice(COMMON) for _ in range(5)]
+            if rnd.random() < 0.01: words.append(rnd.choice(RARE))
+            rnd.shuffle(words)
+            subj = " ".join(words[:3]) + f" #{i}"
+            sender = rnd.choice(["张三 <zs@example.com>", "李四 <ls@example.com>", "Alice <alice@example.com>"])
+            body = "<html><body><p>" + "，".join(words) + "</p></body></html>"
+            rows.append((i, f"<b{i}@x>", subj, sender, f"2026-01-{i % 28 + 1:02d} 10:00:00", body))
+        conn.executemany("INSERT INTO emails (id, message_id, subject, sender, date_received, body_html, body_text) VALUES (?, ?, ?, ?, ?, ?, '')", rows)
+
+def timed(fn, *args, repeat=5):
+    fn(*args)   # 预热
+    t = time.perf_counter()
+    for _ in range(repeat): r = fn(*args)
+    return (time.perf_counter() - t) / repeat * 1000, len(r)
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    tmp = tempfile.mkdtemp(); db_manager.DB_NAME = os.path.join(tmp, "bench.db")
+    db_manager.init_db()
+    t = time.perf_counter(); fill(n); print(f"📨 生成 {n} 封: {time.perf_counter() - t:.1f}s")
+    t = time.perf_counter(); mail_search.backfill(); print(f"🔎 建索引: {time.perf_counter() - t:.1f}s")
+    for q, scopes in QUERIES:
+        fts_ms, hits = timed(mail_search.search, q, scopes)
+        like_ms, like_hits = timed(mail_search._search_like, q.split(), list(scopes), 50, repeat=1)
+        print(f"{q:<12} {'/'.join(scopes):<22} FTS {fts_ms:7.1f} ms ({hits:>2} 条)   LIKE {like_ms:8.1f} ms ({like_hits:>2} 条)")
+    db_manager.close_thread()
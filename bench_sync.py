@@ -0,0 +1,82 @@
+# bench_sync.py
+# V30.5 - Fix: 临时库用 db_manager.init_db() 建表、记录走 build_record，不再自带一份会过时的表结构 (python bench_sync.py [封数])
+import io
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import contextlib
+from email.message import Message
+import db_manager
+import mail_fetcher
+import mail_search
+
+def make_records(n):
+    """走真实的入库解析 (build_record)：正文纯文本 / 预览 / 会议识别都和同步时一样"""
+    body = "<p>" + "正文内容 " * 200 + "</p>"
+    part = [{'section': "1", 'type': "text/html", 'filename': "", 'charset': "utf-8", 'encoding': "8bit", 'size': 0}]
+    recs = []
+    for i in range(1, n + 1):
+        msg = Message()
+        msg["Subject"] = f"测试邮件 {i}"; msg["From"] = "a@example.com"; msg["To"] = "b@example.com"; msg["Date"] = "Thu, 01 Jan 2026 10:00:00 +0800"
+        html = body
+        if i % 10 == 0: html += f"<p>会议时间：2026-01-{i // 10 % 28 + 1:02d} 10:00-11:00</p><p>https://meeting.tencent.com/dm/bench{i}</p>"
+        recs.append(mail_fetcher.build_record(i, msg, f"<bench-{i}@example.com>", part, {"1": html.encode()}))
+    return recs
+
+def new_db():
+    """和正式库同一套表结构 (db_manager.init_db)，表结构改了这里不用跟着改"""
+    fd, path = tempfile.mkstemp(suffix=".db"); os.close(fd)
+    db_manager.DB_NAME = path; db_manager.init_db()
+    return path
+
+def legacy(path, recs):
+    """V28.5 之前的写法：每封邮件 查重 + 插入 + 进度 各自一次 commit (写的列 / 全文索引和 DbWriter 一样，只比提交方式)"""
+    conn = sqlite3.connect(path); c = conn.cursor()
+    for r in recs:
+        c.execute("SELECT id FROM emails WHERE message_id=?", (r['message_id'],))
+        if not c.fetchone():
+            c.execute("""INSERT INTO emails (account_email, uid, message_id, subject, sender, recipient, cc, date_received, body_html, body_text, body_plain, preview, text_len, attachments, folder)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'inbox')""",
+                      ("a@example.com", r['uid'], r['message_id'], r['subject'], r['sender'], r['recipient'], r['cc'], r['date'], r['body_html'], r['body_text'], r['body_plain'], r['preview'], r['text_len'], r['attachments']))
+            mail_search.index_rows(c, [(c.lastrowid, r['subject'], r['sender'], r['body_plain'])])
+            e = r['event']
+            if e and e['uid']:
+                c.execute("SELECT id FROM events WHERE uid=?", (e['uid'],))
+                if not c.fetchone():
+                    c.execute("INSERT INTO events (uid, summary, start_time, end_time, start_ts, end_ts, location, description, sender, recipient, join_url, provider, minutes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, '')",
+                              (e['uid'], e['summary'], e['start_time'], e['end_time'], db_manager.to_ts(e['start_time']), db_manager.to_ts(e['end_time']), e['location'], e['description'], r['sender'], r['recipient'], e['join_url'], e['provider']))
+        mail_fetcher.save_sync_state(c, "a@example.com", "INBOX", 1, r['uid'])
+        conn.commit()
+    conn.close()
+
+def batched(path, recs):
+    writer = mail_fetcher.DbWriter(path); writer.start()
+    for r in recs: writer.store("a@example.com", "INBOX", 1, True, r)
+    writer.close()
+    return writer.new_counts.get("a@example.com", 0)
+
+def run(name, fn, recs):
+    path = new_db()
+    try:
+        t = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()): fn(path, recs)   # 不要 "发现会议" 刷屏
+        dt = time.perf_counter() - t
+        conn = sqlite3.connect(path)
+        n = conn.execute("SELECT COUNT(*) FROM emails").fetchone()[0]
+        ev = conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        state = conn.execute("SELECT last_uid FROM sync_state").fetchone()
+        conn.close()
+        print(f"{name:<8} {len(recs) / dt:>9.0f} 封/秒  ({dt:.2f}s, 邮件 {n}, 会议 {ev}, last_uid {state[0] if state else None})")
+    finally:
+        db_manager.close_thread()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix): os.remove(path + suffix)
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    recs = make_records(n)
+    print(f"📊 写入 {n} 封 (每 10 封带一个会议)")
+    run("逐封提交", legacy, recs)
+    run("批量事务", batched, recs)
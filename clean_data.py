@@ -1,15 +1,18 @@
 # clean_data.py
 import os
 import shutil
+from db_manager import DB_NAME
 
 def clean():
     print("🧹 开始清理本地旧数据...")
     
     # 1. 删除数据库 (强制重新同步邮件)
-    if os.path.exists("local_mail.db"):
+    if os.path.exists(DB_NAME):
         try:
-            os.remove("local_mail.db")
-            print("✅ 已删除旧数据库: local_mail.db")
+            # WAL 模式下还有 -wal / -shm 两个伴随文件
+            for path in (DB_NAME, DB_NAME + "-wal", DB_NAME + "-shm"):
+                if os.path.exists(path): os.remove(path)
+            print(f"✅ 已删除旧数据库: {DB_NAME}")
         except Exception as e:
             print(f"❌ 无法删除数据库: {e}")
     else:
@@ -1,65 +1,376 @@
+# db_manager.py
+# V30.5 - Fix: idx_attachments_locator 覆盖完整定位串 (账号, 文件夹, UIDVALIDITY, UID, 段号)，旧库的索引启动时重建
 import sqlite3
-import os
+import re
+import threading
+import time
+from datetime import datetime, date, timedelta
+from contextlib import contextmanager
+from collections import OrderedDict
 
 DB_NAME = 'local_mail.db'
+STATEMENT_CACHE = 256   # sqlite3 按 SQL 文本缓存预编译语句；长连接 + 固定 SQL = 只编译一次
+MONTH_CACHE_SIZE = 12   # 日历最多缓存 12 个月
+MAIL_PAGE = 200         # 邮件列表每次滚动加载的行数
 
+def tune_connection(conn):
+    """WAL: 读写互不阻塞；synchronous=NORMAL: 提交时不再每次 fsync (WAL 下仍然安全)"""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA cache_size=-16000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+def connect(path=None):
+    """新建一个调好参数的独立连接 (写线程 / 脚本用)"""
+    return tune_connection(sqlite3.connect(path or DB_NAME, cached_statements=STATEMENT_CACHE))
+
+# === 时间归一化 ===
+_TS_FORMATS = (("%Y-%m-%d %H:%M:%S", 19), ("%Y-%m-%d %H:%M", 16), ("%Y-%m-%d", 10))
+
+def to_ts(text):
+    """'2024-05-01 14:30' / '2024/05/01 14:30' / '2024-05-01' -> 本地时间 epoch 秒；解析不了返回 None"""
+    if not text: return None
+    text = str(text).strip().replace("/", "-")
+    for fmt, n in _TS_FORMATS:
+        try: return int(time.mktime(datetime.strptime(text[:n], fmt).timetuple()))
+        except ValueError: continue
+    return None
+
+def day_range(day):
+    """'yyyy-MM-dd' (或 date) -> [当天 0 点, 次日 0 点) 的 epoch 秒 (夏令时那天不一定是 86400 秒)"""
+    if not isinstance(day, date): day = datetime.strptime(str(day).replace("/", "-")[:10], "%Y-%m-%d").date()
+    start = time.mktime(day.timetuple()); end = time.mktime((day + timedelta(days=1)).timetuple())
+    return int(start), int(end)
+
+# === 每线程连接池 ===
+_local = threading.local()
+
+def get_conn():
+    """当前线程的长连接；sqlite3 连接不能跨线程用，所以每个线程各一个"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = connect()
+        _local.conn = conn
+    return conn
+
+@contextmanager
+def transaction():
+    """with transaction() as c: ...  正常结束提交，异常回滚"""
+    conn = get_conn()
+    with conn: yield conn.cursor()
+
+def close_thread():
+    """线程结束前调用 (同步线程 / 回填线程 / GUI 退出时)；sqlite3 连接只能由建它的线程关，所以没有 "全部关掉" """
+    conn = getattr(_local, 'conn', None)
+    if conn is None: return
+    _local.conn = None
+    conn.close()
+
+# === 查询 ===
+def query(sql, params=()):
+    return get_conn().execute(sql, params).fetchall()
+
+def query_one(sql, params=()):
+    return get_conn().execute(sql, params).fetchone()
+
+def event_titles_between(start_ts, end_ts):
+    """日历月视图: [start_ts, end_ts) 内的 [(start_ts, summary), ...]"""
+    return query("SELECT start_ts, summary FROM events WHERE start_ts >= ? AND start_ts < ? ORDER BY start_ts", (int(start_ts), int(end_ts)))
+
+def events_on(day):
+    """某一天的会议 (day='yyyy-MM-dd')，走 idx_events_start 范围扫描；列顺序与 EventCard 参数一致"""
+    return query("""SELECT uid, start_time, end_time, summary, location, description, minutes, sender, recipient, ai_summary, join_url, provider
+                    FROM events WHERE start_ts >= ? AND start_ts < ? ORDER BY start_ts""", day_range(day))
+
+def events_starting_between(start_ts, end_ts):
+    """会议提醒 (reminder_manager): [start_ts, end_ts) 内开始的 [(uid, summary, start_ts), ...]"""
+    return query("SELECT uid, summary, start_ts FROM events WHERE start_ts >= ? AND start_ts < ? ORDER BY start_ts", (int(start_ts), int(end_ts)))
+
+def month_range(year, month):
+    start = date(year, month, 1); end = date(year + month // 12, month % 12 + 1, 1)
+    return int(time.mktime(start.timetuple())), int(time.mktime(end.timetuple()))
+
+class MonthCache:
+    """日历按月缓存 {(年, 月): {date: [标题, ...]}}，LRU 淘汰；只在 GUI 线程使用"""
+    def __init__(self, capacity=MONTH_CACHE_SIZE):
+        self.capacity = capacity; self._months = OrderedDict()
+
+    def month(self, year, month):
+        key = (year, month)
+        if key in self._months:
+            self._months.move_to_end(key); return self._months[key]
+        data = {}
+        for ts, summary in event_titles_between(*month_range(year, month)):
+            data.setdefault(datetime.fromtimestamp(ts).date(), []).append(summary)
+        self._months[key] = data
+        while len(self._months) > self.capacity: self._months.popitem(last=False)
+        return data
+
+    def window(self, year, month, margin=1):
+        """当前月 ± margin 个月合并成一个 dict (月视图首尾会露出相邻月份的日期)"""
+        data = {}
+        for i in range(-margin, margin + 1):
+            y, m = divmod(year * 12 + month - 1 + i, 12)
+            data.update(self.month(y, m + 1))
+        return data
+
+    def invalidate(self, timestamps=None):
+        """timestamps=None 全部失效；否则只丢掉这些时间所在的月份"""
+        if timestamps is None: self._months.clear(); return
+        for ts in timestamps:
+            if ts is None: continue
+            d = datetime.fromtimestamp(ts); self._months.pop((d.year, d.month), None)
+
+def mail_page(account_email=None, before=None, limit=MAIL_PAGE):
+    """邮件列表的一页 (新邮件在前) -> [(id, sender, date_received, subject, preview), ...]
+    before 是上一页最后一行的 (date_received, id)：keyset 翻页，不用 OFFSET，翻到多深都只扫 limit 行"""
+    where = []; params = []
+    if account_email: where.append("account_email = ?"); params.append(account_email)
+    if before: where.append("(date_received, id) < (?, ?)"); params.extend(before)
+    sql = "SELECT id, sender, date_received, subject, preview FROM emails"
+    if where: sql += " WHERE " + " AND ".join(where)
+    return query(sql + " ORDER BY date_received DESC, id DESC LIMIT ?", (*params, limit))
+
+def mail_rows(ids, account_email=None):
+    """同步新入库的几封邮件，列和 mail_page 一样 (邮件列表按增量插行用)"""
+    out = []; ids = list(ids)
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        sql = f"SELECT id, sender, date_received, subject, preview FROM emails WHERE id IN ({','.join('?' * len(chunk))})"
+        params = list(chunk)
+        if account_email: sql += " AND account_email = ?"; params.append(account_email)
+        out += query(sql, params)
+    return out
+
+def email_detail(email_id):
+    """邮件阅读器 -> (subject, sender, recipient, cc, date_received, attachments, body_text, body_plain, body_html)"""
+    return query_one("SELECT subject, sender, recipient, cc, date_received, attachments, body_text, body_plain, body_html FROM emails WHERE id=?", (email_id,))
+
+def update_minutes(uid, minutes, ai_summary=None, c=None):
+    if c is None:
+        with transaction() as c: return update_minutes(uid, minutes, ai_summary, c)
+    if ai_summary is not None: c.execute("UPDATE events SET minutes = ?, ai_summary = ? WHERE uid = ?", (minutes, ai_summary, uid))
+    else: c.execute("UPDATE events SET minutes = ? WHERE uid = ?", (minutes, uid))
+
+class MinutesWriter(threading.Thread):
+    """纪要后台写线程：pending 里每个会议 uid 只留最新一版 (后来的覆盖先来的)，
+    醒来后把当前所有 pending 放进一个事务提交；flush() 等到全部落盘 (失焦 / 退出时调用)"""
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.pending = {}; self.cond = threading.Condition(); self.busy = False; self.stopped = False
+
+    def put(self, uid, minutes, ai_summary=None):
+        with self.cond:
+            old = self.pending.get(uid)
+            # 只改正文时保留还没写下去的 AI 总结
+            if ai_summary is None and old is not None: ai_summary = old[1]
+            self.pending[uid] = (minutes, ai_summary); self.cond.notify_all()
+
+    def flush(self, timeout=5.0):
+        """等 pending 全部写完；超时返回 False"""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while self.pending or self.busy:
+                left = deadline - time.monotonic()
+                if left <= 0: return False
+                self.cond.wait(left)
+        return True
+
+    def stop(self, timeout=5.0):
+        ok = self.flush(timeout)
+        with self.cond: self.stopped = True; self.cond.notify_all()
+        return ok
+
+    def run(self):
+        conn = connect()
+        try:
+            while True:
+                with self.cond:
+                    while not self.pending and not self.stopped: self.cond.wait()
+                    if not self.pending: return
+                    batch, self.pending = self.pending, {}; self.busy = True
+                try:
+                    with conn:
+                        for uid, (minutes, ai_summary) in batch.items(): update_minutes(uid, minutes, ai_summary, conn)
+                except Exception as e:
+                    print(f"纪要保存失败: {e}")
+                    with self.cond:
+                        for uid, v in batch.items(): self.pending.setdefault(uid, v)   # 放回去，下次再试 (期间有更新的版本就用新的)
+                    time.sleep(1)
+                finally:
+                    with self.cond: self.busy = False; self.cond.notify_all()
+        finally:
+            conn.close()
+
+_minutes_writer = None; _minutes_lock = threading.Lock()
+
+def save_minutes_async(uid, minutes, ai_summary=None):
+    """GUI 用：交给后台写线程，立即返回"""
+    global _minutes_writer
+    with _minutes_lock:
+        if _minutes_writer is None or not _minutes_writer.is_alive():
+            _minutes_writer = MinutesWriter(); _minutes_writer.start()
+    _minutes_writer.put(uid, minutes, ai_summary)
+
+def flush_minutes(timeout=5.0):
+    """把还在排队的纪要写完 (卡片失焦等时候调用)"""
+    w = _minutes_writer
+    return w.flush(timeout) if w is not None and w.is_alive() else True
+
+def stop_minutes(timeout=5.0):
+    """退出时调用：写完排队的纪要后让写线程退出，它自己关掉自己的连接"""
+    global _minutes_writer
+    with _minutes_lock: w, _minutes_writer = _minutes_writer, None
+    if w is None or not w.is_alive(): return True
+    ok = w.stop(timeout); w.join(timeout)
+    return ok
+
+# === 建表 / 升级 (main.py 启动时调用) ===
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    
-    # 1. 邮件表 (增加 uid 字段，用于增量同步)
-    c.execute('''CREATE TABLE IF NOT EXISTS emails
-                 (id INTEGER PRIMARY KEY, 
-                  account_email TEXT,
-                  uid INTEGER,
-                  message_id TEXT, 
-                  subject TEXT, 
-                  sender TEXT, 
-                  recipient TEXT, 
-                  date_received DATETIME, 
-                  body_html TEXT, 
-                  body_text TEXT, 
-                  attachments TEXT,
-                  folder TEXT DEFAULT 'INBOX',
-                  is_read BOOLEAN DEFAULT 0,
-                  UNIQUE(account_email, uid))''')
+    conn = connect(); c = conn.cursor()
+
+    # 1. 会议表
+    c.execute('''CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        uid TEXT UNIQUE,
+        summary TEXT,
+        start_time TEXT,
+        end_time TEXT,
+        location TEXT,
+        description TEXT,
+        sender TEXT,
+        recipient TEXT,
+        minutes TEXT,
+        ai_summary TEXT
+    )''')
+    try: c.execute("ALTER TABLE events ADD COLUMN ai_summary TEXT")
+    except: pass
+    for col in ("start_ts", "end_ts"):
+        try: c.execute(f"ALTER TABLE events ADD COLUMN {col} INTEGER")
+        except: pass
+    # 旧数据回填 (只处理还没算过的行)
+    c.execute("SELECT id, start_time, end_time FROM events WHERE start_ts IS NULL AND start_time IS NOT NULL AND start_time != ''")
+    rows = [(to_ts(st), to_ts(et), i) for i, st, et in c.fetchall()]
+    c.executemany("UPDATE events SET start_ts=?, end_ts=? WHERE id=?", [r for r in rows if r[0] is not None])
+    # 入会链接 / 平台 (teams / tencent / zoom)，没有链接存 ''；旧数据从地点和描述里补
+    for col in ("join_url", "provider"):
+        try: c.execute(f"ALTER TABLE events ADD COLUMN {col} TEXT")
+        except: pass
+    import meeting_parser
+    c.execute("SELECT id, location, description FROM events WHERE join_url IS NULL")
+    c.executemany("UPDATE events SET join_url=?, provider=? WHERE id=?",
+                  [(*(meeting_parser.event_link(loc, desc) or ("", "")), i) for i, loc, desc in c.fetchall()])
+
+    # 2. 邮件表 (uid 用于增量同步)
+    c.execute('''CREATE TABLE IF NOT EXISTS emails (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        account_email TEXT,
+        message_id TEXT,
+        subject TEXT,
+        sender TEXT,
+        recipient TEXT,
+        cc TEXT,
+        date_received TEXT,
+        body_html TEXT,
+        body_text TEXT,
+        attachments TEXT,
+        folder TEXT
+    )''')
+    try: c.execute("ALTER TABLE emails ADD COLUMN uid INTEGER")
+    except: pass
+    # 很早的版本建表时带 UNIQUE(account_email, uid)：UID 只在一个文件夹里唯一，多文件夹同步会撞，重建表去掉 (id 不变，全文索引照旧对得上)
+    row = c.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='emails'").fetchone()
+    if row and re.search(r'UNIQUE\s*\(\s*account_email\s*,\s*uid\s*\)', row[0], re.I):
+        cols = ", ".join(r[1] for r in c.execute("PRAGMA table_info(emails)").fetchall())
+        sql = re.sub(r',\s*UNIQUE\s*\(\s*account_email\s*,\s*uid\s*\)', '', row[0], flags=re.I)
+        c.execute(re.sub(r'^CREATE TABLE\s+"?emails"?', 'CREATE TABLE emails_new', sql, flags=re.I))
+        c.execute(f"INSERT INTO emails_new ({cols}) SELECT {cols} FROM emails")
+        c.execute("DROP TABLE emails"); c.execute("ALTER TABLE emails_new RENAME TO emails")
+    # 纯文本正文 / 一行预览 / 正文长度：入库时算一次 (mail_search.text_fields)，旧邮件由 mail_search.backfill 补
+    for col, typ in (("body_plain", "TEXT"), ("preview", "TEXT"), ("text_len", "INTEGER")):
+        try: c.execute(f"ALTER TABLE emails ADD COLUMN {col} {typ}")
+        except: pass
 
-    # 2. 附件表 (用于记录附件存放路径)
+    # 3. 附件表 (用于记录附件存放路径)
     c.execute('''CREATE TABLE IF NOT EXISTS attachments
                  (id INTEGER PRIMARY KEY,
                   email_id INTEGER,
                   filename TEXT,
                   file_path TEXT,
                   file_size INTEGER)''')
+    # 懒加载附件: 只记 IMAP 位置，file_path/sha256 在下载后才填上
+    for col, typ in (("sha256", "TEXT"), ("account_email", "TEXT"), ("folder", "TEXT"), ("uidvalidity", "INTEGER"),
+                     ("uid", "INTEGER"), ("section", "TEXT"), ("encoding", "TEXT"), ("mime_type", "TEXT")):
+        try: c.execute(f"ALTER TABLE attachments ADD COLUMN {col} {typ}")
+        except: pass
+    # 附件内容仓库：相同内容只存一份 (attachment_store.py)，refcount = 引用它的 attachments 行数
+    c.execute('''CREATE TABLE IF NOT EXISTS blobs
+                 (sha256 TEXT PRIMARY KEY,
+                  path TEXT,
+                  size INTEGER,
+                  refcount INTEGER DEFAULT 0)''')
+    try: c.execute("ALTER TABLE blobs ADD COLUMN last_access REAL")
+    except: pass
 
-    # 3. 草稿表
+    # 4. 草稿表
     c.execute('''CREATE TABLE IF NOT EXISTS drafts
-                 (id INTEGER PRIMARY KEY, 
+                 (id INTEGER PRIMARY KEY,
                   account_email TEXT,
-                  recipient TEXT, 
+                  recipient TEXT,
                   cc TEXT,
-                  subject TEXT, 
-                  body_html TEXT, 
+                  subject TEXT,
+                  body_html TEXT,
                   attachments TEXT,
                   last_saved TEXT)''')
-                  
-    # 4. 会议表
-    c.execute('''CREATE TABLE IF NOT EXISTS events
-                 (id INTEGER PRIMARY KEY, 
-                  uid TEXT UNIQUE, 
-                  summary TEXT, 
-                  start_time TEXT, 
-                  end_time TEXT, 
-                  location TEXT, 
-                  description TEXT)''')
-    
+
+    # 5. 增量同步状态表 (每个账号/文件夹的 UIDVALIDITY + 已同步最大 UID)
+    c.execute('''CREATE TABLE IF NOT EXISTS sync_state
+                 (account_email TEXT,
+                  folder TEXT,
+                  uidvalidity INTEGER,
+                  last_uid INTEGER DEFAULT 0,
+                  last_sync TEXT,
+                  PRIMARY KEY (account_email, folder))''')
+    # 历史回填进度：已经补到的最小 UID (NULL = 还没开始，1 = 补完)；UIDVALIDITY 变化时清空
+    # uidnext / messages：上次同步完时的 STATUS，没变的文件夹不用 SELECT
+    for col in ("backfill_uid", "uidnext", "messages"):
+        try: c.execute(f"ALTER TABLE sync_state ADD COLUMN {col} INTEGER")
+        except: pass
+
+    # 邮件在各文件夹里的位置：同一个 Message-ID 可能同时在 INBOX 和 已发送 (Gmail 标签同理)，emails 只存一行，每个文件夹的 UID 都记在这里
+    c.execute('''CREATE TABLE IF NOT EXISTS email_folders
+                 (email_id INTEGER,
+                  account_email TEXT,
+                  folder TEXT,
+                  uid INTEGER,
+                  PRIMARY KEY (account_email, folder, uid))''')
+    if not c.execute("SELECT 1 FROM email_folders LIMIT 1").fetchone():
+        c.execute("INSERT OR IGNORE INTO email_folders SELECT id, account_email, folder, uid FROM emails WHERE uid IS NOT NULL")
+
+    # 6. 全文索引 (FTS5 trigram，见 mail_search.py)
+    import mail_search
+    mail_search.create_schema(c)
+
+    # 7. 索引
+    c.execute("CREATE INDEX IF NOT EXISTS idx_events_start ON events(start_ts)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_emails_message_id ON emails(message_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_emails_account_date ON emails(account_email, date_received)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_emails_date ON emails(date_received)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_emails_folder_uid ON emails(account_email, folder, uid)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_email_folders_email ON email_folders(email_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attachments_email ON attachments(email_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attachments_sha ON attachments(sha256)")
+    # 定位串是 (账号, 文件夹, UIDVALIDITY, UID, 段号)；旧版的索引少了文件夹 / UIDVALIDITY，多文件夹后同一个 UID 会撞，重建
+    row = c.execute("SELECT sql FROM sqlite_master WHERE type='index' AND name='idx_attachments_locator'").fetchone()
+    if row and 'folder' not in row[0]: c.execute("DROP INDEX idx_attachments_locator")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attachments_locator ON attachments(account_email, folder, uidvalidity, uid, section)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_blobs_access ON blobs(last_access)")
+
     conn.commit()
     conn.close()
-    
-    # 创建附件存储目录
-    if not os.path.exists("downloaded_attachments"):
-        os.mkdir("downloaded_attachments")
 
 if __name__ == "__main__":
     init_db()
-    print("✅ V1.1 数据库结构升级完成！")
\ No newline at end of file
+    print("✅ V30.4 数据库结构升级完成！")
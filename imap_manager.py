@@ -0,0 +1,181 @@
+# imap_manager.py
+# V30.4 - New: 连接池每账号可开多条连接 (多个文件夹并行同步)，IDLE 占一条，其余给同步用
+import imaplib
+import select
+import threading
+import time
+from contextlib import contextmanager
+
+IMAP_TIMEOUT = 15
+NOOP_AFTER = 300           # 连接闲置超过 5 分钟，借出前先 NOOP 探活
+BACKOFF_BASE = 5           # 重连退避：5s, 10s, 20s ... 最多 5 分钟
+BACKOFF_MAX = 300
+IDLE_MAX = 25 * 60         # RFC 2177 建议 29 分钟内重新发 IDLE
+POLL_INTERVAL = 60         # 服务器不支持 IDLE 时的 NOOP 轮询间隔
+POOL_SIZE = 2              # 每账号的连接数：一条挂 IDLE，一条同步；文件夹多时同步会把 IDLE 那条也借走
+
+def connect(acc):
+    """新建一个已登录的连接，超时只作用于这个 socket"""
+    mail = imaplib.IMAP4_SSL(acc['imap_server'], acc['imap_port'], timeout=int(acc.get('timeout', IMAP_TIMEOUT)))
+    mail.login(acc['email'], acc['password'])
+    return mail
+
+def _quiet_logout(mail):
+    try: mail.logout()
+    except: pass
+
+class _Slot:
+    def __init__(self, acc):
+        self.acc = acc; self.cond = threading.Condition()
+        self.idle = []   # 空闲的已登录连接 [(conn, 上次使用时间)]
+        self.busy = 0; self.waiting = 0; self.failures = 0; self.retry_at = 0
+        self.size = pool_size(acc)
+
+def pool_size(acc):
+    """一个账号最多开几条连接 (账号里 'max_connections' 可改)；服务器一般限制单账号并发连接数，别开太多"""
+    return max(1, int(acc.get('max_connections', POOL_SIZE)))
+
+class ImapPool:
+    """每个账号最多 pool_size(acc) 条长连接；每条同一时间只借给一个使用者 (同步线程 / 文件夹同步 / IDLE 监听线程)"""
+    def __init__(self):
+        self._slots = {}; self._mu = threading.Lock(); self.closed = False
+
+    def _slot(self, acc):
+        with self._mu:
+            if acc['email'] not in self._slots: self._slots[acc['email']] = _Slot(acc)
+            return self._slots[acc['email']]
+
+    def has_waiters(self, acc): return self._slot(acc).waiting > 0
+
+    def _ensure(self, slot, conn, last_used):
+        if conn is not None and time.monotonic() - last_used > NOOP_AFTER:
+            try: conn.noop()
+            except: _quiet_logout(conn); conn = None
+        if conn is None:
+            wait = slot.retry_at - time.monotonic()
+            if wait > 0: raise ConnectionError(f"{slot.acc['email']} 重连退避中，{int(wait)}s 后重试")
+            try:
+                conn = connect(slot.acc); slot.failures = 0
+            except Exception:
+                slot.failures += 1
+                slot.retry_at = time.monotonic() + min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (slot.failures - 1))
+                raise
+        return conn
+
+    @contextmanager
+    def lease(self, acc):
+        slot = self._slot(acc)
+        with slot.cond:
+            slot.waiting += 1
+            try:
+                while not slot.idle and slot.busy >= slot.size: slot.cond.wait()
+            finally:
+                slot.waiting -= 1
+            slot.busy += 1
+            stale, last_used = slot.idle.pop() if slot.idle else (None, 0)
+        conn = None
+        try:
+            conn = self._ensure(slot, stale, last_used)
+            yield conn
+        except (imaplib.IMAP4.abort, OSError):
+            # 连接已断：丢掉，下次借出时重连
+            if conn is not None: _quiet_logout(conn); conn = None
+            raise
+        finally:
+            with slot.cond:
+                slot.busy -= 1
+                if conn is not None:
+                    if self.closed: _quiet_logout(conn)
+                    else: slot.idle.append((conn, time.monotonic()))
+                slot.cond.notify()
+
+    def retry_delay(self, acc): return max(0, self._slot(acc).retry_at - time.monotonic())
+
+    def close_all(self):
+        """退出时调用：空闲连接立刻登出，借出去的在归还时登出"""
+        with self._mu: self.closed = True; slots = list(self._slots.values())
+        for slot in slots:
+            with slot.cond: conns = slot.idle; slot.idle = []
+            for conn, _ in conns: _quiet_logout(conn)
+
+# === IDLE ===
+class _RawLines:
+    """IDLE 期间直接读 socket (带超时轮询)，避免 imaplib 的 makefile 在超时后失效"""
+    def __init__(self, sock): self.sock = sock; self.buf = b""
+
+    def readline(self, timeout):
+        deadline = time.monotonic() + timeout
+        while b"\n" not in self.buf:
+            pending = getattr(self.sock, "pending", lambda: 0)()
+            if not pending:
+                left = deadline - time.monotonic()
+                if left <= 0: return None
+                r, _, _ = select.select([self.sock], [], [], left)
+                if not r: return None
+            data = self.sock.recv(65536)
+            if not data: raise imaplib.IMAP4.abort("IDLE 连接被服务器关闭")
+            self.buf += data
+        line, self.buf = self.buf.split(b"\n", 1)
+        return line + b"\n"
+
+def idle_once(mail, should_stop, max_secs=IDLE_MAX, folder="INBOX"):
+    """进入 IDLE，直到有新邮件 (EXISTS) / should_stop() / 超时；返回是否有新邮件"""
+    mail.select(folder, readonly=True)
+    tag = mail._new_tag()
+    mail.send(tag + b" IDLE\r\n")
+    reader = _RawLines(mail.sock)
+    line = reader.readline(IMAP_TIMEOUT)
+    if not line or not line.startswith(b"+"):
+        mail.tagged_commands.pop(tag, None)
+        raise imaplib.IMAP4.abort(f"IDLE 被拒绝: {line!r}")
+    got = False; deadline = time.monotonic() + max_secs
+    try:
+        while not should_stop() and time.monotonic() < deadline:
+            line = reader.readline(1.0)
+            if line is None: continue
+            if line.startswith(b"* BYE"): raise imaplib.IMAP4.abort("服务器断开 IDLE")
+            if line.startswith(b"*") and b"EXISTS" in line.upper(): got = True; break
+    finally:
+        mail.send(b"DONE\r\n")
+        while True:
+            line = reader.readline(IMAP_TIMEOUT)
+            if line is None: raise imaplib.IMAP4.abort("IDLE 结束超时")
+            if line.startswith(tag): break
+        mail.tagged_commands.pop(tag, None)
+    return got
+
+class IdleWatcher(threading.Thread):
+    """每个账号一个监听线程：支持 IDLE 就挂在 IDLE 上，否则 NOOP 轮询；有新邮件回调 on_new_mail(acc)"""
+    def __init__(self, pool, acc, on_new_mail):
+        super().__init__(daemon=True)
+        self.pool = pool; self.acc = acc; self.on_new_mail = on_new_mail
+        self.stop_event = threading.Event(); self.last_exists = None
+
+    def stop(self): self.stop_event.set()
+
+    def _should_yield(self):
+        # 同步线程在等这个连接 / 程序退出 => 立刻结束 IDLE 把连接让出去
+        return self.stop_event.is_set() or self.pool.has_waiters(self.acc)
+
+    def _poll(self, mail):
+        mail.select("INBOX", readonly=True); mail.noop()
+        _, data = mail.response('EXISTS')
+        try: exists = int(data[-1])
+        except: return False
+        new = self.last_exists is not None and exists > self.last_exists
+        self.last_exists = exists
+        return new
+
+    def run(self):
+        while not self.stop_event.is_set():
+            # 让等待中的同步线程先拿到连接
+            while self.pool.has_waiters(self.acc) and not self.stop_event.is_set(): time.sleep(0.2)
+            try:
+                with self.pool.lease(self.acc) as mail:
+                    supports_idle = 'IDLE' in mail.capabilities
+                    new = idle_once(mail, self._should_yield) if supports_idle else self._poll(mail)
+                if new: self.on_new_mail(self.acc)
+                if not supports_idle: self.stop_event.wait(POLL_INTERVAL)
+            except Exception as e:
+                print(f"IDLE 监听 {self.acc['email']} 出错: {e}")
+                self.stop_event.wait(max(BACKOFF_BASE, self.pool.retry_delay(self.acc)))
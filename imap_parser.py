@@ -0,0 +1,210 @@
+# imap_parser.py
+# V30.4 - New: LIST / STATUS 响应解析 + 修改版 UTF-7 文件夹名 (多文件夹同步)
+import re
+import base64
+import binascii
+import quopri
+from urllib.parse import unquote
+
+_TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"\[]*\[[^\]]*\][^\s()]*|[^\s()"]+))', re.S)
+_LITERAL_TAIL = re.compile(rb'\{\d+\}$')
+
+class _Literal(bytes):
+    """imaplib 已经读好的 {n} 字面量"""
+
+def _chunks(data):
+    # imaplib 的 FETCH 结果: [(b'1 (UID 5 BODY[HEADER] {342}', literal), b' BODYSTRUCTURE (...))', b'2 (...)', ...]
+    for item in data or []:
+        if isinstance(item, tuple):
+            yield _LITERAL_TAIL.sub(b'', item[0])
+            yield _Literal(item[1])
+        elif item:
+            yield item
+
+def _tokens(data):
+    for chunk in _chunks(data):
+        if isinstance(chunk, _Literal):
+            yield ('str', bytes(chunk)); continue
+        pos = 0
+        while pos < len(chunk):
+            m = _TOKEN_RE.match(chunk, pos)
+            if not m or m.end() == pos: break
+            pos = m.end()
+            if m.group(1): yield ('(', None)
+            elif m.group(2): yield (')', None)
+            elif m.group(3) is not None: yield ('str', re.sub(rb'\\(.)', rb'\1', m.group(3)))
+            elif m.group(4): yield ('atom', m.group(4))
+
+def _read_list(tokens, pos):
+    items = []
+    while pos < len(tokens):
+        kind, val = tokens[pos]; pos += 1
+        if kind == ')': return items, pos
+        if kind == '(':
+            sub, pos = _read_list(tokens, pos); items.append(sub)
+        elif kind == 'atom' and val.upper() == b'NIL': items.append(None)
+        else: items.append(val)
+    return items, pos
+
+def parse_fetch_response(data):
+    """把一次 (多封邮件的) FETCH 响应解析成 [{'UID': 5, 'BODY[HEADER]': b'...', 'BODYSTRUCTURE': [...]}, ...]"""
+    tokens = list(_tokens(data)); pos = 0; results = []
+    while pos < len(tokens):
+        kind, val = tokens[pos]; pos += 1
+        if kind != 'atom' or not val.isdigit() or pos >= len(tokens) or tokens[pos][0] != '(': continue
+        items, pos = _read_list(tokens, pos + 1)
+        msg = {}
+        for i in range(0, len(items) - 1, 2):
+            key = items[i]
+            if not isinstance(key, bytes): continue
+            key = key.decode('ascii', 'ignore').upper().replace('BODY.PEEK[', 'BODY[')
+            msg[key] = items[i + 1]
+        if 'UID' in msg:
+            try: msg['UID'] = int(msg['UID'])
+            except: continue
+            results.append(msg)
+    return results
+
+def uid_set(uids):
+    """[1,2,3,7,9,10] -> '1:3,7,9:10'"""
+    uids = sorted(set(int(u) for u in uids)); ranges = []
+    for u in uids:
+        if ranges and u == ranges[-1][1] + 1: ranges[-1][1] = u
+        else: ranges.append([u, u])
+    return ",".join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+# === LIST / STATUS (多文件夹) ===
+def quote_mailbox(name):
+    """imaplib 不会给文件夹名加引号，"Sent Items" 这种带空格的名字要自己加"""
+    return '"' + name.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+_MUTF7 = re.compile(r'&([A-Za-z0-9+,]*)-')
+
+def decode_mailbox(name):
+    """修改版 UTF-7 (RFC 3501 5.1.3) 的文件夹名 -> 可读名字，例如 '&XfJT0ZAB-' -> '已发送'"""
+    def dec(m):
+        if not m.group(1): return '&'
+        b64 = m.group(1).replace(',', '/'); b64 += '=' * (-len(b64) % 4)
+        try: return base64.b64decode(b64).decode('utf-16-be')
+        except: return m.group(0)
+    return _MUTF7.sub(dec, name)
+
+def _text(v): return v.decode('utf-8', errors='replace') if isinstance(v, bytes) else str(v)
+
+def parse_list_response(data):
+    """LIST 响应 -> [(小写的标记集合, 分隔符, 文件夹名)]；文件夹名保持服务器原样 (SELECT / STATUS 直接用)"""
+    tokens = list(_tokens(data)); pos = 0; out = []
+    while pos + 2 < len(tokens):
+        if tokens[pos][0] != '(': pos += 1; continue
+        flags, pos = _read_list(tokens, pos + 1)
+        if pos + 1 >= len(tokens): break
+        (dk, delim), (_, name) = tokens[pos], tokens[pos + 1]; pos += 2
+        out.append(({_text(f).lower() for f in flags if isinstance(f, bytes)},
+                    None if dk == 'atom' and delim.upper() == b'NIL' else _text(delim), _text(name)))
+    return out
+
+def parse_status_response(data):
+    """STATUS 响应 (含 LIST-STATUS 带回来的) -> {文件夹名: {'UIDNEXT': n, 'MESSAGES': n, 'UIDVALIDITY': n}}"""
+    tokens = list(_tokens(data)); pos = 0; out = {}
+    while pos + 1 < len(tokens):
+        if tokens[pos][0] not in ('str', 'atom') or tokens[pos + 1][0] != '(': pos += 1; continue
+        name = _text(tokens[pos][1])
+        items, pos = _read_list(tokens, pos + 2)
+        try: out[name] = {_text(items[i]).upper(): int(items[i + 1]) for i in range(0, len(items) - 1, 2)}
+        except: continue
+    return out
+
+# === BODYSTRUCTURE ===
+def _s(v):
+    if v is None: return ""
+    if isinstance(v, bytes): return v.decode('utf-8', errors='replace')
+    return str(v)
+
+def _params(lst):
+    params = {}
+    if isinstance(lst, list):
+        for i in range(0, len(lst) - 1, 2): params[_s(lst[i]).lower()] = _s(lst[i + 1])
+    return params
+
+def _rfc2231(value):
+    # charset'lang'%E4%B8%AD...
+    charset, text = "", value
+    if value.count("'") >= 2: charset, _, text = value.split("'", 2)
+    try: return unquote(text, encoding=charset or 'utf-8', errors='replace')
+    except LookupError: return unquote(text, errors='replace')
+
+def _param_value(params, name):
+    # 支持 RFC2231: filename*=utf-8''%E4%B8%AD.. 以及 filename*0*= / filename*1*= 续行
+    if name in params: return params[name]
+    if name + "*" in params:
+        return _rfc2231(params[name + "*"])
+    pieces = sorted((int(k[len(name) + 1:].rstrip('*')), k) for k in params if re.match(re.escape(name) + r'\*\d+\*?$', k))
+    if not pieces: return ""
+    encoded = pieces[0][1].endswith('*')
+    raw = "".join(params[k] for _, k in pieces)
+    return _rfc2231(raw) if encoded else raw
+
+def walk_bodystructure(bs, prefix=""):
+    """把 BODYSTRUCTURE 展开成叶子 part 列表 (与 msg.walk() 的叶子顺序一致)"""
+    parts = []
+    if not isinstance(bs, list) or not bs: return parts
+    if isinstance(bs[0], list):
+        # multipart: (part1)(part2)... "MIXED" ...
+        n = 0
+        for child in bs:
+            if not isinstance(child, list): break
+            n += 1
+            parts.extend(walk_bodystructure(child, f"{prefix}.{n}" if prefix else str(n)))
+        return parts
+    section = prefix or "1"
+    ctype = f"{_s(bs[0]).lower()}/{_s(bs[1]).lower()}"
+    params = _params(bs[2] if len(bs) > 2 else None)
+    encoding = _s(bs[5] if len(bs) > 5 else "").lower()
+    try: size = int(bs[6])
+    except: size = 0
+    if ctype == "message/rfc822" and len(bs) > 8 and isinstance(bs[8], list):
+        # 转发的邮件 (eml)：和 msg.walk() 一样继续往里走
+        return walk_bodystructure(bs[8], section if isinstance(bs[8][0], list) else f"{section}.1") if bs[8] else parts
+    ext = 8 if ctype.startswith("text/") else 7
+    disposition = ""; filename = ""
+    if len(bs) > ext + 1 and isinstance(bs[ext + 1], list) and bs[ext + 1]:
+        disposition = _s(bs[ext + 1][0]).lower()
+        filename = _param_value(_params(bs[ext + 1][1] if len(bs[ext + 1]) > 1 else None), "filename")
+    if not filename: filename = _param_value(params, "name")
+    parts.append({"section": section, "type": ctype, "params": params, "charset": params.get("charset", ""),
+                  "encoding": encoding, "size": size, "disposition": disposition, "filename": filename})
+    return parts
+
+def decode_part(raw, encoding):
+    """按 Content-Transfer-Encoding 解码 BODY[n] 的原始字节"""
+    if raw is None: return b""
+    try:
+        if encoding == "base64": return binascii.a2b_base64(raw) if raw.strip() else b""
+        if encoding == "quoted-printable": return quopri.decodestring(raw)
+    except (binascii.Error, ValueError):
+        try: return base64.b64decode(raw + b"===", validate=False)
+        except: return b""
+    return raw
+
+class PartDecoder:
+    """增量版 decode_part：分段喂入原始字节，返回已经能解出的内容 (base64 按 4 字节对齐，QP 按整行)"""
+    def __init__(self, encoding):
+        self.encoding = encoding; self.rest = b""
+
+    def feed(self, raw):
+        if not raw: return b""
+        if self.encoding == "base64":
+            data = self.rest + raw.translate(None, b" \t\r\n")
+            n = len(data) // 4 * 4
+            self.rest = data[n:]
+            return decode_part(data[:n], "base64") if n else b""
+        if self.encoding == "quoted-printable":
+            data = self.rest + raw
+            cut = data.rfind(b"\n") + 1
+            self.rest = data[cut:]
+            return quopri.decodestring(data[:cut]) if cut else b""
+        return raw
+
+    def flush(self):
+        rest, self.rest = self.rest, b""
+        return decode_part(rest, self.encoding) if rest else b""
@@ -1,17 +1,26 @@
 # mail_fetcher.py
-# V27.1 - Fix: 修复 hashlib 缺失导致无法保存会议的 Bug
-import sqlite3
+# V30.5 - Fix: 常规同步也按 UID 数失败次数 (和历史回填共用)，一封总是失败的新邮件重试 FETCH_MAX_TRIES 次后跳过，last_uid 不再卡住
 import imaplib
 import email
 from email.header import decode_header
-from datetime import datetime, timedelta
+from email.parser import BytesHeaderParser
+from datetime import datetime
 import os
-import uuid
 import re 
 import config
-import html 
-import socket
-import hashlib  # <--- 补上了这关键的一行！
+import threading
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import deque
+from contextlib import contextmanager
+import fnmatch
+import imap_parser
+import imap_manager
+import attachment_store
+import db_manager
+import mail_search
+import meeting_parser
 
 try:
     import icalendar
@@ -20,9 +29,55 @@ except ImportError:
     HAS_ICAL = False
     print("❌ 警告：未安装 icalendar 库")
 
-# 限制扫描最新的 30 封
+# 首次同步 (或 UIDVALIDITY 变化后全量重同步) 只扫描最新的 30 封，更早的交给后台历史回填 (Backfiller)
 FETCH_LIMIT = 30 
 ATTACHMENT_DIR = "attachments"
+SYNC_FOLDER = "INBOX"
+# 要同步的文件夹：账号里 'folders' 是优先级列表 (文件夹名 / 通配符 / 特殊用途如 '\\Sent')；不写时用 DEFAULT_FOLDERS
+# 垃圾箱 / 垃圾邮件 / 草稿 / 全部邮件 (Gmail 的 All Mail 和其他文件夹重复) 只有在列表里点名才同步，通配符不算
+DEFAULT_FOLDERS = ("INBOX", "\\Sent", "\\Archive", "*")
+SKIP_ROLES = ("\\Trash", "\\Junk", "\\Drafts", "\\All")
+# 没有 SPECIAL-USE 标记的服务器 (QQ / 163 等) 按名字认
+_ROLE_NAMES = {"\\Sent": re.compile(r'\bsent\b|已发送', re.I), "\\Archive": re.compile(r'\barchives?\b|归档', re.I),
+               "\\Trash": re.compile(r'\btrash\b|\bdeleted\b|已删除', re.I), "\\Junk": re.compile(r'\bjunk\b|\bspam\b|垃圾', re.I),
+               "\\Drafts": re.compile(r'\bdrafts?\b|草稿', re.I)}
+STATUS_ITEMS = "(UIDNEXT MESSAGES UIDVALIDITY)"
+# 文件夹列表很少变：不支持 LIST-STATUS 的服务器 LIST 结果缓存这么久，平时每轮只发 STATUS
+FOLDER_LIST_TTL = 3600
+_folder_cache = {}   # account_email -> (过期时间, [文件夹名 (按优先级)])
+# 阶段一：只取头部 + 结构，不下载正文/附件
+HEADER_ITEMS = '(UID RFC822.SIZE BODYSTRUCTURE BODY.PEEK[HEADER])'
+# 每条 FETCH 命令包含的邮件数 (账号里可用 'fetch_chunk' 覆盖)，以及单批正文下载的字节上限
+FETCH_CHUNK = 50
+# 超过这个大小 (BODYSTRUCTURE 里的编码后大小) 的附件不进批量 FETCH，改为分段流式下载
+STREAM_THRESHOLD = 1024 * 1024
+STREAM_CHUNK = 1024 * 1024
+FETCH_BATCH_BYTES = 8 * 1048576
+# 附件懒加载：同步时不下载带文件名的附件，只记位置 (config.LAZY_ATTACHMENTS / 账号里 'lazy_attachments' 可关闭)
+LAZY_ATTACHMENTS = getattr(config, 'LAZY_ATTACHMENTS', True)
+# 同时同步的账号数 (连接超时见 imap_manager.IMAP_TIMEOUT，按连接设置)
+SYNC_WORKERS = 4
+DB_PATH = db_manager.DB_NAME
+# 写线程每个事务最多合并的操作数，以及凑批时最多等待的秒数
+WRITE_BATCH = 200
+WRITE_BATCH_WAIT = 0.05
+# 解析 (MIME 解码 / ICS / 会议识别 / 附件哈希落盘) 用的进程数，留一个核给网络 / 写线程 (config.PARSE_WORKERS 可覆盖，0 = 不用进程池)
+# 机器至少两个核、一个账号一次要解析 PARSE_POOL_MIN 封以上才启用 (进程启动 + 序列化有开销，单核或日常几封新邮件直接在同步线程里解析更快)
+PARSE_WORKERS = getattr(config, 'PARSE_WORKERS', max(0, min(8, (os.cpu_count() or 1) - 1)))
+PARSE_POOL_MIN = 200
+# 已下载、还没解析完入库的邮件上限：解析跟不上时网络线程停下来等，内存不会被正文堆满
+PARSE_INFLIGHT = 256
+# 历史回填：每步每个账号向更早补 BACKFILL_CHUNK 封，步与步之间歇 BACKFILL_PAUSE 秒；补完后每 BACKFILL_RECHECK 秒再看一次 (新账号 / UIDVALIDITY 重置)
+BACKFILL_HISTORY = getattr(config, 'BACKFILL_HISTORY', True)
+BACKFILL_CHUNK = 50
+BACKFILL_PAUSE = 15
+BACKFILL_RECHECK = 3600
+# 同一封邮件 (常规同步 / 历史回填) 连续失败 FETCH_MAX_TRIES 次就跳过 (打日志)，不再卡住 last_uid / 回填下界；次数只记在内存里，重启后重新数
+FETCH_MAX_TRIES = 3
+_fetch_failures = {}   # (account_email, folder, uidvalidity, uid) -> 连续失败次数
+# 常规同步和历史回填不同时跑 (各自一个写线程)；常规同步在等时回填做完手上这一块就让路
+SYNC_LOCK = threading.Lock()
+_sync_wanted = threading.Event()
 
 if not os.path.exists(ATTACHMENT_DIR):
     os.makedirs(ATTACHMENT_DIR)
@@ -82,147 +137,726 @@ def extract_ics_data(msg_content):
     except: pass
     return None
 
-def extract_meeting_from_text(subject, raw_text):
-    info = {"uid": "", "summary": subject, "start_time": "", "end_time": "", "location": "", "description": ""}
-    link_patterns = [
-        r'(https?://teams\.microsoft(?:online)?\.(?:com|cn)/dl/launcher/launcher\.html\?[^\s"\'<>]+)',
-        r'(https?://teams\.microsoft(?:online)?\.(?:com|cn)/[^\s"\'<>]+)',
-        r'(https?://(?:meeting\.tencent\.com|voovmeeting\.com)/[A-Za-z0-9/_?=&%.-]+)',
-        r'(https?://\w+\.zoom\.us/[A-Za-z0-9/_?=&%.-]+)'
-    ]
-    for pat in link_patterns:
-        match = re.search(pat, raw_text)
-        if match:
-            info["location"] = html.unescape(match.group(1))
-            break
-    clean_text = re.sub(r'<[^>]+>', ' ', raw_text) 
-    info["description"] = clean_text[:200].strip()
-    date_part = r'\d{4}[-/年]\d{1,2}[-/月]\d{1,2}'
-    time_part = r'\d{1,2}:\d{2}'
-    strong = rf'(?:会议时间|Meeting Time)[：:]\s*({date_part}.*?{time_part})'
-    weak = rf'(?<!发送)(?<!Sent\s)(?<!Date:\s)(?:时间|Time)[：:]\s*({date_part}.*?{time_part})'
-    match = re.search(strong, clean_text, re.IGNORECASE)
-    if not match: match = re.search(weak, clean_text, re.IGNORECASE)
-    if match:
+def save_attachment(payload, filename):
+    """内容寻址存储：同样的字节 (签名图片、周报) 只落盘一次 -> {'name', 'path', 'size', 'sha256'}"""
+    try:
+        sha, path = attachment_store.put(payload, filename)
+        return {"name": filename, "path": path, "size": len(payload), "sha256": sha}
+    except: return None
+
+# === 两阶段同步 ===
+def fetch_headers(mail, uids):
+    """阶段一：一条 UID FETCH 批量取回头部和 BODYSTRUCTURE"""
+    if not uids: return []
+    status, data = mail.uid('fetch', imap_parser.uid_set(uids), HEADER_ITEMS)
+    if status != 'OK': return []
+    return sorted(imap_parser.parse_fetch_response(data), key=lambda m: m['UID'])
+
+def wanted_parts(parts):
+    """根据 BODYSTRUCTURE 决定需要下载的 part：正文 / 会议邀请 / 带文件名的附件"""
+    wanted = []
+    for p in parts:
+        fname = p['filename']
+        if p['type'] == "text/calendar" or fname.lower().endswith(".ics"): wanted.append(p)
+        elif p['type'] in ("text/plain", "text/html") and not fname: wanted.append(p)
+        elif fname: wanted.append(p)
+    return wanted
+
+def is_streamed(p):
+    """大附件 (会议邀请除外，ICS 需要整段解析)"""
+    fname = p['filename']
+    return bool(fname) and p['type'] != "text/calendar" and not fname.lower().endswith(".ics") and p['size'] > STREAM_THRESHOLD
+
+def is_lazy(p):
+    """懒加载的附件：带文件名、不是会议邀请 (ICS 同步时就要解析)"""
+    fname = p['filename']
+    return bool(fname) and p['type'] != "text/calendar" and not fname.lower().endswith(".ics")
+
+def lazy_entry(acc_email, folder, uidvalidity, uid, p):
+    """不下载，只记录以后能从服务器取回它的位置"""
+    size = p['size'] * 3 // 4 if p['encoding'] == "base64" else p['size']   # BODYSTRUCTURE 里是编码后的大小
+    return {"name": decode_str(p['filename']), "path": None, "size": size, "sha256": None,
+            "locator": attachment_store.make_locator(acc_email, folder, uidvalidity, uid, p['section']),
+            "encoding": p['encoding'], "mime": p['type']}
+
+def stream_attachment(mail, uid, part, chunk=STREAM_CHUNK):
+    """分段下载一个附件：每次取 chunk 字节原文，增量解码后写进附件仓库；内存里最多一段"""
+    sec = part['section']; decoder = imap_parser.PartDecoder(part['encoding'])
+    blob = attachment_store.BlobWriter()
+    try:
+        offset = 0
+        while True:
+            status, data = mail.uid('fetch', str(uid), f"(BODY.PEEK[{sec}]<{offset}.{chunk}>)")
+            if status != 'OK': raise Exception(f"FETCH BODY[{sec}]<{offset}> 失败")
+            raw = None
+            for got in imap_parser.parse_fetch_response(data):
+                if got['UID'] != uid: continue
+                key = next((k for k in got if k.startswith(f"BODY[{sec}]")), None)
+                if key: raw = got[key] or b""
+            if raw is None: raise Exception(f"UID {uid} 附件 {sec} 缺失")
+            blob.write(decoder.feed(raw)); offset += len(raw)
+            if len(raw) < chunk: break
+        blob.write(decoder.flush())
+        name = decode_str(part['filename'])
+        sha, path = blob.commit(name)
+        return {"name": name, "path": path, "size": blob.size, "sha256": sha}
+    except:
+        blob.abort()
+        raise
+
+def fetch_bodies(mail, jobs, max_bytes=FETCH_BATCH_BYTES):
+    """阶段二：批量下载需要的 part
+    jobs: [(uid, parts, size)]，part 列表相同的邮件合并成一条 UID FETCH (IMAP 同一命令只能取同一组 section)
+    返回 {uid: {section: 解码后的 bytes}}"""
+    out = {}; groups = {}
+    for uid, parts, size in jobs:
+        if not parts: out[uid] = {}; continue
+        groups.setdefault(tuple(p['section'] for p in parts), []).append((uid, parts, size))
+
+    def flush(sections, batch):
+        items = " ".join(f"BODY.PEEK[{sec}]" for sec in sections)
+        status, data = mail.uid('fetch', imap_parser.uid_set(u for u, _, _ in batch), f'({items})')
+        if status != 'OK': raise Exception(f"FETCH {items} 失败")
+        parts_of = {u: parts for u, parts, _ in batch}
+        for got in imap_parser.parse_fetch_response(data):
+            parts = parts_of.get(got['UID'])
+            if parts is None: continue
+            out[got['UID']] = {p['section']: imap_parser.decode_part(got.get(f"BODY[{p['section']}]"), p['encoding']) for p in parts}
+
+    for sections, members in groups.items():
+        batch = []; batch_bytes = 0
+        for job in members:
+            if batch and batch_bytes + job[2] > max_bytes:
+                flush(sections, batch); batch = []; batch_bytes = 0
+            batch.append(job); batch_bytes += job[2]
+        if batch: flush(sections, batch)
+    return out
+
+def decode_text(payload, charset):
+    try: return payload.decode(charset or 'utf-8', errors='ignore')
+    except LookupError: return payload.decode('utf-8', errors='ignore')
+
+def build_content(parts, payloads, files=None):
+    """把下载到的 part 组装成 正文 / 附件列表 / ICS；files 是已经流式落盘 / 懒加载的附件 {section: 附件信息}"""
+    body_t = ""; body_h = ""; atts = []; ics_data = None
+    for p in parts:
+        if files and p['section'] in files: atts.append(files[p['section']]); continue
+        payload = payloads.get(p['section'])
+        if not payload: continue
+        fname = p['filename']
+        if p['type'] == "text/calendar" or fname.lower().endswith(".ics"):
+            if HAS_ICAL and not ics_data: ics_data = extract_ics_data(payload)
+        elif p['type'] == "text/plain" and not fname: body_t += decode_text(payload, p['charset'])
+        elif p['type'] == "text/html" and not fname: body_h += decode_text(payload, p['charset'])
+        elif fname:
+            fn_str = decode_str(fname)
+            saved = save_attachment(payload, fn_str)
+            if saved: atts.append(saved)
+    return body_t, body_h, atts, ics_data
+
+# === 多文件夹 ===
+def folder_label(folder):
+    """emails.folder 里存的值：收件箱沿用 'inbox'，其他文件夹存服务器上的原名"""
+    return 'inbox' if folder.upper() == SYNC_FOLDER else folder
+
+def folder_role(flags, name):
+    """特殊用途 (RFC 6154 的 \\Sent / \\Archive / ...)；服务器没标时按名字猜，认不出返回 None"""
+    if name.upper() == SYNC_FOLDER: return SYNC_FOLDER
+    for role in (*_ROLE_NAMES, "\\All"):
+        if role.lower() in flags: return role
+    display = imap_parser.decode_mailbox(name)
+    return next((role for role, pat in _ROLE_NAMES.items() if pat.search(display)), None)
+
+def _folder_rank(order, name, role):
+    """-> (在优先级列表里的位置, 是否点名)；没匹配上返回 (None, False)"""
+    display = imap_parser.decode_mailbox(name)
+    for i, pat in enumerate(order):
+        if pat.startswith("\\"):
+            if role and pat.lower() == role.lower(): return i, True
+        elif pat.upper() == SYNC_FOLDER:
+            if name.upper() == SYNC_FOLDER: return i, True
+        elif pat in (name, display): return i, True
+        elif fnmatch.fnmatchcase(display, pat): return i, False
+    return None, False
+
+def select_folders(acc, listing):
+    """LIST 结果 -> 要同步的文件夹名 (按优先级排好，INBOX 总在里面)"""
+    order = list(acc.get('folders') or DEFAULT_FOLDERS); picked = []
+    for n, (flags, _, name) in enumerate(listing):
+        if "\\noselect" in flags or "\\nonexistent" in flags: continue
+        role = folder_role(flags, name)
+        rank, named = _folder_rank(order, name, role)
+        if rank is None or (role in SKIP_ROLES and not named): continue
+        picked.append((rank, n, name))
+    folders = [name for _, _, name in sorted(picked)]
+    return folders if any(f.upper() == SYNC_FOLDER for f in folders) else [SYNC_FOLDER] + folders
+
+def folder_status(acc, mail):
+    """-> [(文件夹名, STATUS 字典)]，按优先级；全程不 SELECT
+    支持 LIST-STATUS (RFC 5819) 的服务器一条命令拿到列表和全部状态；否则 LIST 走缓存，每个文件夹一条 STATUS"""
+    now = time.monotonic(); cached = _folder_cache.get(acc['email']); statuses = {}; folders = None
+    if 'LIST-STATUS' in getattr(mail, 'capabilities', ()):
+        status, data = mail.list('""', f'"*" RETURN (STATUS {STATUS_ITEMS})')
+        statuses = imap_parser.parse_status_response(mail.response('STATUS')[1])
+        if status == 'OK': folders = select_folders(acc, imap_parser.parse_list_response(data))
+    elif cached and cached[0] > now: folders = cached[1]
+    if folders is None:
+        status, data = mail.list()
+        folders = select_folders(acc, imap_parser.parse_list_response(data)) if status == 'OK' else [SYNC_FOLDER]
+        _folder_cache[acc['email']] = (now + FOLDER_LIST_TTL, folders)
+    elif not cached or cached[1] != folders: _folder_cache[acc['email']] = (now + FOLDER_LIST_TTL, folders)
+    out = []
+    for folder in folders:
+        st = statuses.get(folder)
+        if st is None:
+            try:
+                status, data = mail.status(imap_parser.quote_mailbox(folder), STATUS_ITEMS)
+                st = imap_parser.parse_status_response(data).get(folder) if status == 'OK' else None
+            except imaplib.IMAP4.error: st = None   # 文件夹刚被删 / 没权限：跳过，别的照常
+            if st is None: continue
+        out.append((folder, st))
+    return out
+
+def changed_folders(c, account_email, statuses):
+    """和上次同步完时记下的 STATUS 比，只返回有变化 (新邮件 / 删邮件 / UIDVALIDITY 变) 的文件夹"""
+    c.execute("SELECT folder, uidvalidity, uidnext, messages FROM sync_state WHERE account_email=?", (account_email,))
+    known = {f: (v, n, m) for f, v, n, m in c.fetchall()}
+    return [(f, st) for f, st in statuses if known.get(f) != (st.get('UIDVALIDITY'), st.get('UIDNEXT'), st.get('MESSAGES'))]
+
+# === 增量同步状态 (sync_state 表) ===
+def get_sync_state(c, account_email, folder):
+    c.execute("SELECT uidvalidity, last_uid FROM sync_state WHERE account_email=? AND folder=?", (account_email, folder))
+    row = c.fetchone()
+    return (row[0], row[1] or 0) if row else (None, 0)
+
+def save_sync_state(c, account_email, folder, uidvalidity, last_uid):
+    # UIDVALIDITY 变了，回填进度跟着作废；之前一封都没同步过 (空文件夹被记成补完) 的也作废，从第一次真正同步到的邮件往前补
+    c.execute('''INSERT INTO sync_state (account_email, folder, uidvalidity, last_uid, last_sync) VALUES (?, ?, ?, ?, ?)
+                 ON CONFLICT(account_email, folder) DO UPDATE SET uidvalidity=excluded.uidvalidity, last_uid=excluded.last_uid, last_sync=excluded.last_sync,
+                 backfill_uid=CASE WHEN sync_state.uidvalidity IS excluded.uidvalidity AND sync_state.last_uid > 0 THEN sync_state.backfill_uid END''',
+              (account_email, folder, uidvalidity, last_uid, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+def get_backfill_state(c, account_email, folder):
+    """-> (uidvalidity, 回填下界)；下界是已经补到的最小 UID，还没开始补时取本地最老一封 (或 last_uid + 1)，1 = 补完"""
+    c.execute("SELECT uidvalidity, last_uid, backfill_uid FROM sync_state WHERE account_email=? AND folder=?", (account_email, folder))
+    row = c.fetchone()
+    if not row: return None, None
+    if row[2] is not None: return row[0], row[2]
+    c.execute("SELECT MIN(uid) FROM email_folders WHERE account_email=? AND folder=?", (account_email, folder_label(folder)))
+    oldest = c.fetchone()[0]
+    return row[0], oldest if oldest is not None else (row[1] or 0) + 1
+
+def get_uidvalidity(mail):
+    # select 之后服务器会返回 * OK [UIDVALIDITY n]
+    _, data = mail.response('UIDVALIDITY')
+    try: return int(data[0])
+    except: return 0
+
+def search_new_uids(mail, last_uid):
+    """last_uid=0 时取最新 FETCH_LIMIT 封，否则只取 UID last_uid+1:* (升序)"""
+    if last_uid:
+        status, data = mail.uid('search', None, f'UID {last_uid + 1}:*')
+    else:
+        status, data = mail.uid('search', None, 'ALL')
+    if status != 'OK' or not data or not data[0]: return []
+    # 注意：n:* 在没有新邮件时也会返回最后一封，需要再过滤一次
+    uids = sorted(int(u) for u in data[0].split() if int(u) > last_uid)
+    if not last_uid: uids = uids[-FETCH_LIMIT:]
+    return uids
+
+# === 同步增量：这一轮真正写进数据库的东西，界面按它做局部刷新 ===
+class SyncDelta:
+    """emails: {日期: [email_id]}；events: {日期: [会议 uid]}；event_ts: 新会议的开始时间 (给 MonthCache.invalidate)
+    日期是 datetime.date；空的 delta (定时同步最常见) 界面什么都不用做"""
+    def __init__(self):
+        self.emails = {}; self.events = {}; self.event_ts = set()
+
+    def add_email(self, email_id, date_str):
+        self.emails.setdefault(_day_of(date_str), []).append(email_id)
+
+    def add_event(self, uid, start_ts):
+        if start_ts is None: return
+        self.events.setdefault(datetime.fromtimestamp(start_ts).date(), []).append(uid); self.event_ts.add(start_ts)
+
+    def merge(self, other):
+        for d, ids in other.emails.items(): self.emails.setdefault(d, []).extend(ids)
+        for d, uids in other.events.items(): self.events.setdefault(d, []).extend(uids)
+        self.event_ts |= other.event_ts
+
+    def email_ids(self): return [i for ids in self.emails.values() for i in ids]
+    def event_uids(self): return [u for uids in self.events.values() for u in uids]
+    def event_days(self): return set(self.events)
+    def is_empty(self): return not self.emails and not self.events
+    def __repr__(self): return f"SyncDelta(emails={len(self.email_ids())}, events={len(self.event_uids())}, days={sorted(map(str, self.events))})"
+
+def _day_of(date_str):
+    ts = db_manager.to_ts(date_str)
+    return datetime.fromtimestamp(ts).date() if ts is not None else None
+
+# === 单写线程：所有账号的写操作排队进入同一个连接，凑批后一个事务提交 ===
+INSERT_EMAIL_SQL = '''INSERT INTO emails (account_email, uid, message_id, subject, sender, recipient, cc, date_received, body_html, body_text, body_plain, preview, text_len, attachments, folder)
+                      SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM emails WHERE message_id=?)'''
+LOCATE_EMAIL_SQL = "INSERT OR REPLACE INTO email_folders (email_id, account_email, folder, uid) SELECT id, ?, ?, ? FROM emails WHERE message_id=? ORDER BY id LIMIT 1"
+INSERT_EVENT_SQL = "INSERT OR IGNORE INTO events (uid, summary, start_time, end_time, start_ts, end_ts, location, description, sender, recipient, join_url, provider, minutes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, '')"
+
+class DbWriter(threading.Thread):
+    def __init__(self, db_path=DB_PATH):
+        super().__init__(daemon=True)
+        self.db_path = db_path; self.q = queue.Queue()
+        self.new_counts = {}   # account_email -> 实际新增的邮件数
+        self.failed = set()    # 写入失败过的账号：本轮不再推进它的 last_uid
+        self.delta = SyncDelta()   # 已提交的增量 (只在写线程里改，close() 之后再读)
+
+    # --- 生产者接口 (同步线程调用) ---
+    def reset_uids(self, account_email, folder=SYNC_FOLDER): self.q.put(('reset', (account_email, folder_label(folder))))
+    def save_state(self, account_email, folder, uidvalidity, last_uid): self.q.put(('state', (account_email, folder, uidvalidity, last_uid)))
+    def save_backfill(self, account_email, folder, uidvalidity, floor): self.q.put(('backfill', (account_email, folder, uidvalidity, floor)))
+    def save_status(self, account_email, folder, st):
+        """文件夹同步完、没有失败时记下 STATUS，下次没变就跳过"""
+        self.q.put(('status', (account_email, folder, st.get('UIDVALIDITY'), st.get('UIDNEXT'), st.get('MESSAGES'))))
+    def store(self, account_email, folder, uidvalidity, checkpoint, rec):
+        """rec 只有 uid/message_id 时表示已存在的邮件 (只补 uid)"""
+        self.q.put(('store', (account_email, folder, uidvalidity, checkpoint, rec)))
+    def close(self): self.q.put(None); self.join()
+
+    def run(self):
+        conn = db_manager.connect(self.db_path); c = conn.cursor()
+        self.fts = mail_search.has_index(c)
+        stop = False
+        while not stop:
+            items = [self.q.get()]
+            deadline = time.monotonic() + WRITE_BATCH_WAIT
+            while len(items) < WRITE_BATCH and items[-1] is not None:
+                try: items.append(self.q.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty: break
+            if items[-1] is None: stop = True; items.pop()
+            if items: self._flush(conn, c, items)
+        conn.close()
+
+    def _flush(self, conn, c, items):
         try:
-            nums = re.findall(r'\d+', match.group(1).strip())
-            if len(nums) >= 5: 
-                y, m, d, h, mn = map(int, nums[:5])
-                s_dt = datetime(y, m, d, h, mn)
-                info["start_time"] = s_dt.strftime("%Y-%m-%d %H:%M")
-                info["end_time"] = (s_dt + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M")
+            delta = SyncDelta()
+            with conn: added = self._apply(c, items, delta)
+        except Exception as e:
+            # 整批失败：逐条重试，只丢掉真正有问题的那条
+            print(f"   ⚠️ 批量写入失败 ({e})，逐条重试")
+            added = {}; delta = SyncDelta()
+            for item in items:
+                try:
+                    one_delta = SyncDelta()
+                    with conn: one = self._apply(c, [item], one_delta)
+                    for k, v in one.items(): added[k] = added.get(k, 0) + v
+                    delta.merge(one_delta)
+                except Exception as e2:
+                    print(f"   ❌ 写入出错: {e2}"); self.failed.add(item[1][0])
+        for k, v in added.items(): self.new_counts[k] = self.new_counts.get(k, 0) + v
+        self.delta.merge(delta)   # 只合并已经提交的
+
+    def _apply(self, c, items, delta):
+        """在当前事务里执行一批操作 (保持顺序)，同步进度每个账号/文件夹只写最后一次；真正新增的记进 delta"""
+        added = {}; pending = []; states = {}; statuses = {}
+        def flush_messages():
+            if not pending: return
+            new = [(acc, folder, rec) for acc, folder, rec in pending if 'subject' in rec]
+            c.execute("SELECT COALESCE(MAX(id), 0) FROM emails"); before = c.fetchone()[0]
+            for acc in dict.fromkeys(a for a, _, _ in new):
+                rows = [(a, r['uid'], r['message_id'], r['subject'], r['sender'], r['recipient'], r['cc'], r['date'], r['body_html'], r['body_text'], r['body_plain'], r['preview'], r['text_len'], r['attachments'], folder_label(f), r['message_id']) for a, f, r in new if a == acc]
+                c.executemany(INSERT_EMAIL_SQL, rows)
+                added[acc] = added.get(acc, 0) + max(c.rowcount, 0)
+            # 真正插入的邮件才登记附件引用 + 全文索引 (单写线程，id > before 的就是本批新插入的)
+            if new:
+                recs = {r['message_id']: r for _, _, r in new}
+                c.execute("SELECT id, message_id FROM emails WHERE id > ?", (before,))
+                inserted = [(email_id, recs[mid]) for email_id, mid in c.fetchall() if mid in recs]
+                for email_id, r in inserted: attachment_store.add_refs(c, email_id, r.get('files')); delta.add_email(email_id, r['date'])
+                if self.fts: mail_search.index_rows(c, [(email_id, r['subject'], r['sender'], r['body_plain']) for email_id, r in inserted])
+            events = [(r['event'], r) for _, _, r in new if r['event'] and r['event']['uid']]
+            if events:
+                for e, r in events:
+                    start_ts = db_manager.to_ts(e['start_time'])
+                    c.execute(INSERT_EVENT_SQL, (e['uid'], e['summary'], e['start_time'], e['end_time'], start_ts, db_manager.to_ts(e['end_time']), e['location'], e['description'], r['sender'], r['recipient'], e['join_url'], e['provider']))
+                    if c.rowcount > 0: delta.add_event(e['uid'], start_ts); print(f"   ✅ 发现会议: {e['summary']}")
+            # 已经有的邮件 (别的文件夹里存过的不动，uid 只在同一个文件夹里有意义)
+            dups = [(r['uid'], r['message_id'], folder_label(f)) for _, f, r in pending if 'subject' not in r]
+            if dups: c.executemany("UPDATE OR IGNORE emails SET uid=? WHERE message_id=? AND folder=? AND uid IS NULL", dups)
+            # 每个文件夹里的位置都记下：emails 只有一行 (先写进来的文件夹)，另一个文件夹里的同一封也要留住它的 UID
+            c.executemany(LOCATE_EMAIL_SQL, [(acc, folder_label(f), r['uid'], r['message_id']) for acc, f, r in pending])
+            pending.clear()
+
+        for kind, args in items:
+            if kind == 'store':
+                acc, folder, uidvalidity, checkpoint, rec = args
+                pending.append((acc, folder, rec))
+                if checkpoint and acc not in self.failed: states[(acc, folder)] = (uidvalidity, rec['uid'])
+                continue
+            flush_messages()
+            if kind == 'reset':
+                c.execute("UPDATE emails SET uid=NULL WHERE account_email=? AND folder=?", args)
+                c.execute("DELETE FROM email_folders WHERE account_email=? AND folder=?", args)
+            elif kind == 'state' and args[0] not in self.failed:
+                states[(args[0], args[1])] = (args[2], args[3])
+            elif kind == 'backfill' and args[0] not in self.failed:
+                c.execute("UPDATE sync_state SET backfill_uid=? WHERE account_email=? AND folder=? AND uidvalidity=?", (args[3], args[0], args[1], args[2]))
+            elif kind == 'status' and args[0] not in self.failed:
+                statuses[(args[0], args[1])] = args[2:]
+        flush_messages()
+        for (acc, folder), (uidvalidity, last_uid) in states.items():
+            save_sync_state(c, acc, folder, uidvalidity, last_uid)
+        # STATUS 放在进度之后写：第一次同步的文件夹这时才有 sync_state 行；UIDVALIDITY 对不上就不记 (下次重新检查)
+        for (acc, folder), (uidvalidity, uidnext, messages) in statuses.items():
+            c.execute("UPDATE sync_state SET uidnext=?, messages=? WHERE account_email=? AND folder=? AND uidvalidity=?", (uidnext, messages, acc, folder, uidvalidity))
+        return added
+
+def build_record(uid, msg, msg_id, parts, payloads, files=None):
+    subj = decode_str(msg["Subject"])
+    body_t, body_h, atts, ics_data = build_content(parts, payloads, files)
+    plain, preview, text_len = mail_search.text_fields(body_t, body_h)
+    search_text = body_h if body_h else body_t 
+    if not ics_data:
+        ics_data = meeting_parser.parse_invite(subj, search_text, plain)
+    elif 'join_url' not in ics_data:
+        link = meeting_parser.event_link(ics_data['location'], ics_data['description'], search_text)
+        ics_data['join_url'], ics_data['provider'] = link if link else ("", "")
+    return {"uid": uid, "message_id": msg_id, "subject": subj, "sender": decode_str(msg["From"]),
+            "recipient": decode_str(msg["To"]), "cc": decode_str(msg["Cc"]), "date": parse_date(msg["Date"]),
+            "body_html": body_h, "body_text": body_t, "event": ics_data, "files": atts,
+            "body_plain": plain, "preview": preview, "text_len": text_len,
+            "attachments": ";".join(f"{a['name']}|{a.get('locator') or a['path']}|{format_size(a['size'])}" for a in atts)}
+
+def parse_record(uid, header, msg_id, parts, payloads, files=None):
+    """进程池里跑的 build_record：头部传原始字节 (Message 对象序列化更贵)，返回的记录交给写线程"""
+    return build_record(uid, BytesHeaderParser().parsebytes(header or b""), msg_id, parts, payloads, files)
+
+class ParseStage:
+    """所有账号共用的解析进程池，第一次遇到大批量同步时才创建；起不来 (打包环境等) 就退回同步线程里解析"""
+    def __init__(self, workers=PARSE_WORKERS):
+        self.workers = workers; self.lock = threading.Lock()
+        self.pool = None; self.broken = False
+
+    def executor(self, pending):
+        """pending = 这次总共要解析的封数；不值得起进程时返回 None (调用方在本线程解析)"""
+        if not self.workers or self.broken or (os.cpu_count() or 1) < 2 or pending < PARSE_POOL_MIN: return None
+        with self.lock:
+            if self.pool is None and not self.broken:
+                try: self.pool = ProcessPoolExecutor(max_workers=self.workers)
+                except Exception as e: print(f"   ⚠️ 解析进程池启动失败 ({e})，改为单线程解析"); self.broken = True
+            return self.pool
+
+    def close(self):
+        with self.lock: pool, self.pool = self.pool, None
+        if pool is not None: pool.shutdown()
+
+# === 多账号进度汇总：每个账号各自 0-100，总进度取平均 ===
+class SyncProgress:
+    def __init__(self, accounts, callback):
+        self.callback = callback; self.lock = threading.Lock()
+        self.names = [acc.get('name', acc['email']) for acc in accounts]
+        self.values = {n: 0 for n in self.names}
+
+    def report(self, name, value, msg):
+        if not self.callback: return
+        with self.lock:
+            self.values[name] = max(self.values[name], min(int(value), 100))
+            total = int(sum(self.values.values()) / max(len(self.values), 1))
+            others = " · ".join(f"{n} {v}%" for n, v in self.values.items() if n != name)
+            self.callback(min(total, 99), f"{msg}" + (f"  ({others})" if others else ""))
+
+@contextmanager
+def open_connection(acc, pool=None):
+    """有连接池就借长连接，否则临时连一次 (命令行 / 调试时)"""
+    if pool is not None:
+        with pool.lease(acc) as mail: yield mail
+        return
+    mail = imap_manager.connect(acc)
+    try: yield mail
+    finally:
+        try: mail.logout()
         except: pass
-    if info["start_time"]:
-        seed = f"{info['summary']}_{info['start_time']}"
-        info["uid"] = hashlib.md5(seed.encode()).hexdigest()
-        return info
-    return None
 
-def save_attachment(payload, filename):
+def sync_account(acc, writer, progress, pool=None, parser=None):
+    """同步单个账号 (在线程池里运行)：先用 STATUS 找出有变化的文件夹，再按优先级分给连接池里的几条连接并行同步
+    读操作用各线程自己的连接，写操作全部交给 writer"""
+    acc_name = acc.get('name', acc['email'])
+    report = lambda v, m: progress.report(acc_name, v, m)
+    c = db_manager.get_conn().cursor()
     try:
-        safe_name = f"{uuid.uuid4().hex[:8]}_{filename}"
-        file_path = os.path.join(ATTACHMENT_DIR, safe_name)
-        with open(file_path, "wb") as f: f.write(payload)
-        return os.path.abspath(file_path)
-    except: return ""
-
-def fetch_mail(init_mode=False, callback=None):
-    conn = sqlite3.connect('local_mail.db'); c = conn.cursor()
-    new_count = 0
-    
-    if callback: callback(0, "🚀 准备连接服务器...")
+        report(2, f"📡 连接: {acc_name}")
+        with open_connection(acc, pool) as mail:
+            todo = changed_folders(c, acc['email'], folder_status(acc, mail))
+        if not todo: report(100, f"✅ {acc_name}: 没有变化"); return
+        print(f"\n--- 账号 {acc_name}: {len(todo)} 个文件夹有变化: {', '.join(imap_parser.decode_mailbox(f) for f, _ in todo)} ---")
+        # 每个文件夹的进度 0-100，账号进度取平均
+        share = {f: 0 for f, _ in todo}
+        def folder_report(folder):
+            def rep(v, m): share[folder] = v; report(5 + sum(share.values()) * 0.95 / len(share), m)
+            return rep
+        workers = max(1, min(len(todo), imap_manager.pool_size(acc)))
+        with ThreadPoolExecutor(max_workers=workers) as folders:
+            for f in [folders.submit(_folder_task, acc, folder, st, writer, folder_report(folder), pool, parser) for folder, st in todo]: f.result()
+        report(100, f"✅ {acc_name}: 完成")
+    except Exception as e:
+        report(100, f"⚠️ {acc_name} 网络错误: {e}")
+        print(f"连接错误: {e}")
+    finally:
+        db_manager.close_thread()
+
+def _folder_task(acc, folder, st, writer, report, pool=None, parser=None):
+    """一个文件夹一条连接；没有失败才记下 STATUS (失败的下次还会再同步)"""
+    c = db_manager.get_conn().cursor()
+    try:
+        with open_connection(acc, pool) as mail:
+            if not _sync_folder(acc, mail, c, writer, report, parser, folder): writer.save_status(acc['email'], folder, st)
+    except Exception as e:
+        print(f"   ⚠️ {acc.get('name', acc['email'])}/{imap_parser.decode_mailbox(folder)} 同步出错: {e}")
+    finally:
+        report(100, ""); db_manager.close_thread()
+
+def _select(mail, folder):
+    status, data = mail.select(imap_parser.quote_mailbox(folder))
+    if status != 'OK': raise Exception(f"SELECT {folder} 失败: {data}")
 
-    # 遍历所有账号
-    total_accounts = len(config.ACCOUNTS)
+def _tally_failures(acc, folder, uidvalidity, uids, failed, counted):
+    """uids 里成功的清零，counted 里的失败次数 +1；返回 counted 里已经连续失败 FETCH_MAX_TRIES 次的 UID"""
+    key = lambda uid: (acc['email'], folder, uidvalidity, uid)
+    for uid in uids:
+        if uid not in failed: _fetch_failures.pop(key(uid), None)
+    for uid in counted: _fetch_failures[key(uid)] = _fetch_failures.get(key(uid), 0) + 1
+    return {uid for uid in counted if _fetch_failures[key(uid)] >= FETCH_MAX_TRIES}
+
+def _sync_folder(acc, mail, c, writer, report, parser=None, folder=SYNC_FOLDER):
+    """在已登录的连接上做一次文件夹增量同步，返回失败的 UID 集合 (空 = 全部成功)"""
+    acc_name = acc.get('name', acc['email'])
+    if folder.upper() != SYNC_FOLDER: acc_name += f"/{imap_parser.decode_mailbox(folder)}"
+    _select(mail, folder)
+    
+    # UIDVALIDITY 变化 => 旧 UID 全部作废，全量重同步
+    uidvalidity = get_uidvalidity(mail)
+    old_validity, last_uid = get_sync_state(c, acc['email'], folder)
+    if old_validity is not None and old_validity != uidvalidity:
+        print(f"   ⚠️ {acc_name}: UIDVALIDITY 变化 ({old_validity} -> {uidvalidity})，全量重同步")
+        writer.reset_uids(acc['email'], folder)
+        last_uid = 0
+    
+    mail_uids = search_new_uids(mail, last_uid)
+    total_mails = len(mail_uids)
     
-    for idx, acc in enumerate(config.ACCOUNTS):
+    print(f"--- {acc_name}: UID > {last_uid} 的新邮件 {total_mails} 封 ---")
+    if not mail_uids:
+        writer.save_state(acc['email'], folder, uidvalidity, last_uid)
+        return set()
+
+    # 上次卡住 last_uid 的邮件打头时，它所在的那一块逐封取 (整块读取出错时分不清是哪一封坏了)，后面的照常整块取
+    chunk = int(acc.get('fetch_chunk', FETCH_CHUNK)) or FETCH_CHUNK
+    single = mail_uids[:chunk] if (acc['email'], folder, uidvalidity, mail_uids[0]) in _fetch_failures else []
+    parts = [[uid] for uid in single] + ([mail_uids[len(single):]] if len(mail_uids) > len(single) else [])
+    failed = set()
+    for part in parts:
+        # 前面有失败时后面的照样入库 (界面能看到)，只是不再推进 last_uid
+        failed |= _fetch_uids(acc, mail, c, writer, report, uidvalidity, part, parser, checkpoint=not failed, folder=folder, backlog=len(mail_uids))
+    # 只给卡住 last_uid 的那封 (最小的失败 UID) 记次数；连续 FETCH_MAX_TRIES 次就跳过它，last_uid 越过去
+    stuck = min(failed) if failed else None
+    if not _tally_failures(acc, folder, uidvalidity, mail_uids, failed, [stuck] if failed else []): return failed
+    print(f"   ⚠️ {acc_name}: UID {stuck} 连续 {FETCH_MAX_TRIES} 次同步失败，跳过")
+    _fetch_failures.pop((acc['email'], folder, uidvalidity, stuck), None)
+    failed.discard(stuck)
+    writer.save_state(acc['email'], folder, uidvalidity, stuck if failed else mail_uids[-1])
+    return failed
+
+def _fetch_uids(acc, mail, c, writer, report, uidvalidity, mail_uids, parser=None, checkpoint=True, folder=SYNC_FOLDER, backlog=None):
+    """按块下载 / 解析 / 入库 mail_uids (升序)；checkpoint=False 时不推进 last_uid (历史回填)。返回失败的 UID 集合 (空 = 全部成功)
+    新邮件很多时解析交给 parser 的进程池：下一块的 FETCH 和上一块的解析同时进行，结果仍按 UID 顺序入库
+    backlog = 这一轮总共要解析的封数 (历史回填一块只有 BACKFILL_CHUNK 封，但后面还有一大堆)，决定值不值得起进程池"""
+    acc_name = acc.get('name', acc['email']); total_mails = len(mail_uids)
+    if folder.upper() != SYNC_FOLDER: acc_name += f"/{imap_parser.decode_mailbox(folder)}"
+    # 升序处理，保证 last_uid 只在连续成功时推进 (失败的邮件下次会重试)
+    failed = set(); done = 0
+    chunk = int(acc.get('fetch_chunk', FETCH_CHUNK)) or FETCH_CHUNK
+    lazy = acc.get('lazy_attachments', LAZY_ATTACHMENTS)
+    executor = parser.executor(backlog or total_mails) if parser else None
+    inflight = deque()   # 按 UID 顺序排队的 (uid, 记录 / Future / 异常)
+
+    def drain(keep):
+        # 从队头取结果交给写线程，直到队列里只剩 keep 封；队头没解析完就在这里等 (背压)
+        nonlocal done
+        while len(inflight) > keep:
+            uid, job = inflight.popleft()
+            done += 1
+            report(5 + done * 95 / total_mails, f"📥 {acc_name}: 邮件 {done}/{total_mails}")
+            try:
+                if isinstance(job, Exception): raise job
+                rec = job.result() if hasattr(job, 'result') else job
+                writer.store(acc['email'], folder, uidvalidity, checkpoint and not failed, rec)
+            except Exception as e:
+                print(f"   ❌ 出错: {e}")
+                failed.add(uid)
+
+    for start in range(0, total_mails, chunk):
+        chunk_uids = mail_uids[start:start + chunk]
+        report(5 + done * 95 / total_mails, f"📨 {acc_name}: 读取邮件头 {done+1}-{done+len(chunk_uids)}/{total_mails}")
+
+        # 阶段一：一条 FETCH 取回整块的头部，按 Message-ID 去重
+        plans = []; jobs = []; streams = []; files = {}; headers = {}
         try:
-            acc_name = acc.get('name', acc['email'])
-            base_progress = int((idx / total_accounts) * 100)
-            
-            if callback: callback(base_progress + 2, f"📡 连接 [{idx+1}/{total_accounts}]: {acc_name}")
-            
-            socket.setdefaulttimeout(15)
-            mail = imaplib.IMAP4_SSL(acc['imap_server'], acc['imap_port'])
-            mail.login(acc['email'], acc['password']); mail.select("INBOX")
-            
-            # 搜索 ALL (含已读)
-            status, messages = mail.search(None, 'ALL')
-            ids = messages[0].split()
-            
-            # 截取最后30封
-            mail_ids = ids[-FETCH_LIMIT:] if len(ids) > FETCH_LIMIT else ids
-            total_mails = len(mail_ids)
-            
-            print(f"\n--- 账号 {acc_name}: 扫描最新 {total_mails} 封邮件 ---")
-
-            for i, num in enumerate(reversed(mail_ids)):
-                step_progress = base_progress + int((i / total_mails) * (100 / total_accounts))
-                if callback: callback(step_progress, f"📥 {acc_name}: 邮件 {i+1}/{total_mails}")
+            for item in fetch_headers(mail, chunk_uids):
+                uid = item['UID']
+                headers[uid] = item.get('BODY[HEADER]') or b""
+                msg = BytesHeaderParser().parsebytes(headers[uid])
+                msg_id = (msg.get("Message-ID") or "").strip() or f"{acc['email']}:{uidvalidity}:{uid}"
+                c.execute("SELECT id FROM emails WHERE message_id=?", (msg_id,))
+                parts = None if c.fetchone() else wanted_parts(imap_parser.walk_bodystructure(item.get('BODYSTRUCTURE')))
+                plans.append((uid, msg, msg_id, parts))
+                if parts is not None:
+                    if lazy:
+                        for p in parts:
+                            if is_lazy(p): files.setdefault(uid, {})[p['section']] = lazy_entry(acc['email'], folder, uidvalidity, uid, p)
+                    inline = [p for p in parts if not (lazy and is_lazy(p)) and not is_streamed(p)]
+                    jobs.append((uid, inline, sum(p['size'] for p in inline)))
+                    big = [p for p in parts if not (lazy and is_lazy(p)) and is_streamed(p)]
+                    if big: streams.append((uid, big))
+            # 阶段二：相同结构的新邮件合并下载；大附件逐个分段下载
+            bodies = fetch_bodies(mail, jobs)
+            for uid, big in streams:
+                for p in big:
+                    report(5 + done * 95 / total_mails, f"📎 {acc_name}: 下载附件 {decode_str(p['filename'])} ({format_size(p['size'])})")
+                    files.setdefault(uid, {})[p['section']] = stream_attachment(mail, uid, p)
+        except Exception as e:
+            print(f"   ❌ 批量读取出错: {e}")
+            drain(0)   # 前面几块已解析好的照常入库 (推进 last_uid)，再把没读到的记成失败
+            failed.update(mail_uids[start:])
+            break
 
-                try:
-                    status, msg_data = mail.fetch(num, '(RFC822)')
-                    for response_part in msg_data:
-                        if isinstance(response_part, tuple):
-                            msg = email.message_from_bytes(response_part[1])
-                            msg_id = msg.get("Message-ID", "").strip() or str(num)
-                            subj = decode_str(msg["Subject"])
-                            
-                            c.execute("SELECT id FROM emails WHERE message_id=?", (msg_id,))
-                            if c.fetchone(): continue 
-
-                            sender = decode_str(msg["From"]); recip = decode_str(msg["To"]); cc = decode_str(msg["Cc"])
-                            date = parse_date(msg["Date"])
-                            body_t = ""; body_h = ""; atts = []; ics_data = None
-                            
-                            if msg.is_multipart():
-                                for part in msg.walk():
-                                    ctype = part.get_content_type(); fname = part.get_filename()
-                                    try: payload = part.get_payload(decode=True)
-                                    except: continue
-                                    if not payload: continue
-
-                                    if ctype == "text/calendar" or (fname and fname.lower().endswith(".ics")):
-                                        if HAS_ICAL: ics_data = extract_ics_data(payload)
-                                    
-                                    if ctype == "text/plain" and not fname: body_t += payload.decode(errors='ignore')
-                                    elif ctype == "text/html" and not fname: body_h += payload.decode(errors='ignore')
-                                    elif fname:
-                                        fn_str = decode_str(fname)
-                                        if not fn_str.lower().endswith('.ics'):
-                                            real_path = save_attachment(payload, fn_str)
-                                            if real_path: atts.append(f"{fn_str}|{real_path}|{format_size(len(payload))}")
-                            else:
-                                payload = msg.get_payload(decode=True)
-                                if payload:
-                                    t = payload.decode(errors='ignore')
-                                    if msg.get_content_type() == "text/html": body_h = t
-                                    else: body_t = t
-
-                            if not ics_data:
-                                search_text = body_h if body_h else body_t 
-                                ics_data = extract_meeting_from_text(subj, search_text)
-
-                            c.execute('''INSERT INTO emails (account_email, message_id, subject, sender, recipient, cc, date_received, body_html, body_text, attachments, folder) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'inbox')''', (acc['email'], msg_id, subj, sender, recip, cc, date, body_h, body_t, ";".join(atts)))
-                            new_count += 1
-                            
-                            if ics_data and ics_data['uid']:
-                                print(f"   ✅ 发现会议: {ics_data['summary']}")
-                                c.execute("SELECT id FROM events WHERE uid=?", (ics_data['uid'],))
-                                if not c.fetchone():
-                                    c.execute("INSERT INTO events (uid, summary, start_time, end_time, location, description, sender, recipient, minutes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, '')", (ics_data['uid'], ics_data['summary'], ics_data['start_time'], ics_data['end_time'], ics_data['location'], ics_data['description'], sender, recip))
-                            
-                            conn.commit()
-                except Exception as e:
-                    print(f"   ❌ 出错: {e}")
-                    continue
-            mail.logout()
-        except Exception as e: 
-            if callback: callback(100, f"⚠️ 网络错误: {e}")
-            print(f"连接错误: {e}")
-            
-    conn.close()
+        for uid, msg, msg_id, parts in plans:
+            if parts is None: job = {"uid": uid, "message_id": msg_id}
+            elif uid not in bodies: job = Exception(f"UID {uid} 正文缺失")
+            elif executor is not None:
+                job = executor.submit(parse_record, uid, headers[uid], msg_id, parts, bodies[uid], files.get(uid))
+            else:
+                try: job = build_record(uid, msg, msg_id, parts, bodies[uid], files.get(uid))
+                except Exception as e: job = e
+            inflight.append((uid, job))
+            drain(PARSE_INFLIGHT if executor is not None else 0)
+    drain(0)
+    return failed
+
+def fetch_mail(init_mode=False, callback=None, stats=None, pool=None, delta=None):
+    """同步所有账号，返回新增邮件总数；传入 stats(dict) 时按账号填入新增数，传入 pool 时复用长连接
+    传入 delta (SyncDelta) 时合并进本轮实际写入的邮件 / 会议"""
+    if callback: callback(0, "🚀 准备连接服务器...")
+    # 历史回填正在补某一块时等它做完 (最多一块)，之后回填让路
+    _sync_wanted.set()
+    with SYNC_LOCK:
+        _sync_wanted.clear()
+        accounts = list(config.ACCOUNTS)
+        writer = DbWriter(); writer.start()
+        progress = SyncProgress(accounts, callback)
+        parser = ParseStage()
+    
+        # 每个账号一个线程：慢服务器不再拖住其他账号
+        with ThreadPoolExecutor(max_workers=max(1, min(SYNC_WORKERS, len(accounts)))) as workers:
+            for f in [workers.submit(sync_account, acc, writer, progress, pool, parser) for acc in accounts]:
+                try: f.result()
+                except Exception as e: print(f"同步线程出错: {e}")
+        parser.close()
+        writer.close()
+
+    new_count = sum(writer.new_counts.values())
+    if stats is not None:
+        for acc in accounts: stats[acc.get('name', acc['email'])] = writer.new_counts.get(acc['email'], 0)
+    if delta is not None: delta.merge(writer.delta)
     if callback: callback(100, f"✅ 完成: 新增 {new_count} 封")
     return new_count
 
+# === 历史回填：FETCH_LIMIT 之前的旧邮件，新 -> 旧一块一块补，断点存在 sync_state.backfill_uid ===
+def backfill_folders(c, acc):
+    """还没补完的文件夹 (按同步优先级)；账号还没做过常规同步时返回 None"""
+    c.execute("SELECT folder, backfill_uid FROM sync_state WHERE account_email=?", (acc['email'],))
+    rows = c.fetchall()
+    if not rows: return None
+    pending = {f for f, floor in rows if floor is None or floor > 1}
+    cached = _folder_cache.get(acc['email'])
+    # 有 LIST 缓存时只补还在同步列表里的 (服务器上删掉的文件夹不再管)
+    order = cached[1] if cached else sorted(pending, key=lambda f: (f.upper() != SYNC_FOLDER, f))
+    return [f for f in order if f in pending]
+
+def backfill_folder(acc, mail, c, writer, folder=SYNC_FOLDER, chunk=BACKFILL_CHUNK, parser=None):
+    """给一个文件夹往更早补一块，返回还剩多少封更早的邮件 (0 = 补完)；常规同步还没建好同步状态时返回 None
+    传入 parser (ParseStage) 时按剩下的历史总量决定这一块要不要交给进程池"""
+    _select(mail, folder)
+    uidvalidity = get_uidvalidity(mail)
+    old_validity, floor = get_backfill_state(c, acc['email'], folder)
+    # UIDVALIDITY 刚变：等常规同步重置完再补
+    if old_validity is None or old_validity != uidvalidity: return None
+    if floor <= 1:
+        # 本地已经有 UID 1 / 文件夹是空的：也要记成补完，不然 backfill_uid 一直是 NULL，每一步都会再借连接 SELECT 一次
+        writer.save_backfill(acc['email'], folder, uidvalidity, 1)
+        return 0
+    status, data = mail.uid('search', None, f'UID 1:{floor - 1}')
+    if status != 'OK': return None
+    uids = sorted(int(u) for u in (data[0] or b"").split() if int(u) < floor) if data else []
+    batch = uids[-chunk:]
+    if not batch:
+        writer.save_backfill(acc['email'], folder, uidvalidity, 1)
+        return 0
+    print(f"📜 {acc.get('name', acc['email'])}/{imap_parser.decode_mailbox(folder)}: 历史回填 UID {batch[0]}-{batch[-1]} (更早的还有 {len(uids) - len(batch)} 封)")
+    fetch = lambda part, p=None: _fetch_uids(acc, mail, c, writer, lambda v, m: None, uidvalidity, part, p, checkpoint=False, folder=folder, backlog=len(uids))
+    # 这一块上次有失败：逐封重试，整块读取出错时只算在坏的那封头上
+    if any((acc['email'], folder, uidvalidity, uid) in _fetch_failures for uid in batch): failed = set().union(*(fetch([uid]) for uid in batch))
+    else: failed = fetch(batch, parser)
+    # 按 UID 数失败次数：还没到 FETCH_MAX_TRIES 的下一步重试这一块；都到了就跳过它们，断点照样往前推
+    if _tally_failures(acc, folder, uidvalidity, batch, failed, failed) != failed: return len(uids)
+    if failed:
+        print(f"   ⚠️ {acc.get('name', acc['email'])}/{imap_parser.decode_mailbox(folder)}: UID {imap_parser.uid_set(failed)} 连续 {FETCH_MAX_TRIES} 次回填失败，跳过")
+        for uid in failed: _fetch_failures.pop((acc['email'], folder, uidvalidity, uid), None)
+    writer.save_backfill(acc['email'], folder, uidvalidity, batch[0])
+    return len(uids) - len(batch)
+
+def backfill_step(pool=None, chunk=BACKFILL_CHUNK, delta=None, parser=None):
+    """历史回填的一步：每个账号的每个没补完的文件夹补一块。常规同步正在跑 / 在等时返回 None (让路，稍后再来)
+    否则返回还剩多少封没补 (0 = 都补完了)；有账号还没做过常规同步时也返回 None"""
+    if _sync_wanted.is_set() or not SYNC_LOCK.acquire(blocking=False): return None
+    try:
+        writer = DbWriter(); writer.start()
+        remaining = 0; c = db_manager.get_conn().cursor(); jobs = []
+        try:
+            for acc in config.ACCOUNTS:
+                folders = backfill_folders(c, acc)
+                if folders is None: remaining = None
+                else: jobs += [(acc, folder) for folder in folders]
+            for acc, folder in jobs:
+                if _sync_wanted.is_set(): remaining = None; break
+                try:
+                    with open_connection(acc, pool) as mail: left = backfill_folder(acc, mail, c, writer, folder, chunk, parser)
+                except Exception as e:
+                    print(f"   ⚠️ {acc.get('name', acc['email'])}/{imap_parser.decode_mailbox(folder)} 历史回填出错: {e}"); left = None
+                if left is None: remaining = None
+                elif remaining is not None: remaining += left
+        finally:
+            writer.close()
+        if delta is not None: delta.merge(writer.delta)
+        return remaining
+    finally:
+        SYNC_LOCK.release()
+
+class Backfiller(threading.Thread):
+    """后台历史回填：每 pause 秒补一步，补完后每 BACKFILL_RECHECK 秒再检查一次；重启后从 backfill_uid 接着补
+    on_step(delta, remaining) 在本线程里回调 (界面用信号转回 GUI 线程)，remaining 为 None 表示这一步让路了 / 未知
+    自己持有一个 ParseStage，历史多时跨步复用进程池，补完 / 退出时关掉"""
+    def __init__(self, pool=None, on_step=None, chunk=BACKFILL_CHUNK, pause=BACKFILL_PAUSE):
+        super().__init__(daemon=True)
+        self.pool = pool; self.on_step = on_step; self.chunk = chunk; self.pause = pause
+        self.stopped = threading.Event(); self.parser = ParseStage()
+
+    def stop(self): self.stopped.set()
+
+    def run(self):
+        # 先歇一轮再开始，让启动时的常规同步先跑
+        while not self.stopped.wait(self.pause):
+            delta = SyncDelta()
+            try: remaining = backfill_step(self.pool, self.chunk, delta, self.parser)
+            except Exception as e: print(f"历史回填出错: {e}"); remaining = None
+            if self.on_step and not self.stopped.is_set(): self.on_step(delta, remaining)
+            if remaining == 0: self.parser.close(); self.stopped.wait(BACKFILL_RECHECK)
+        self.parser.close()
+        db_manager.close_thread()
+
 if __name__ == "__main__": fetch_mail(init_mode=True)
\ No newline at end of file
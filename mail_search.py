@@ -0,0 +1,152 @@
+# mail_search.py
+# V30.5 - Perf: 补纯文本 / 补索引按 id 游标分批 (id > 上一批末尾 ORDER BY id)，不再每批从表头重扫已补好的行
+import re
+import html
+import db_manager
+
+FTS_TABLE = "emails_fts"
+# 列权重 (bm25)：标题 > 发件人 > 正文
+WEIGHTS = (10.0, 5.0, 1.0)
+SCOPES = ("subject", "sender", "body")
+BACKFILL_BATCH = 500
+SNIPPET_TOKENS = 32
+# 高频词 (几万封都命中) 时 bm25 只在最近的这么多个命中里排序，保证常见词也能几十毫秒返回
+RANK_WINDOW = 5000
+PREVIEW_CHARS = 100
+
+_DROP_BLOCKS = re.compile(r'<(script|style|head)\b.*?</\1\s*>', re.I | re.S)
+_BREAKS = re.compile(r'<(br|/p|/div|/tr|/li|/h\d)\b[^>]*>', re.I)
+_TAGS = re.compile(r'<[^>]+>')
+_SPACES = re.compile(r'[ \t\r\f\v ]+')
+_BLANK_LINES = re.compile(r'\n\s*\n+')
+_ALL_SPACES = re.compile(r'\s+')
+
+def html_to_text(s):
+    """HTML 正文 -> 纯文本 (去掉样式/脚本/标签，保留换行)"""
+    if not s: return ""
+    s = _DROP_BLOCKS.sub(" ", s)
+    s = _BREAKS.sub("\n", s)
+    s = html.unescape(_TAGS.sub(" ", s))
+    s = _SPACES.sub(" ", s)
+    return _BLANK_LINES.sub("\n", s).strip()
+
+def search_body(body_text, body_html):
+    """规范化的纯文本正文：有 text/plain 用它，只有 HTML 的邮件转成纯文本"""
+    if body_text and body_text.strip():
+        return _BLANK_LINES.sub("\n", _SPACES.sub(" ", body_text.replace("\r\n", "\n"))).strip()
+    return html_to_text(body_html)
+
+def text_fields(body_text, body_html):
+    """入库时算一次 -> (body_plain, preview, text_len)；preview 是压成一行的前 PREVIEW_CHARS 个字"""
+    plain = search_body(body_text, body_html)
+    preview = _ALL_SPACES.sub(" ", plain[:PREVIEW_CHARS * 4]).strip()[:PREVIEW_CHARS]
+    return plain, preview, len(plain)
+
+# === 建表 (db_manager.init_db 调用) ===
+def create_schema(c):
+    """trigram 需要 SQLite 3.34+；不支持时返回 False，搜索退回 LIKE"""
+    try:
+        c.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(subject, sender, body, tokenize='trigram')")
+    except Exception as e:
+        print(f"全文索引不可用 (需要 SQLite 3.34+ FTS5): {e}")
+        return False
+    # 邮件被删除 / 标题发件人被改时同步索引；新邮件由写线程 (mail_fetcher.DbWriter) 写入
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS emails_fts_ad AFTER DELETE ON emails BEGIN DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS emails_fts_au AFTER UPDATE OF subject, sender ON emails BEGIN
+                  UPDATE {FTS_TABLE} SET subject = new.subject, sender = new.sender WHERE rowid = new.id; END""")
+    return True
+
+def has_index(c=None):
+    c = c or db_manager.get_conn()
+    return c.execute("SELECT 1 FROM sqlite_master WHERE name=?", (FTS_TABLE,)).fetchone() is not None
+
+def index_rows(c, rows):
+    """rows: [(email_id, subject, sender, 纯文本正文)]，在调用方的事务里执行"""
+    if rows: c.executemany(f"INSERT OR REPLACE INTO {FTS_TABLE} (rowid, subject, sender, body) VALUES (?, ?, ?, ?)", rows)
+
+def backfill_text(conn, batch=BACKFILL_BATCH):
+    """V29.4 之前入库的邮件补算 body_plain / preview / text_len；返回补了多少封"""
+    total = 0; last = 0
+    # 按 id 游标往后翻：每批从上一批的末尾接着找，不会每批都从表头重扫一遍已补好的行
+    while True:
+        rows = conn.execute("SELECT id, body_text, body_html FROM emails WHERE id > ? AND text_len IS NULL ORDER BY id LIMIT ?", (last, batch)).fetchall()
+        if not rows: break
+        with conn: conn.executemany("UPDATE emails SET body_plain=?, preview=?, text_len=? WHERE id=?", [(*text_fields(bt, bh), i) for i, bt, bh in rows])
+        total += len(rows); last = rows[-1][0]
+    return total
+
+def backfill(batch=BACKFILL_BATCH):
+    """后台线程跑：先补纯文本/预览列，再给还没进索引的旧邮件补索引 (分批提交，不阻塞写线程太久)；返回补索引的封数"""
+    conn = db_manager.connect(); total = 0
+    try:
+        n = backfill_text(conn, batch)
+        if n: print(f"📝 纯文本/预览补齐 {n} 封")
+        if not has_index(conn): return 0
+        last = 0   # 同上按 id 游标翻页；是否已在索引里按 rowid 逐行查 (NOT IN 子查询每批都要把整个索引的 rowid 读一遍)
+        while True:
+            rows = conn.execute(f"""SELECT id, subject, sender, body_plain FROM emails e WHERE id > ?
+                                    AND NOT EXISTS (SELECT 1 FROM {FTS_TABLE} WHERE rowid = e.id) ORDER BY id LIMIT ?""", (last, batch)).fetchall()
+            if not rows: break
+            with conn: index_rows(conn, [(i, subj or "", sender or "", plain or "") for i, subj, sender, plain in rows])
+            total += len(rows); last = rows[-1][0]
+    finally:
+        conn.close()
+    if total: print(f"🔎 全文索引补齐 {total} 封")
+    return total
+
+# === 查询 ===
+def _terms(text):
+    return [t for t in (text or "").split() if t]
+
+def _quote(term): return '"' + term.replace('"', '""') + '"'
+
+def _like(term): return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def search(text, scopes=SCOPES, limit=50, mark=("<b>", "</b>")):
+    """按空格分词，所有词都要命中 (AND)。scopes 是 SCOPES 的子集 (对应 标题/发件人/正文 三个勾选框)
+    3 个字以上的词走 FTS5 MATCH (bm25 排序)，更短的词 trigram 建不了索引，在候选上再用 LIKE 过滤
+    返回 [(email_id, subject, sender, date_received, 摘要), ...]"""
+    terms = _terms(text); scopes = [s for s in SCOPES if s in scopes]
+    if not terms or not scopes: return []
+    if not has_index(): return _search_like(terms, scopes, limit)
+    long_terms = [t for t in terms if len(t) >= 3]; short_terms = [t for t in terms if len(t) < 3]
+    where = []; params = []
+    if long_terms:
+        where.append(f"{FTS_TABLE} MATCH ?")
+        params.append("{" + " ".join(scopes) + "}: (" + " AND ".join(_quote(t) for t in long_terms) + ")")
+    for t in short_terms:
+        where.append("(" + " OR ".join(f"f.{s} LIKE ? ESCAPE '\\'" for s in scopes) + ")")
+        params.extend([_like(t)] * len(scopes))
+    if long_terms:
+        # 分三步，每步都让 FTS5 用上 rowid 范围 (写成一条嵌套 SQL 时外层会把全部命中再扫一遍，常见词要几百毫秒)
+        # 1) 最近 RANK_WINDOW 个命中的最小 rowid (FTS5 按 rowid 倒序遍历，很快)
+        # 2) 只在这个窗口里按 bm25 取前 limit 个 rowid
+        # 3) 只给这几封算 snippet
+        rank = f"bm25({FTS_TABLE}, {', '.join(str(w) for w in WEIGHTS)})"
+        floor = db_manager.query_one(f"SELECT MIN(rowid) FROM (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ? ORDER BY rowid DESC LIMIT {RANK_WINDOW})", (params[0],))[0]
+        if floor is None: return []
+        ids = [r[0] for r in db_manager.query(f"SELECT f.rowid FROM {FTS_TABLE} f WHERE {' AND '.join(where)} AND f.rowid >= ? ORDER BY {rank} LIMIT ?", (*params, floor, limit))]
+        if not ids: return []
+        rows = db_manager.query(f"""SELECT f.rowid, e.subject, e.sender, e.date_received, snippet({FTS_TABLE}, {SCOPES.index('body')}, ?, ?, '…', {SNIPPET_TOKENS})
+                                    FROM {FTS_TABLE} f JOIN emails e ON e.id = f.rowid
+                                    WHERE {FTS_TABLE} MATCH ? AND f.rowid BETWEEN ? AND ? AND f.rowid IN ({','.join('?' * len(ids))})""",
+                                (mark[0], mark[1], params[0], min(ids), max(ids), *ids))
+        order = {i: n for n, i in enumerate(ids)}
+        return sorted(rows, key=lambda r: order[r[0]])
+    # 只有短词：没有 MATCH 可用，按 rowid 倒序 (新邮件在前) 扫描，够 limit 条就停；摘要截取第一个词附近的正文
+    sql = f"""SELECT f.rowid, e.subject, e.sender, e.date_received, substr(f.body, max(instr(f.body, ?) - 20, 1), 80)
+              FROM {FTS_TABLE} f JOIN emails e ON e.id = f.rowid
+              WHERE {' AND '.join(where)} ORDER BY f.rowid DESC LIMIT ?"""
+    return db_manager.query(sql, (short_terms[0], *params, limit))
+
+def _search_like(terms, scopes, limit):
+    # 没有 FTS5 时的兜底：逐行扫描
+    cols = {"subject": ["subject"], "sender": ["sender"], "body": ["body_plain"]}
+    where = []; params = []
+    for t in terms:
+        names = [n for s in scopes for n in cols[s]]
+        where.append("(" + " OR ".join(f"{n} LIKE ? ESCAPE '\\'" for n in names) + ")")
+        params.extend([_like(t)] * len(names))
+    sql = f"""SELECT id, subject, sender, date_received, COALESCE(preview, '') FROM emails
+              WHERE {' AND '.join(where)} ORDER BY date_received DESC LIMIT ?"""
+    return db_manager.query(sql, (*params, limit))
@@ -1,98 +1,99 @@
 # main.py
-# V27.4 - UI: 彻底移除 QSplitter，强制右侧固定 380px，无拖拽
+# V30.3 - New: 后台历史回填 (mail_fetcher.Backfiller)，补出来的旧会议按增量画上日历；同步按钮不再写死 "最新30封"
 import sys
 sys.stdout.reconfigure(encoding='utf-8')
-import sqlite3
 import os
-import subprocess
-import re
-from datetime import datetime, timedelta
+import threading
+import multiprocessing
 
 os.environ["QTWEBENGINE_CHROMIUM_FLAGS"] = "--disable-gpu --disable-software-rasterizer"
 
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QHBoxLayout, 
                              QVBoxLayout, QLabel, QPushButton, QFrame, 
                              QScrollArea, QSizePolicy, QMessageBox) # 移除了 QSplitter
-from PyQt6.QtCore import Qt, QTimer, QDate, QThread, pyqtSignal
+from PyQt6.QtCore import Qt, QTimer, QDate, QThread, QObject, pyqtSignal
 
 import config 
+import db_manager
 import mail_fetcher 
+import imap_manager
+import attachment_cache
+import mail_search
+import reminder_manager
 from ui_styles import STYLESHEET
 from ui_widgets import ToastOverlay, ProgressPill 
-from ui_calendar import MeetingCalendarWidget, EventCard
+from ui_calendar import MeetingCalendarWidget, EventCardPool
+from ui_mail import MailWindow
 
 def migrate_db():
-    try:
-        conn = sqlite3.connect('local_mail.db'); c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, 
-            uid TEXT UNIQUE, 
-            summary TEXT, 
-            start_time TEXT, 
-            end_time TEXT, 
-            location TEXT, 
-            description TEXT, 
-            sender TEXT, 
-            recipient TEXT, 
-            minutes TEXT, 
-            ai_summary TEXT
-        )''')
-        try: c.execute("ALTER TABLE events ADD COLUMN ai_summary TEXT"); 
-        except: pass
-        c.execute('''CREATE TABLE IF NOT EXISTS emails (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, 
-            account_email TEXT,
-            message_id TEXT, 
-            subject TEXT, 
-            sender TEXT, 
-            recipient TEXT, 
-            cc TEXT, 
-            date_received TEXT, 
-            body_html TEXT, 
-            body_text TEXT, 
-            attachments TEXT, 
-            folder TEXT
-        )''') 
-        conn.commit(); conn.close()
+    # 建表/升级统一放在 db_manager.init_db
+    try: db_manager.init_db()
     except Exception as e: print(f"DB Init Error: {e}")
 
 class SyncWorker(QThread):
     progress_signal = pyqtSignal(int, str)
     finished_signal = pyqtSignal(int)
+    delta_signal = pyqtSignal(object)   # mail_fetcher.SyncDelta，在 finished_signal 之前发出
+    def __init__(self, pool=None): super().__init__(); self.pool = pool
     def run(self):
+        # 各账号在线程池里并行同步，callback 会从多个线程进来，emit 是线程安全的
         def callback(progress, msg): self.progress_signal.emit(progress, msg)
+        delta = mail_fetcher.SyncDelta()
         try:
-            count = mail_fetcher.fetch_mail(init_mode=True, callback=callback)
+            stats = {}
+            count = mail_fetcher.fetch_mail(init_mode=True, callback=callback, stats=stats, pool=self.pool, delta=delta)
+            if len(stats) > 1: self.progress_signal.emit(100, " · ".join(f"{n} +{k}" for n, k in stats.items()))
+            self.delta_signal.emit(delta)
             self.finished_signal.emit(count)
         except Exception as e:
             print(f"Critical Sync Error: {e}")
             self.progress_signal.emit(100, f"同步失败: {str(e)}")
+            self.delta_signal.emit(delta)
             self.finished_signal.emit(0)
 
-class NotificationThread(QThread):
-    def __init__(self): super().__init__(); self.notified_events = set()
-    def run(self):
-        while True: self.check_meetings(); self.sleep(60)
-    def check_meetings(self):
-        try:
-            conn = sqlite3.connect('local_mail.db'); c = conn.cursor()
-            now = datetime.now(); today_str = now.strftime("%Y-%m-%d")
-            c.execute("SELECT uid, summary, start_time FROM events WHERE start_time LIKE ?", (f"{today_str}%",))
-            rows = c.fetchall(); conn.close()
-            for uid, title, start_str in rows:
-                if uid in self.notified_events: continue
-                try:
-                    meeting_time = datetime.strptime(start_str[:16], "%Y-%m-%d %H:%M")
-                    diff = (meeting_time - now).total_seconds() / 60
-                    if 0 < diff <= 10:
-                        self.send_mac_notification(title, f"会议将在 {int(diff)} 分钟后开始"); self.notified_events.add(uid)
-                except: pass
-        except: pass
-    def send_mac_notification(self, title, message):
-        try: subprocess.run(["osascript", "-e", f'display notification "{message}" with title "{title}" subtitle "MyCalendar 提醒" sound name "Glass"'])
-        except: pass
+class SyncScheduler(QObject):
+    """手动同步 / 定时器 / IDLE 推送共用的调度器：同一时间只跑一个 SyncWorker，
+    运行中再来的请求合并成一次后续同步，结果通过信号回到 GUI 线程"""
+    progress_signal = pyqtSignal(int, str, bool)   # 进度, 文本, 本次是否为手动同步
+    finished_signal = pyqtSignal(int, bool)        # 新增数, 本次是否为手动同步
+    delta_signal = pyqtSignal(object)              # 本次同步的 SyncDelta (空的也发，订阅方自己判断)
+    def __init__(self, pool=None, parent=None):
+        super().__init__(parent); self.pool = pool
+        self.worker = None; self.manual = False; self.pending = False; self.pending_manual = False
+
+    def is_running(self): return self.worker is not None
+
+    def request(self, manual=False):
+        if self.worker is not None:
+            self.pending = True; self.pending_manual = self.pending_manual or manual
+            if manual: self.progress_signal.emit(0, "⏳ 等待当前后台同步完成...", True)
+            return False
+        self._start(manual); return True
+
+    def _start(self, manual):
+        self.manual = manual
+        self.worker = SyncWorker(self.pool)
+        self.worker.progress_signal.connect(lambda v, m: self.progress_signal.emit(v, m, self.manual))
+        self.worker.delta_signal.connect(self.delta_signal.emit)
+        self.worker.finished_signal.connect(self._on_finished)
+        self.worker.finished.connect(self.worker.deleteLater)
+        self.worker.start()
+
+    def _on_finished(self, count):
+        manual = self.manual; self.worker = None
+        self.finished_signal.emit(count, manual)
+        if self.pending:
+            next_manual = self.pending_manual; self.pending = False; self.pending_manual = False
+            QTimer.singleShot(0, lambda: self._start(next_manual))
+
+    def wait(self, msecs=3000):
+        if self.worker is not None: self.worker.wait(msecs)
 
 class CalendarApp(QMainWindow):
+    # IDLE 监听线程发现新邮件 => 通过信号回到 GUI 线程触发增量同步
+    new_mail_signal = pyqtSignal(str)
+    # 历史回填每一步 (后台线程) => GUI 线程：(SyncDelta, 剩余封数或 None)
+    backfill_signal = pyqtSignal(object, object)
     def __init__(self):
         super().__init__()
         if not mail_fetcher.HAS_ICAL:
@@ -108,16 +109,38 @@ class CalendarApp(QMainWindow):
         self.setup_header()
         self.setup_content_area()
         self.progress_pill = ProgressPill(self)
+        self.month_cache = db_manager.MonthCache()
         self.load_calendar_data()
+        # 每账号一个长连接 + IDLE 推送；5 分钟定时器保留作兜底 (复用长连接，不再重复登录)
+        self.imap_pool = imap_manager.ImapPool()
+        attachment_cache.pool = self.imap_pool
+        # 旧邮件补全文索引 (只在第一次升级后有活干)
+        threading.Thread(target=mail_search.backfill, daemon=True).start()
+        self.sync_scheduler = SyncScheduler(self.imap_pool, self)
+        self.sync_scheduler.progress_signal.connect(self.on_sync_progress)
+        self.sync_scheduler.finished_signal.connect(self.on_sync_finished)
+        self.sync_scheduler.delta_signal.connect(self.on_sync_delta)
+        self.new_mail_signal.connect(lambda _: self.run_background_sync())
+        self.idle_watchers = [imap_manager.IdleWatcher(self.imap_pool, acc, lambda a: self.new_mail_signal.emit(a['email'])) for acc in config.ACCOUNTS]
+        for w in self.idle_watchers: w.start()
         self.timer = QTimer(); self.timer.timeout.connect(self.run_background_sync); self.timer.start(300000) 
-        self.notify_thread = NotificationThread(); self.notify_thread.start()
+        # 常规同步只管最新的邮件，更早的历史邮件由回填线程慢慢补 (常规同步优先，重启后接着补)
+        self.backfill_signal.connect(self.on_backfill_step)
+        self.backfiller = mail_fetcher.Backfiller(self.imap_pool, lambda d, n: self.backfill_signal.emit(d, n))
+        if mail_fetcher.BACKFILL_HISTORY: self.backfiller.start()
+        self.reminders = reminder_manager.ReminderScheduler(); self.reminders.start()
 
     def setup_header(self):
         header = QFrame(); header.setObjectName("UnifiedHeader"); header.setFixedHeight(64)
         h = QHBoxLayout(header); h.setContentsMargins(24,0,24,0); h.setSpacing(16)
         h.addWidget(QLabel("📅", styleSheet="font-size:20px")); h.addWidget(QLabel("我的会议日程", objectName="HeaderTitle"))
         h.addStretch()
-        self.btn_sync = QPushButton("🔄 同步 (最新30封)", objectName="SyncBtn", cursor=Qt.CursorShape.PointingHandCursor)
+        self.mail_window = None   # 第一次点 ✉️ 才建
+        btn_mail = QPushButton("✉️ 邮件", objectName="MailBtn", cursor=Qt.CursorShape.PointingHandCursor)
+        btn_mail.clicked.connect(self.open_mail_window)
+        h.addWidget(btn_mail)
+        self.btn_sync = QPushButton("🔄 同步", objectName="SyncBtn", cursor=Qt.CursorShape.PointingHandCursor)
+        self.btn_sync.setToolTip("同步新邮件；更早的历史邮件在后台慢慢补全")
         self.btn_sync.clicked.connect(self.manual_sync)
         h.addWidget(self.btn_sync)
         self.main_layout.addWidget(header)
@@ -139,6 +162,7 @@ class CalendarApp(QMainWindow):
         nav.addWidget(bp); nav.addStretch(); nav.addWidget(self.bym); nav.addStretch(); nav.addWidget(bn)
         self.calendar = MeetingCalendarWidget()
         self.calendar.currentPageChanged.connect(lambda y,m: self.bym.setText(f"{y}年 {m}月"))
+        self.calendar.currentPageChanged.connect(lambda y,m: self.load_month_window())
         self.calendar.selectionChanged.connect(self.show_events_for_date)
         cl.addLayout(nav); cl.addWidget(self.calendar)
         
@@ -156,6 +180,8 @@ class CalendarApp(QMainWindow):
         self.scroll_layout.setAlignment(Qt.AlignmentFlag.AlignTop); self.scroll_layout.setContentsMargins(20, 20, 20, 20)
         self.scroll_layout.setSpacing(16) 
         self.scroll_area.setWidget(self.scroll_contents)
+        self.card_pool = EventCardPool(self.scroll_contents)
+        self.empty_label = QLabel("☕️ 无会议安排", alignment=Qt.AlignmentFlag.AlignCenter, styleSheet="color:#999; font-size:16px; margin-top:50px;")
         self.event_label = QLabel("今日日程", styleSheet="font-size:18px; font-weight:bold; margin-left:20px; margin-top:20px; margin-bottom:10px;")
         rl.addWidget(self.event_label)
         rl.addWidget(self.scroll_area)
@@ -164,55 +190,88 @@ class CalendarApp(QMainWindow):
         
         self.main_layout.addWidget(content_container, 1)
 
+    def load_month_window(self):
+        # 只取当前显示的月份 ± 1 个月，缓存命中时不查库
+        try:
+            window = self.month_cache.window(self.calendar.yearShown(), self.calendar.monthShown())
+            self.calendar.set_meeting_data({QDate(d.year, d.month, d.day): titles for d, titles in window.items()})
+        except: pass
+
     def load_calendar_data(self):
-        conn = sqlite3.connect('local_mail.db'); c = conn.cursor()
         try:
-            c.execute("SELECT start_time, summary FROM events"); rows = c.fetchall(); conn.close(); data = {}
-            for row in rows:
-                s = row[0].split(" ")[0].replace("/", "-")
-                try: d = QDate.fromString(s, "yyyy-MM-dd"); data.setdefault(d, []).append(row[1])
-                except: pass
-            self.calendar.set_meeting_data(data)
+            self.load_month_window()
             if self.calendar.selectedDate() == QDate.currentDate(): self.calendar.setSelectedDate(QDate.currentDate())
             self.show_events_for_date()
         except: pass
 
     def show_events_for_date(self):
         d = self.calendar.selectedDate(); self.event_label.setText(f"{d.toString('M月d日 dddd')} 的安排")
+        # 卡片只从布局里拿下来藏起来，由 card_pool 按 uid 复用；不再 deleteLater 再重建
         while self.scroll_layout.count(): 
             item = self.scroll_layout.takeAt(0)
-            if item.widget(): item.widget().deleteLater()
-        conn = sqlite3.connect('local_mail.db'); c = conn.cursor()
-        k1 = d.toString("yyyy-MM-dd"); k2 = d.toString("yyyy/MM/dd")
-        try:
-            c.execute("""SELECT uid, start_time, end_time, summary, location, description, minutes, sender, recipient, ai_summary 
-                        FROM events WHERE start_time LIKE ? OR start_time LIKE ? ORDER BY start_time""", (f"{k1}%", f"{k2}%"))
-            rows = c.fetchall()
+            if item.widget(): item.widget().hide()
+        try: rows = db_manager.events_on(d.toString("yyyy-MM-dd"))
         except: rows = []
-        conn.close()
-        if not rows: self.scroll_layout.addWidget(QLabel("☕️ 无会议安排", alignment=Qt.AlignmentFlag.AlignCenter, styleSheet="color:#999; font-size:16px; margin-top:50px;"))
+        if not rows: self.scroll_layout.addWidget(self.empty_label); self.empty_label.show()
         else:
-            for row in rows: self.scroll_layout.addWidget(EventCard(*row))
+            for card in self.card_pool.cards_for(rows): self.scroll_layout.addWidget(card); card.show()
+
+    def open_mail_window(self):
+        if self.mail_window is None: self.mail_window = MailWindow(self)
+        self.mail_window.show(); self.mail_window.raise_(); self.mail_window.activateWindow()
 
     def run_background_sync(self):
-        if mail_fetcher.fetch_mail(init_mode=False) > 0: self.show_toast("📅 发现新会议")
-        self.load_calendar_data()
+        # 定时器 / IDLE 推送：不阻塞 GUI，正在同步时自动合并
+        self.sync_scheduler.request(manual=False)
     
     def manual_sync(self):
         self.btn_sync.setEnabled(False) 
         self.progress_pill.show_progress() 
-        self.sync_worker = SyncWorker()
-        self.sync_worker.progress_signal.connect(self.progress_pill.update_status)
-        self.sync_worker.finished_signal.connect(self.on_sync_finished)
-        self.sync_worker.start()
-
-    def on_sync_finished(self, new_count):
-        self.progress_pill.finish(success=True, msg=f"成功更新 {new_count} 个项目" if new_count > 0 else "已经是最新")
-        self.btn_sync.setEnabled(True)
-        self.load_calendar_data()
+        self.sync_scheduler.request(manual=True)
+
+    def on_sync_progress(self, value, msg, manual):
+        if manual: self.progress_pill.update_status(value, msg)
+
+    def on_sync_finished(self, new_count, manual):
+        if manual:
+            self.progress_pill.finish(success=True, msg=f"成功更新 {new_count} 个项目" if new_count > 0 else "已经是最新")
+            self.btn_sync.setEnabled(True)
+        elif new_count > 0: self.show_toast("📅 发现新会议")
+        # 界面刷新交给 on_sync_delta，按增量只动受影响的日期
+
+    def on_sync_delta(self, delta, prefetch=True):
+        """只刷新这次同步真正动到的东西：空 delta 什么都不做"""
+        if delta.is_empty(): return
+        if prefetch and delta.email_ids(): attachment_cache.prefetch_async()
+        if self.mail_window is not None and delta.email_ids(): self.mail_window.apply_delta(delta.email_ids())
+        if not delta.events: return
+        self.month_cache.invalidate(delta.event_ts); self.reminders.rearm(delta.event_ts)
+        # 新会议落在当前显示的月份窗口 (± 1 个月) 里才重画日历
+        y, m = self.calendar.yearShown(), self.calendar.monthShown()
+        shown = {divmod(y * 12 + m - 1 + i, 12) for i in (-1, 0, 1)}
+        if any((d.year, d.month - 1) in shown for d in delta.event_days()): self.load_month_window()
+        # 日程栏只在选中的那天有新会议时才刷新 (card_pool 复用已有卡片)
+        if self.calendar.selectedDate().toPyDate() in delta.events: self.show_events_for_date()
+
+    def on_backfill_step(self, delta, remaining):
+        # 旧邮件不预取附件，只把补出来的会议画上日历
+        self.on_sync_delta(delta, prefetch=False)
+        if remaining == 0: self.btn_sync.setToolTip("同步新邮件；历史邮件已全部同步")
+        elif remaining is not None: self.btn_sync.setToolTip(f"同步新邮件；历史邮件后台补全中，还剩约 {remaining} 封")
 
     def show_toast(self, text): self.current_toast = ToastOverlay(self, text)
 
+    def closeEvent(self, event):
+        for w in self.idle_watchers: w.stop()
+        self.backfiller.stop()
+        self.reminders.stop()
+        self.sync_scheduler.wait()
+        self.imap_pool.close_all()
+        self.card_pool.flush_all()
+        db_manager.stop_minutes()
+        db_manager.close_thread()   # 其他线程的连接由各自线程退出时关
+        super().closeEvent(event)
+
     def resizeEvent(self, event):
         if self.progress_pill.isVisible():
             r = self.rect()
@@ -220,6 +279,7 @@ class CalendarApp(QMainWindow):
         super().resizeEvent(event)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()   # 打包成 .app / .exe 后，解析进程池的子进程从这里分流出去
     migrate_db()
     QApplication.setAttribute(Qt.ApplicationAttribute.AA_ShareOpenGLContexts)
     app = QApplication(sys.argv)
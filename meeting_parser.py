@@ -0,0 +1,108 @@
+# meeting_parser.py
+# V30.1 - New: 会议链接 / 会议时间识别合并到一处：预编译的合并正则只扫一遍，入库时算好存进 events (join_url / provider)
+import re
+import html
+import hashlib
+from datetime import datetime, timedelta
+from urllib.parse import unquote
+
+# === 入会链接 ===
+# 链接只取可见 ASCII (去掉 " ' < >)：中文标点 / 正文紧跟在链接后面时不会被吞进去
+# (不能写成 [^...\x80-\uffff]：re.I 下 i 会和 İ/ı 互相匹配，被当成非 ASCII 截断)
+_URL = r'[!#-&(-;=?-~]+'
+# 公共前缀 https?:// 提出来且不带 re.I (只对域名部分忽略大小写)：sre 能按字面前缀快速跳过正文，比整条 re.I 快好几倍
+LINK_RE = re.compile(
+    r'https?://(?i:'
+    r'(?P<teams_launcher>teams\.microsoft(?:online)?\.(?:com|cn)/dl/launcher/launcher\.html\?' + _URL + ')'
+    r'|(?P<teams>teams\.(?:microsoft(?:online)?\.(?:com|cn)|live\.com)/' + _URL + ')'
+    r'|(?P<tencent>(?:meeting\.tencent\.com|voovmeeting\.com)/' + _URL + ')'
+    r'|(?P<zoom>(?:[\w-]+\.)?zoom\.(?:us|com\.cn)/' + _URL + ')'
+    # Outlook 安全链接把真正的地址编码在 url= 参数里
+    r'|(?P<safelink>[\w.-]+\.safelinks\.protection\.outlook\.com/\?url=(?P<safe_url>[^&\s"\'<>]+)))')
+# 一封邮件里有多个会议链接时：Teams 启动器链接 > Teams > 腾讯会议 > Zoom；同级取最先出现的
+_RANK = {"teams_launcher": 0, "teams": 1, "tencent": 2, "zoom": 3}
+_PROVIDER = {"teams_launcher": "teams", "teams": "teams", "tencent": "tencent", "zoom": "zoom"}
+_TRAILING = '.,;:!?)]}'
+
+def find_link(text):
+    """-> (url, provider) 或 None；provider 是 'teams' / 'tencent' / 'zoom'"""
+    if not text: return None
+    best = None
+    for m in LINK_RE.finditer(text):
+        kind = m.lastgroup
+        if kind == "safe_url": kind = "safelink"
+        if kind == "safelink":
+            inner = LINK_RE.match(unquote(m.group("safe_url")))
+            if inner is None or inner.lastgroup not in _RANK: continue
+            kind, url = inner.lastgroup, inner.group(0)
+        else: url = m.group(0)
+        if best is None or _RANK[kind] < best[0]:
+            best = (_RANK[kind], html.unescape(url).rstrip(_TRAILING), _PROVIDER[kind])
+            if best[0] == 0: break
+    return (best[1], best[2]) if best else None
+
+def event_link(location, description, body=None):
+    """日历事件的入会链接：地点 > 描述 > 邮件正文 (Outlook 邀请常常只把链接放在正文里)"""
+    return find_link(location) or find_link(description) or find_link(body)
+
+# === 会议时间 ===
+_DATE = r'\d{4}\s*[-/年.]\s*\d{1,2}\s*[-/月.]\s*\d{1,2}\s*日?'
+_EN_DATE = r'(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?\s+\d{1,2},?\s+\d{4}'
+_HALF = r'[AaPp]\.?[Mm]\.?|上午|下午|晚上'
+def _clock(name):
+    return rf'(?:(?P<{name}_pre>上午|下午|晚上)\s*)?(?P<{name}>\d{{1,2}}:\d{{2}})(?:\s*(?P<{name}_half>{_HALF}))?'
+# 强标签 (会议时间 / Meeting Time) 优先；弱标签 (时间 / Time) 排除 "发送时间" "Sent: " 这类邮件头
+# 标签不带 re.I 且写在最前 (排除用的 lookbehind 放在标签后面)：每个分支都以字面字符开头，sre 能跳着找，只有后半段忽略大小写
+TIME_RE = re.compile(
+    r'(?:(?P<strong>会议时间|[Mm]eeting\s+[Tt]ime|MEETING\s+TIME)|(?:时间|[Tt]ime|TIME)(?<!发送时间)(?<!Sent\sTime)(?<!Date:\sTime))(?i:\s*[：:]\s*'
+    rf'(?P<date>{_DATE}|{_EN_DATE})[^\n]*?{_clock("start")}'
+    rf'(?:\s*(?:-|–|—|~|～|至|到)\s*(?:(?:{_DATE}|{_EN_DATE})[^\n]*?)?{_clock("end")})?)')
+_MONTHS = {m: i for i, m in enumerate(("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), 1)}
+_NUMS = re.compile(r'\d+')
+_TAGS = re.compile(r'<[^>]+>')
+DEFAULT_DURATION = timedelta(hours=1)
+
+def _day(text):
+    nums = [int(n) for n in _NUMS.findall(text)]
+    if text[:1].isdigit(): return nums[0], nums[1], nums[2]
+    return nums[1], _MONTHS[text[:3].lower()], nums[0]
+
+def _hm(m, name):
+    h, mn = map(int, m.group(name).split(":"))
+    half = (m.group(name + "_half") or m.group(name + "_pre") or "").lower().replace(".", "")
+    if half in ("pm", "下午", "晚上") and h < 12: h += 12
+    elif half in ("am", "上午") and h == 12: h = 0
+    return h, mn
+
+def find_time(clean_text):
+    """纯文本里的会议时间 -> (开始, 结束) datetime，或 None；没写结束时间按 1 小时算"""
+    if not clean_text: return None
+    weak = None
+    for m in TIME_RE.finditer(clean_text):
+        if m.group("strong"): weak = m; break
+        if weak is None: weak = m
+    if weak is None: return None
+    m = weak
+    try:
+        y, mo, d = _day(m.group("date"))
+        start = datetime(y, mo, d, *_hm(m, "start"))
+        end = start + DEFAULT_DURATION
+        if m.group("end"):
+            end = datetime(y, mo, d, *_hm(m, "end"))
+            if m.group("start_half") and not (m.group("end_half") or m.group("end_pre")) and end < start: end += timedelta(hours=12)   # 2:00 PM - 3:00
+            if end <= start: end += timedelta(days=1)   # 跨零点
+        return start, end
+    except (ValueError, KeyError, IndexError): return None
+
+def parse_invite(subject, raw_text, clean_text=None):
+    """没有 ICS 附件的会议通知 (腾讯会议 / Teams / Zoom 邀请正文) -> 事件 dict，认不出时间返回 None
+    raw_text 用来找链接 (链接常在 href 里)；clean_text 是已经算好的纯文本，不传才现场去标签"""
+    if clean_text is None: clean_text = _TAGS.sub(' ', raw_text or "")
+    when = find_time(clean_text)
+    if when is None: return None
+    link = find_link(raw_text)
+    start_str = when[0].strftime("%Y-%m-%d %H:%M")
+    return {"uid": hashlib.md5(f"{subject}_{start_str}".encode()).hexdigest(), "summary": subject,
+            "start_time": start_str, "end_time": when[1].strftime("%Y-%m-%d %H:%M"),
+            "location": link[0] if link else "", "description": clean_text[:200].strip(),
+            "join_url": link[0] if link else "", "provider": link[1] if link else ""}
@@ -0,0 +1,84 @@
+# migrate_attachments.py
+# V29.0 - 把旧的 attachments/<uuid8>_<文件名> 迁移进内容寻址仓库 (attachments/store/)
+# 用法: python migrate_attachments.py           只统计，不改动
+#       python migrate_attachments.py --apply   迁移 + 删除重复文件
+#       python migrate_attachments.py --gc      清理没有被引用的 blob
+import os
+import sys
+import db_manager
+import attachment_store
+from mail_fetcher import ATTACHMENT_DIR, format_size
+
+def parse_atts(text):
+    # emails.attachments: "文件名|路径|大小;文件名|路径|大小"
+    out = []
+    for a in (text or "").split(";"):
+        p = a.split("|")
+        if len(p) >= 3: out.append(p)
+    return out
+
+def migrate(apply=False):
+    db_manager.init_db()
+    conn = db_manager.connect(); c = conn.cursor()
+    store_root = os.path.abspath(attachment_store.STORE_DIR)
+    hashed = {}                 # 旧路径 -> (sha, size)
+    moved = {}                  # 旧路径 -> 仓库路径
+    unique = {}                 # sha -> size
+    total_files = 0; total_bytes = 0; missing = 0; emails_done = 0
+
+    c.execute("SELECT id, attachments FROM emails WHERE attachments IS NOT NULL AND attachments != ''")
+    for email_id, text in c.fetchall():
+        files = []; parts = []
+        for name, path, size_str in parse_atts(text):
+            old = os.path.abspath(path)
+            if old.startswith(store_root + os.sep):
+                parts.append(f"{name}|{path}|{size_str}"); continue   # 已经迁移过
+            if old not in hashed:
+                if not os.path.exists(old):
+                    missing += 1; parts.append(f"{name}|{path}|{size_str}"); continue
+                size = os.path.getsize(old)
+                hashed[old] = (attachment_store.sha256_file(old), size)
+                total_files += 1; total_bytes += size
+            sha, size = hashed[old]
+            unique[sha] = size
+            new = old
+            if apply:
+                # 先硬链接进仓库，数据库提交后再删旧文件：中途中断也不会丢附件
+                if old not in moved: moved[old] = attachment_store.put_file(old, name, sha, move=False)[1]
+                new = moved[old]
+            files.append({"name": name, "path": new, "size": size, "sha256": sha})
+            parts.append(f"{name}|{new}|{size_str}")
+        if apply and files:
+            with conn:
+                c.execute("UPDATE emails SET attachments=? WHERE id=?", (";".join(parts), email_id))
+                c.execute("SELECT COUNT(*) FROM attachments WHERE email_id=?", (email_id,))
+                if not c.fetchone()[0]: attachment_store.add_refs(c, email_id, files)
+            emails_done += 1
+
+    if apply:
+        for old in moved:
+            try: os.remove(old)
+            except OSError: pass
+
+    # attachments/ 根目录下没有被任何邮件引用的旧文件：只报告，不动
+    referenced = set(hashed)
+    orphans = [n for n in os.listdir(ATTACHMENT_DIR) if os.path.isfile(os.path.join(ATTACHMENT_DIR, n)) and os.path.abspath(os.path.join(ATTACHMENT_DIR, n)) not in referenced]
+    conn.close()
+
+    saved = total_bytes - sum(unique.values())
+    print(f"📎 被引用的旧附件: {total_files} 个, {format_size(total_bytes)}")
+    print(f"🧬 去重后: {len(unique)} 份内容, {format_size(sum(unique.values()))} (节省 {format_size(saved)})")
+    if missing: print(f"⚠️ 数据库里引用但磁盘上不存在: {missing} 个")
+    if orphans: print(f"ℹ️ 没有被任何邮件引用的旧文件: {len(orphans)} 个 (未改动)")
+    if apply: print(f"✅ 已迁移 {emails_done} 封邮件的附件")
+    else: print("ℹ️ 只做了统计；加 --apply 执行迁移")
+
+def run_gc():
+    conn = db_manager.connect()
+    removed, freed = attachment_store.gc(conn)
+    conn.close()
+    print(f"🧹 删除未引用的 blob: {removed} 个, 释放 {format_size(freed)}")
+
+if __name__ == "__main__":
+    if "--gc" in sys.argv: run_gc()
+    else: migrate(apply="--apply" in sys.argv)
@@ -0,0 +1,88 @@
+# reminder_manager.py
+# V30.0 - New: 会议提醒改成事件驱动：未来的提醒放进小顶堆，线程一直睡到下一个提醒时间 (同步发现新会议时重新装填)
+import sys
+import time
+import heapq
+import shutil
+import subprocess
+import threading
+import db_manager
+
+REMIND_BEFORE = 10 * 60     # 会前多久提醒
+HORIZON = 24 * 3600         # 每次只装填未来这么久的会议，到点再装下一段
+MAX_SLEEP = 30 * 60         # 最长睡这么久就醒来对一次表 (电脑休眠 / 改系统时间后不会漏提醒)
+
+# === 通知方式：notify(title, message)，可替换 ===
+class MacNotifier:
+    def notify(self, title, message):
+        esc = lambda t: str(t).replace('\\', '\\\\').replace('"', '\\"')
+        try: subprocess.run(["osascript", "-e", f'display notification "{esc(message)}" with title "{esc(title)}" subtitle "MyCalendar 提醒" sound name "Glass"'])
+        except: pass
+
+class LinuxNotifier:
+    def notify(self, title, message):
+        try: subprocess.run(["notify-send", "-a", "MyCalendar", str(title), str(message)])
+        except: pass
+
+class LogNotifier:
+    """没有桌面通知的环境 (服务器 / 测试)：打印出来并记在 sent 里"""
+    def __init__(self): self.sent = []
+    def notify(self, title, message):
+        self.sent.append((title, message)); print(f"🔔 {title}: {message}")
+
+def default_notifier():
+    if sys.platform == "darwin" and shutil.which("osascript"): return MacNotifier()
+    if sys.platform.startswith("linux") and shutil.which("notify-send"): return LinuxNotifier()
+    return LogNotifier()
+
+class ReminderScheduler(threading.Thread):
+    """heap: [(提醒时间, 开始时间, uid, 标题)]；没有到期的提醒就一直睡，不查库
+    rearm() 从数据库重新装填 (启动时 / 同步发现新会议时)；同一场会 (uid + 开始时间) 只提醒一次"""
+    def __init__(self, notifier=None, remind_before=REMIND_BEFORE, horizon=HORIZON, clock=time.time):
+        super().__init__(daemon=True)
+        self.notifier = notifier or default_notifier(); self.remind_before = remind_before; self.horizon = horizon; self.clock = clock
+        self.heap = []; self.loaded_until = 0; self.fired = {}   # uid -> 已提醒的开始时间 (会开完就删掉，不会越积越多)
+        self.cond = threading.Condition(); self.dirty = True; self.stopped = False
+
+    # --- GUI 线程调用 ---
+    def rearm(self, timestamps=None):
+        """timestamps: 新会议的开始时间 (SyncDelta.event_ts)；都不在装填范围内就不用重载"""
+        with self.cond:
+            if timestamps is not None and not any(ts is not None and ts < self.loaded_until + self.remind_before for ts in timestamps): return
+            self.dirty = True; self.cond.notify_all()
+
+    def stop(self):
+        with self.cond: self.stopped = True; self.cond.notify_all()
+
+    # --- 线程内 ---
+    def _reload(self, now):
+        rows = db_manager.events_starting_between(now, now + self.horizon + self.remind_before)
+        self.heap = [(start - self.remind_before, start, uid, title) for uid, title, start in rows if self.fired.get(uid) != start]
+        heapq.heapify(self.heap)
+        self.loaded_until = now + self.horizon
+        self.fired = {uid: start for uid, start in self.fired.items() if start > now}
+
+    def _due(self, now):
+        out = []
+        while self.heap and self.heap[0][0] <= now:
+            _, start, uid, title = heapq.heappop(self.heap)
+            if start <= now or self.fired.get(uid) == start: continue   # 已经开始 / 已提醒过
+            self.fired[uid] = start; out.append((title, start))
+        return out
+
+    def run(self):
+        try:
+            while True:
+                with self.cond:
+                    if self.stopped: return
+                    now = self.clock()
+                    if self.dirty or now >= self.loaded_until: self._reload(now); self.dirty = False
+                    due = self._due(now)
+                    if not due:
+                        wake = min(self.heap[0][0] if self.heap else self.loaded_until, self.loaded_until)
+                        self.cond.wait(max(0.0, min(wake - now, MAX_SLEEP)))
+                        continue
+                for title, start in due:
+                    self.notifier.notify(title, f"会议将在 {max(1, int((start - self.clock()) // 60))} 分钟后开始")
+        finally:
+            db_manager.close_thread()
@@ -1,16 +1,21 @@
 # ui_calendar.py
-# V27.3 - UI: 替换爱心图标为摄像机 + 保留颜色区分
-import sqlite3
-import re
+# V30.1 - Perf: 入会链接用入库时存好的 join_url / provider，卡片不再跑正则
 import os
 import html
+from collections import OrderedDict
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QFrame, 
                              QPushButton, QCalendarWidget, QTextEdit, QMessageBox, 
                              QFileDialog, QSizePolicy, QGraphicsDropShadowEffect, QApplication, QCheckBox)
-from PyQt6.QtCore import Qt, pyqtSignal, QDate, QRect, QSize, QPoint, QUrl, QPropertyAnimation, QThread
-from PyQt6.QtGui import QColor, QPainter, QPen, QBrush, QFont, QFontMetrics, QDesktopServices, QIcon
+from PyQt6.QtCore import Qt, pyqtSignal, QDate, QRect, QSize, QPoint, QUrl, QPropertyAnimation, QThread, QEvent
+from PyQt6.QtGui import QColor, QPainter, QPen, QBrush, QFont, QDesktopServices, QIcon
 
 import ai_manager 
+import db_manager
+import meeting_parser
+from ui_widgets import CellTextCache, CellHoverTracker, DebouncedSaver
+
+MINUTES_IDLE_MS = 800     # 停止输入多久后保存纪要
+MINUTES_MAX_MS = 5000     # 一直在输入时最多隔多久保存一次 (崩溃最多丢这么久的输入)
 
 class AIWorker(QThread):
     finished_signal = pyqtSignal(str)
@@ -25,31 +30,40 @@ class AIWorker(QThread):
 class MeetingCalendarWidget(QCalendarWidget):
     COLOR_BG_SELECTED = QColor("#EBF5FF"); COLOR_BORDER_SELECTED = QColor("#007AFF")
     COLOR_TODAY_CIRCLE = QColor("#FF3B30"); COLOR_EVENT_BAR = QColor("#E3F2FD"); COLOR_EVENT_TEXT = QColor("#1D1D1F")
+    COLOR_HOVER = QColor("#F5F7FA"); COLOR_DAY = QColor("#333"); COLOR_DAY_OTHER = QColor("#CCC")
     def __init__(self, parent=None):
         super().__init__(parent); self.setNavigationBarVisible(False)
         self.setVerticalHeaderFormat(QCalendarWidget.VerticalHeaderFormat.NoVerticalHeader)
-        self.setHorizontalHeaderFormat(QCalendarWidget.HorizontalHeaderFormat.ShortDayNames); self.meeting_data = {} 
-    def set_meeting_data(self, data): self.meeting_data = data; self.update()
+        self.setHorizontalHeaderFormat(QCalendarWidget.HorizontalHeaderFormat.ShortDayNames); self.meeting_data = {}; self.data_version = 0
+        bar_font = QFont(self.font()); bar_font.setPixelSize(10)
+        self.bar_text = CellTextCache(bar_font)
+        self.hover = CellHoverTracker(self)
+    def set_meeting_data(self, data): self.meeting_data = data; self.data_version += 1; self.update()
     def paintCell(self, painter, rect, date):
-        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.save(); painter.setRenderHint(QPainter.RenderHint.Antialiasing)
         if date == self.selectedDate():
             painter.setPen(QPen(self.COLOR_BORDER_SELECTED, 1)); painter.setBrush(QBrush(self.COLOR_BG_SELECTED)); painter.drawRoundedRect(rect.adjusted(1,1,-1,-1), 4, 4)
+        elif self.hover.is_hovered(rect):
+            painter.setPen(Qt.PenStyle.NoPen); painter.setBrush(QBrush(self.COLOR_HOVER)); painter.drawRoundedRect(rect.adjusted(1,1,-1,-1), 4, 4)
         if date == QDate.currentDate():
             painter.setPen(Qt.PenStyle.NoPen); painter.setBrush(QBrush(self.COLOR_TODAY_CIRCLE)); painter.drawEllipse(QRect(rect.left()+4, rect.top()+4, 20, 20))
             painter.setPen(Qt.GlobalColor.white); painter.drawText(QRect(rect.left()+4, rect.top()+4, 20, 20), Qt.AlignmentFlag.AlignCenter, str(date.day()))
         else:
-            painter.setPen(QColor("#333") if date.month() == self.monthShown() else QColor("#CCC")); painter.drawText(rect.adjusted(8,6,-4,-4), Qt.AlignmentFlag.AlignLeft|Qt.AlignmentFlag.AlignTop, str(date.day()))
-        if date in self.meeting_data and self.meeting_data[date]:
-            y = rect.top()+26; count=0
-            for t in self.meeting_data[date]:
-                if y+14 > rect.bottom()-2 or count>=3: break
+            painter.setPen(self.COLOR_DAY if date.month() == self.monthShown() else self.COLOR_DAY_OTHER); painter.drawText(rect.adjusted(8,6,-4,-4), Qt.AlignmentFlag.AlignLeft|Qt.AlignmentFlag.AlignTop, str(date.day()))
+        titles = self.meeting_data.get(date)
+        if titles:
+            # 截断后的标题按 (日期, 格宽, 数据版本) 缓存，悬停/重绘时不再逐条 elidedText
+            bars = self.bar_text.elided(date, rect.width()-10, self.data_version, titles)
+            painter.setFont(self.bar_text.font); y = rect.top()+26
+            for t in bars:
+                if y+14 > rect.bottom()-2: break
                 bar = QRect(rect.left()+2, y, rect.width()-4, 14); painter.setPen(Qt.PenStyle.NoPen); painter.setBrush(QBrush(self.COLOR_EVENT_BAR)); painter.drawRoundedRect(bar, 2, 2)
-                painter.setPen(self.COLOR_EVENT_TEXT); font=painter.font(); font.setPixelSize(10); painter.setFont(font)
-                painter.drawText(bar.adjusted(4,0,-2,0), Qt.AlignmentFlag.AlignLeft|Qt.AlignmentFlag.AlignVCenter, QFontMetrics(font).elidedText(t, Qt.TextElideMode.ElideRight, bar.width()-6))
-                y+=16; count+=1
+                painter.setPen(self.COLOR_EVENT_TEXT); painter.drawText(bar.adjusted(4,0,-2,0), Qt.AlignmentFlag.AlignLeft|Qt.AlignmentFlag.AlignVCenter, t)
+                y+=16
+        painter.restore()
 
 class EventCard(QFrame):
-    def __init__(self, uid, start, end, summary, location, desc, minutes, sender, recipient, ai_summary, parent=None):
+    def __init__(self, uid, start, end, summary, location, desc, minutes, sender, recipient, ai_summary, join_url=None, provider=None, parent=None):
         super().__init__(parent)
         self.uid = uid; self.summary = summary; self.desc = desc; self.ai_summary_text = ai_summary
         self.sender_val = sender; self.recipient_val = recipient; self.start_val = start
@@ -93,7 +107,8 @@ class EventCard(QFrame):
         layout.addWidget(m_lbl)
 
         # 🔥🔥🔥 【入会按钮】 图标已换成 🎥 摄像机
-        join_info = self.extract_meeting_link(location, desc)
+        # join_url 入库时已经算好 ('' = 没有链接)；None 只会出现在还没升级的库上
+        join_info = (join_url, provider) if join_url else (meeting_parser.event_link(location, desc) if join_url is None else None)
         if join_info:
             url, meeting_type = join_info
             
@@ -146,9 +161,12 @@ class EventCard(QFrame):
         self.ed = QTextEdit(); self.ed.setObjectName("MinutesEditor"); self.ed.setMinimumHeight(100)
         self.ed.setPlaceholderText("记录讨论要点...\n[ ] 待办事项")
         self.ed.setStyleSheet("QTextEdit { background: transparent; border: none; padding: 0; color: #333; font-size: 14px; line-height: 1.5; }")
-        self.ed.textChanged.connect(self.auto_save)
+        # 每次按键只重启计时器；toHtml + 写库在停顿后才做一次，写库在后台线程
+        self.saver = DebouncedSaver(self.save_minutes, MINUTES_IDLE_MS, MINUTES_MAX_MS, self)
         if minutes and len(minutes) > 5: self.ed.setHtml(minutes)
         else: self.reset_default_text(save=False)
+        self.ed.textChanged.connect(self.on_text_changed)
+        self.ed.installEventFilter(self)
         layout.addWidget(self.ed)
 
         # 5. AI
@@ -194,29 +212,6 @@ class EventCard(QFrame):
         self.btn_copy_all.clicked.connect(self.copy_full_minutes)
         layout.addWidget(self.btn_copy_all)
 
-    def extract_meeting_link(self, loc, desc):
-        if loc:
-            res = self.find_url(loc)
-            if res: return res
-        if desc:
-            res = self.find_url(desc)
-            if res: return res
-        return None
-
-    def find_url(self, text):
-        patterns = [
-            (r'(https?://teams\.microsoft\.com/[^\s<>"]+)', 'teams'),
-            (r'(https?://teams\.live\.com/[^\s<>"]+)', 'teams'),
-            (r'(https?://teams\.microsoftonline\.cn/[^\s<>"]+)', 'teams'),
-            (r'(https?://meeting\.tencent\.com/[^\s<>"]+)', 'tencent'),
-            (r'(https?://voovmeeting\.com/[^\s<>"]+)', 'tencent'),
-            (r'(https?://[a-zA-Z0-9-]+\.zoom\.us/[^\s<>"]+)', 'zoom')
-        ]
-        for pat, m_type in patterns:
-            match = re.search(pat, text)
-            if match: return (match.group(1), m_type)
-        return None
-
     def start_ai_generate(self):
         notes = self.ed.toPlainText()
         if len(notes) < 5:
@@ -269,15 +264,67 @@ class EventCard(QFrame):
         self.btn_copy_all.setStyleSheet("background-color: #34C759; color: white; font-size: 13px; font-weight: bold; border-radius: 8px; padding: 10px; border: none; margin-top: 8px;")
         QThread.msleep(1000) 
         
+    def on_text_changed(self):
+        if not self.saver.dirty: self.status_lbl.setText("编辑中...")
+        self.saver.touch()
+
+    def eventFilter(self, obj, e):
+        if obj is self.ed and e.type() == QEvent.Type.FocusOut: self.saver.flush()
+        return super().eventFilter(obj, e)
+
+    def save_minutes(self):
+        try:
+            db_manager.save_minutes_async(self.uid, self.ed.toHtml())
+            self.status_lbl.setText("已保存")
+        except: self.status_lbl.setText("保存失败")
+
+    def flush_minutes(self):
+        """卡片被移除 / 程序退出前调用：没保存的改动立即交给写线程"""
+        self.saver.flush()
+
     def auto_save(self):
-        self.status_lbl.setText("保存中...")
-        self.update_db()
-        self.status_lbl.setText("已同步")
+        self.saver.touch(); self.saver.flush()
 
     def update_db(self, ai_result=None):
-        try:
-            conn = sqlite3.connect('local_mail.db'); c = conn.cursor()
-            if ai_result is not None: c.execute("UPDATE events SET minutes = ?, ai_summary = ? WHERE uid = ?", (self.ed.toHtml(), ai_result, self.uid))
-            else: c.execute("UPDATE events SET minutes = ? WHERE uid = ?", (self.ed.toHtml(), self.uid))
-            conn.commit(); conn.close()
-        except: pass
\ No newline at end of file
+        self.saver.flush()
+        try: db_manager.save_minutes_async(self.uid, self.ed.toHtml(), ai_result)
+        except: pass
+
+class EventCardPool:
+    """日程栏的卡片池：按会议 uid 复用 EventCard (LRU，最多 CAPACITY 张)
+    数据没变的直接复用 (不再重建阴影 / 解析纪要 HTML / 正则找入会链接)，变了的才重建"""
+    CAPACITY = 60
+    def __init__(self, parent):
+        self.parent = parent; self.cards = OrderedDict()   # uid -> (比较用的数据, card)
+
+    @staticmethod
+    def _key(row):
+        # 纪要 (6) / AI 总结 (9) 以卡片上正在编辑的为准，不参与比较
+        return tuple(row[:6]) + tuple(row[7:9]) + tuple(row[10:])
+
+    def cards_for(self, rows):
+        """rows 是 db_manager.events_on 的结果；返回按顺序对应的卡片 (还没加进布局)"""
+        out = []
+        for row in rows:
+            uid = row[0]; key = self._key(row); hit = self.cards.get(uid)
+            if hit is not None and hit[0] == key:
+                card = hit[1]; self.cards.move_to_end(uid)
+            else:
+                if hit is not None:
+                    # 会议信息被同步更新了：重建卡片，但保留正在编辑的纪要
+                    row = (*row[:6], hit[1].ed.toHtml(), *row[7:]); self._drop(hit[1])
+                card = EventCard(*row, parent=self.parent); self.cards[uid] = (key, card)
+            out.append(card)
+        self._trim({r[0] for r in rows})
+        return out
+
+    def _drop(self, card):
+        card.flush_minutes(); card.hide(); card.deleteLater()
+
+    def _trim(self, keep):
+        for uid in list(self.cards):
+            if len(self.cards) <= self.CAPACITY: break
+            if uid not in keep: self._drop(self.cards.pop(uid)[1])
+
+    def flush_all(self):
+        for _, card in self.cards.values(): card.flush_minutes()
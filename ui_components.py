@@ -2,8 +2,6 @@
 import os
 import shutil
 import smtplib
-import re # 🔥 核心回归：用于正则提取会议链接
-import sqlite3
 from datetime import datetime
 from email.utils import formataddr, parsedate_to_datetime
 from email.mime.text import MIMEText
@@ -11,16 +9,21 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
 
 from PyQt6.QtWidgets import (QWidget, QHBoxLayout, QVBoxLayout, QLabel, 
-                             QPushButton, QFrame, QGridLayout, QSizePolicy, 
+                             QPushButton, QFrame, QGridLayout, 
                              QCalendarWidget, QAbstractItemView, QDialog, 
                              QComboBox, QLineEdit, QTextEdit, QToolBar, QMessageBox, 
                              QFileDialog, QGraphicsDropShadowEffect, QGraphicsOpacityEffect, 
                              QToolButton, QCheckBox, QMenu)
 
-from PyQt6.QtCore import Qt, QSize, QRect, QUrl, QDate, QPropertyAnimation, QEasingCurve, QPoint, pyqtSignal
-from PyQt6.QtGui import QColor, QPainter, QFont, QFontMetrics, QAction, QTextCharFormat, QDesktopServices
+from PyQt6.QtCore import Qt, QSize, QRect, QUrl, QDate, QPropertyAnimation, QEasingCurve, QPoint, pyqtSignal, QThread, QEvent, QTimer
+from PyQt6.QtGui import QColor, QPainter, QFont, QAction, QTextCharFormat, QDesktopServices
 
 import config
+import db_manager
+import attachment_store
+import attachment_cache
+import meeting_parser
+from ui_widgets import CellTextCache, CellHoverTracker, DebouncedSaver
 
 STYLESHEET = """
 QMainWindow { background-color: #F5F7FA; }
@@ -121,11 +124,11 @@ QLabel#DetailSenderEmail { font-size: 13px; color: #666; margin-left: 5px; }
 
 /* === 组件 === */
 QFrame#AttachmentChip { background-color: #F5F7FA; border: 1px solid #E5E5E5; border-radius: 6px; min-height: 28px; }
-QFrame#AttachmentChip:hover { background-color: #EBF5FF; border: 1px solid #007AFF; cursor: pointer; }
+QFrame#AttachmentChip:hover { background-color: #EBF5FF; border: 1px solid #007AFF; }
 QLabel#AttName { font-size: 12px; color: #333; font-weight: 500; background: transparent; }
 QLabel#AttSize { font-size: 11px; color: #888; margin-left: 5px; background: transparent; }
 QFrame#PersonChipFrame { background-color: #E5E5EA; border-radius: 10px; padding: 0px; margin: 0px; }
-QFrame#PersonChipFrame:hover { background-color: #D1D1D6; cursor: pointer; }
+QFrame#PersonChipFrame:hover { background-color: #D1D1D6; }
 QLabel#ChipName { color: #111; font-size: 12px; font-weight: 500; padding: 2px 8px; background: transparent; }
 QFrame#PersonCard { background-color: white; border: 1px solid #E5E5E5; border-radius: 12px; }
 QLabel#CardName { font-size: 16px; font-weight: bold; color: #333; }
@@ -199,12 +202,40 @@ class PersonPopup(QWidget):
     def emit_action(self, t): self.action_signal.emit(t, self.email); self.close()
     def paintEvent(self, e): pass
 
+class AttachmentFetchWorker(QThread):
+    """懒加载附件：在后台线程里从 IMAP 下载，完成后回到 GUI 线程"""
+    done = pyqtSignal(str, str)   # (本地路径, 错误信息)
+    def __init__(self, locator): super().__init__(); self.locator = locator
+    def run(self):
+        try: self.done.emit(attachment_cache.fetch(self.locator), "")
+        except Exception as e: self.done.emit("", str(e))
+        finally: db_manager.close_thread()
+
+# locator -> 正在下载的线程：线程归这里持有，不归芯片。阅读器切到别的邮件时芯片会被删掉，
+# 线程要是跟着被回收会 "QThread: Destroyed while thread is still running" 直接崩；现在照样下完，下次打开走缓存
+_fetches = {}
+
+def fetch_async(locator):
+    """同一个附件同时只下载一次 (两封邮件引用同一个附件 / 连点两下)，返回下载线程，订阅它的 done"""
+    worker = _fetches.get(locator)
+    if worker is None:
+        worker = _fetches[locator] = AttachmentFetchWorker(locator)
+        worker.finished.connect(lambda: QTimer.singleShot(0, lambda: _fetches.pop(locator, None)))
+        worker.start()
+    return worker
+
 class AttachmentChip(QFrame):
     def __init__(self, filename, filepath, size_bytes, parent=None):
-        super().__init__(parent); self.setObjectName("AttachmentChip"); self.filepath = os.path.abspath(filepath); self.filename = filename
-        self.setCursor(Qt.CursorShape.PointingHandCursor); self.setToolTip(f"{filename}\n双击打开 | 右键另存为")
+        super().__init__(parent); self.setObjectName("AttachmentChip"); self.filename = filename
+        # 懒加载附件的 filepath 是 "imap:..." 定位串，第一次打开时才下载
+        self.locator = filepath if attachment_store.is_locator(filepath) else None
+        self.filepath = None if self.locator else os.path.abspath(filepath)
+        self.waiting = False; self.pending = []
+        remote = self.locator is not None and not attachment_cache.is_cached(self.locator)
+        self.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.setToolTip(f"{filename}\n{'双击下载并打开' if remote else '双击打开'} | 右键另存为")
         l = QHBoxLayout(self); l.setContentsMargins(8,4,8,4); l.setSpacing(6)
-        icon = QLabel("📎"); icon.setStyleSheet("color:#007AFF;background:transparent;"); l.addWidget(icon)
+        self.icon = QLabel("☁️" if remote else "📎"); self.icon.setStyleSheet("color:#007AFF;background:transparent;"); l.addWidget(self.icon)
         nl = QLabel(filename); nl.setObjectName("AttName"); l.addWidget(nl)
         sz = "0B"
         try:
@@ -212,17 +243,41 @@ class AttachmentChip(QFrame):
             if s<1024: sz=f"{s}B"
             elif s<1048576: sz=f"{s/1024:.1f}KB"
             else: sz=f"{s/1048576:.1f}MB"
-        except: pass
-        sl = QLabel(sz); sl.setObjectName("AttSize"); l.addWidget(sl)
-    def mouseDoubleClickEvent(self, e):
-        if os.path.exists(self.filepath): QDesktopServices.openUrl(QUrl.fromLocalFile(self.filepath))
+        except: sz = str(size_bytes or "0B")
+        self.sl = QLabel(sz); self.sl.setObjectName("AttSize"); l.addWidget(self.sl); self.size_text = sz
+        # 别的芯片 / 上一次打开这封邮件时已经开始下了：接着等它
+        if self.locator in _fetches: self._wait()
+    def _wait(self):
+        if self.waiting: return
+        self.waiting = True; self.sl.setText("下载中...")
+        fetch_async(self.locator).done.connect(self.on_fetched)
+    def resolve(self, then):
+        """拿到本地文件后执行 then(path)；懒加载且还没下载时先在后台下载"""
+        if self.locator is None: then(self.filepath); return
+        path = attachment_cache.cached_path(self.locator)
+        if path: then(path); return
+        self.pending.append(then); self._wait()
+    def on_fetched(self, path, err):
+        self.waiting = False; self.sl.setText(self.size_text)
+        callbacks, self.pending = self.pending, []
+        if err:
+            if callbacks: QMessageBox.warning(self, "下载失败", err)
+            return
+        self.icon.setText("📎"); self.setToolTip(f"{self.filename}\n双击打开 | 右键另存为")
+        for then in callbacks: then(path)
+    def open_file(self, path):
+        if os.path.exists(path): QDesktopServices.openUrl(QUrl.fromLocalFile(path))
         else: QMessageBox.warning(self, "错误", "文件不存在")
+    def mouseDoubleClickEvent(self, e): self.resolve(self.open_file)
     def mousePressEvent(self, e):
         if e.button() == Qt.MouseButton.RightButton:
             m = QMenu(self); a = QAction("📥 另存为", self); a.triggered.connect(self.save); m.addAction(a); m.exec(e.globalPosition().toPoint())
     def save(self):
         p, _ = QFileDialog.getSaveFileName(self, "另存", self.filename)
-        if p and os.path.exists(self.filepath): shutil.copy2(self.filepath, p); QMessageBox.information(self,"成功","已保存")
+        if not p: return
+        def copy(path):
+            if os.path.exists(path): shutil.copy2(path, p); QMessageBox.information(self,"成功","已保存")
+        self.resolve(copy)
 
 class SearchFilterPopup(QWidget):
     filterChanged = pyqtSignal()
@@ -237,6 +292,9 @@ class SearchFilterPopup(QWidget):
         self.cb2 = QCheckBox("正文"); self.cb2.setChecked(True); self.cb2.stateChanged.connect(self.filterChanged.emit)
         self.cb3 = QCheckBox("发件人"); self.cb3.setChecked(True); self.cb3.stateChanged.connect(self.filterChanged.emit)
         i.addWidget(self.cb1); i.addWidget(self.cb2); i.addWidget(self.cb3)
+    def scopes(self):
+        """勾选的搜索范围 -> mail_search.search(..., scopes=...)"""
+        return [k for cb, k in ((self.cb1, "subject"), (self.cb2, "body"), (self.cb3, "sender")) if cb.isChecked()]
     def paintEvent(self, e): pass
 
 class ToastOverlay(QLabel):
@@ -257,27 +315,6 @@ def format_email_date(s):
         return dt.strftime("%H:%M") if dt.date() == datetime.now().date() else dt.strftime("%Y/%m/%d")
     except: return str(s)[:10]
 
-class MailListCard(QFrame):
-    def __init__(self, subject, sender, date_str, preview, parent=None):
-        super().__init__(parent); self.setObjectName("MailCard")
-        self.full_subject = subject if subject else "(无主题)"; self.full_preview = preview[:100].replace('\n',' ').strip() if preview else "无预览"
-        l = QVBoxLayout(self); l.setContentsMargins(15,12,15,12); l.setSpacing(6)
-        t = QHBoxLayout(); n = sender.split('<')[0].replace('"','').strip(); 
-        self.ls = QLabel(n if n else sender); self.ls.setObjectName("MailSender"); self.ls.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Preferred)
-        self.ld = QLabel(format_email_date(date_str)); self.ld.setObjectName("MailDate"); self.ld.setAlignment(Qt.AlignmentFlag.AlignRight)
-        t.addWidget(self.ls); t.addWidget(self.ld); l.addLayout(t)
-        self.lsub = QLabel(self.full_subject); self.lsub.setObjectName("MailSubject"); l.addWidget(self.lsub)
-        self.lpre = QLabel(self.full_preview); self.lpre.setObjectName("MailPreview"); l.addWidget(self.lpre)
-    def resizeEvent(self, e):
-        super().resizeEvent(e); w = self.width()-30
-        self.lsub.setText(QFontMetrics(self.lsub.font()).elidedText(self.full_subject, Qt.TextElideMode.ElideRight, w))
-        self.lpre.setText(QFontMetrics(self.lpre.font()).elidedText(self.full_preview, Qt.TextElideMode.ElideRight, w))
-    def set_selected(self, s):
-        c1, c2, c3 = ("white","#EEE","#DDD") if s else ("#222","#444","#999")
-        self.ls.setStyleSheet(f"font-weight:700;font-size:14px;color:{c1};")
-        self.lsub.setStyleSheet(f"font-size:13px;color:{c2};margin-top:2px;font-weight:500;")
-        self.ld.setStyleSheet(f"font-size:12px;color:{c3};"); self.lpre.setStyleSheet(f"font-size:12px;color:{c3};margin-top:4px;")
-
 # 🔥🔥🔥 旗舰版 EventCard：集成一键入会、参会人注入、模版管理
 class EventCard(QFrame):
     def __init__(self, uid, start_time, end_time, summary, location, description, minutes_content, sender, recipient, parent=None):
@@ -363,19 +400,16 @@ class EventCard(QFrame):
         else:
             self.reset_template(confirm=False) # 初始加载默认模版
             
-        self.ed.textChanged.connect(self.auto_save)
+        # 防抖：停止输入 0.8s (最长 5s) 才保存一次，写库在后台线程
+        self.saver = DebouncedSaver(self.save_minutes, 800, 5000, self)
+        self.ed.textChanged.connect(self.saver.touch); self.ed.installEventFilter(self)
         layout.addWidget(self.ed)
 
     def detect_meeting_link(self, loc, desc):
-        text = (str(loc) + " " + str(desc)).lower()
-        # 简单的正则匹配
-        url_match = re.search(r'(https?://[^\s]+)', text) # 粗略提取
-        url = url_match.group(0) if url_match else None
-        
-        if "teams" in text: return url, "Teams"
-        if "腾讯会议" in text or "voov" in text or "tencent" in text: return url, "Tencent"
-        if "zoom" in text: return url, "Zoom"
-        return None, None
+        # 和入库时同一套识别 (meeting_parser)
+        link = meeting_parser.event_link(loc, desc)
+        if not link: return None, None
+        return link[0], {"teams": "Teams", "tencent": "Tencent", "zoom": "Zoom"}[link[1]]
 
     def reset_template(self, confirm=True):
         if confirm and QMessageBox.question(self, "重置", "确定要覆盖当前纪要吗？", QMessageBox.StandardButton.Yes|QMessageBox.StandardButton.No) != QMessageBox.StandardButton.Yes:
@@ -399,15 +433,19 @@ class EventCard(QFrame):
         self.ed.setHtml(html)
         if confirm: self.auto_save() # 如果是手动重置，立即保存
 
-    def auto_save(self):
-        self.lbl_status.setText("💾 保存中...")
+    def save_minutes(self):
         try:
-            conn = sqlite3.connect('local_mail.db'); c = conn.cursor()
-            c.execute("UPDATE events SET minutes = ? WHERE uid = ?", (self.ed.toHtml(), self.uid))
-            conn.commit(); conn.close()
+            db_manager.save_minutes_async(self.uid, self.ed.toHtml())
             self.lbl_status.setText("☁️ 已同步")
         except: self.lbl_status.setText("❌ 失败")
 
+    def auto_save(self):
+        self.saver.touch(); self.saver.flush()
+
+    def eventFilter(self, obj, e):
+        if obj is self.ed and e.type() == QEvent.Type.FocusOut: self.saver.flush()   # 编辑器失焦立即保存
+        return super().eventFilter(obj, e)
+
     def export_word(self):
         try:
             from docx import Document # 需要安装 python-docx，如果没有会报错
@@ -429,29 +467,29 @@ class EventCard(QFrame):
 
 class MeetingCalendarWidget(QCalendarWidget):
     def __init__(self, parent=None):
-        super().__init__(parent); self.data = {}; self.setMouseTracking(True); self.setNavigationBarVisible(False); self.setVerticalHeaderFormat(QCalendarWidget.VerticalHeaderFormat.NoVerticalHeader); self.setHeaderTextFormat(QTextCharFormat())
-    def set_meeting_data(self, d): self.data = d; self.updateCell(QDate.currentDate())
-    def mouseMoveEvent(self, e): super().mouseMoveEvent(e); self.update() 
+        super().__init__(parent); self.data = {}; self.data_version = 0; self.setNavigationBarVisible(False); self.setVerticalHeaderFormat(QCalendarWidget.VerticalHeaderFormat.NoVerticalHeader); self.setHeaderTextFormat(QTextCharFormat())
+        # 字体/度量只建一次；鼠标移动不再整张网格重绘，只重绘进出的两个格子
+        self.day_font = QFont("Arial", 10, QFont.Weight.Bold); self.bar_text = CellTextCache(QFont("Arial", 9)); self.hover = CellHoverTracker(self)
+    def set_meeting_data(self, d): self.data = d; self.data_version += 1; self.update()
     def paintCell(self, p, r, d):
         sel = d == self.selectedDate(); today = d == QDate.currentDate(); p.save(); p.setRenderHint(QPainter.RenderHint.Antialiasing); p.setPen(Qt.PenStyle.NoPen) 
         if sel: p.setBrush(QColor("#EBF5FF")); p.drawRoundedRect(r.adjusted(2,2,-2,-2),6,6); p.setPen(QColor("#0066FF")); p.setBrush(Qt.BrushStyle.NoBrush); p.drawRoundedRect(r.adjusted(2,2,-2,-2),6,6)
-        else: p.setBrush(QColor("white")); p.drawRect(r)
+        else: p.setBrush(QColor("#F5F7FA") if self.hover.is_hovered(r) else QColor("white")); p.drawRect(r)
         p.setPen(QColor("#0066FF") if today else (QColor("#333") if d.month() == self.monthShown() else QColor("#DDD")))
         if today: p.setBrush(QColor("#0066FF")); p.drawEllipse(r.center().x()-10, r.top()+4, 20, 20); p.setPen(QColor("white"))
-        p.setFont(QFont("Arial", 10, QFont.Weight.Bold)); p.drawText(QRect(r.left(), r.top()+4, r.width(), 20), Qt.AlignmentFlag.AlignHCenter, str(d.day()))
+        p.setFont(self.day_font); p.drawText(QRect(r.left(), r.top()+4, r.width(), 20), Qt.AlignmentFlag.AlignHCenter, str(d.day()))
         
-        # 🔥🔥🔥 核心修复：文字绘制回归
+        # 🔥🔥🔥 核心修复：文字绘制回归 (截断后的标题按 日期/格宽/数据版本 缓存)
         if self.data.get(d):
             bar_bg = QColor("#E3F2FD"); txt_col = QColor("#5F6368")
-            bar_font = QFont("Arial", 9); p.setFont(bar_font); metrics = QFontMetrics(bar_font)
+            p.setFont(self.bar_text.font)
             start_y = r.top() + 28 
-            for title in self.data[d][:3]: 
+            for title in self.bar_text.elided(d, r.width() - 12, self.data_version, self.data[d]): 
                 bar_rect = QRect(r.left() + 3, start_y, r.width() - 6, 16)
                 p.setBrush(bar_bg); p.setPen(Qt.PenStyle.NoPen); p.drawRoundedRect(bar_rect, 3, 3) 
                 p.setPen(txt_col)
                 text_rect = bar_rect.adjusted(4, 0, -2, 0)
-                elided = metrics.elidedText(title, Qt.TextElideMode.ElideRight, text_rect.width())
-                p.drawText(text_rect, Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter, elided)
+                p.drawText(text_rect, Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter, title)
                 start_y += 18 
         p.restore()
 
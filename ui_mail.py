@@ -1,5 +1,5 @@
 # ui_mail.py
-# V12.60 - Fix: 增加全套邮件操作按钮 + 智能引用回复
+# V29.9 - Perf: 同步增量 (SyncDelta) 里的新邮件按 (日期, id) 直接插进列表，不再整页重载 (滚动位置和选中不动)
 import os
 import smtplib
 from datetime import datetime
@@ -10,10 +10,14 @@ from email.mime.application import MIMEApplication
 
 from PyQt6.QtWidgets import (QWidget, QFrame, QVBoxLayout, QHBoxLayout, 
                              QLabel, QSizePolicy, QDialog, QComboBox, QLineEdit, 
-                             QPushButton, QMessageBox, QFileDialog, QScrollArea, QTextEdit)
-from PyQt6.QtCore import Qt, pyqtSignal
+                             QPushButton, QMessageBox, QFileDialog, QScrollArea, QTextEdit,
+                             QTableView, QHeaderView, QAbstractItemView, QStyledItemDelegate, QStyle, QTextBrowser)
+from PyQt6.QtCore import Qt, pyqtSignal, QAbstractListModel, QModelIndex, QSize, QRect, QTimer
+from PyQt6.QtGui import QColor, QFont, QFontMetrics, QPen
 import config
-from ui_widgets import PersonChip, AttachmentChip
+import db_manager
+import mail_search
+from ui_components import PersonChip, PersonPopup, AttachmentChip, SearchFilterPopup, STYLESHEET as MAIL_STYLESHEET
 
 def format_email_date(s):
     if not s: return ""
@@ -180,24 +184,231 @@ class MailReaderHeader(QFrame):
         else:
             self.att_area.hide()
 
-class MailListCard(QFrame):
-    def __init__(self, subject, sender, date_str, preview, parent=None):
-        super().__init__(parent); self.setObjectName("MailCard")
-        l = QVBoxLayout(self); l.setContentsMargins(12, 10, 12, 10); l.setSpacing(3)
-        top = QHBoxLayout()
-        s_name = sender.split('<')[0].replace('"','').strip()
-        ls = QLabel(s_name); ls.setObjectName("MailSender")
-        top.addWidget(ls, 1)
-        ld = QLabel(format_email_date(date_str).split(' ')[0]); ld.setObjectName("MailDate")
-        top.addWidget(ld, 0)
-        l.addLayout(top)
-        lsub = QLabel(subject if subject else "(无主题)"); lsub.setObjectName("MailSubject")
-        l.addWidget(lsub)
-        lpre = QLabel(preview[:60].replace('\n',' ')); lpre.setObjectName("MailPreview")
-        l.addWidget(lpre)
-
-    def set_selected(self, selected):
-        pass 
+# === 邮件列表 (model/view)：几万封也只画屏幕上那十几行 ===
+MAIL_ROW_ROLE = Qt.ItemDataRole.UserRole
+SEARCH_DELAY = 250   # 毫秒：停止输入这么久才搜
+SEARCH_LIMIT = 200   # 搜索最多列出的条数 (按相关度)
+
+class MailListModel(QAbstractListModel):
+    """按页从数据库取 (db_manager.mail_page)；视图滚到底时 Qt 调 canFetchMore/fetchMore 再取一页
+    每行只留 (id, 发件人名, 日期文本, 标题, 预览)，日期在加载时格式化一次，绘制时不再解析"""
+    def __init__(self, account_email=None, parent=None):
+        super().__init__(parent)
+        self.account_email = account_email; self.rows = []; self.keys = []; self.cursor = None; self.more = True
+        self.searching = False
+
+    def rowCount(self, parent=QModelIndex()): return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        row = self.rows[index.row()]
+        if role == MAIL_ROW_ROLE: return row
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole): return row[3]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()): return not parent.isValid() and self.more
+
+    @staticmethod
+    def _row(i, sender, date_str, subject, preview):
+        name = (sender or "").split('<')[0].replace('"', '').strip() or (sender or "")
+        return (i, name, format_email_date(date_str).split(' ')[0], subject or "(无主题)", preview or "无预览")
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self.more: return
+        try: page = db_manager.mail_page(self.account_email, self.cursor)
+        except Exception as e: print(f"邮件列表加载失败: {e}"); page = []
+        self.more = len(page) == db_manager.MAIL_PAGE
+        if not page: return
+        self.cursor = (page[-1][2], page[-1][0])
+        self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+        for r in page: self.rows.append(self._row(*r)); self.keys.append((r[2] or "", r[0]))
+        self.endInsertRows()
+
+    def reload(self, account_email=None):
+        """切换账号 / 清空搜索后从第一页重新加载"""
+        self.beginResetModel()
+        self.account_email = account_email; self.rows = []; self.keys = []; self.cursor = None; self.more = True
+        self.searching = False
+        self.endResetModel()
+
+    def show_results(self, rows):
+        """换成搜索结果 (mail_search.search 的行，已按相关度排好，不再翻页)"""
+        self.beginResetModel()
+        self.rows = [self._row(i, sender, date_str, subject, snippet) for i, subject, sender, date_str, snippet in rows]
+        self.keys = []; self.cursor = None; self.more = False; self.searching = True
+        self.endResetModel()
+
+    def _position(self, key):
+        # keys 按 (日期, id) 降序，二分找插入位置
+        lo, hi = 0, len(self.keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.keys[mid] > key: lo = mid + 1
+            else: hi = mid
+        return lo
+
+    def apply_delta(self, email_ids):
+        """同步 / 回填新入库的邮件按 (日期, id) 插进已加载的行里，不重置模型 (滚动位置和选中都不动)
+        比已加载的最后一行还旧的不管：滚到底时 fetchMore 会按游标取到"""
+        if self.searching: return   # 搜索结果不插新邮件，清空搜索回到列表时自然能看到
+        have = {r[0] for r in self.rows}
+        ids = [i for i in email_ids if i not in have]
+        if not ids or (self.more and self.cursor is None): return
+        try: rows = db_manager.mail_rows(ids, self.account_email)
+        except Exception as e: print(f"邮件列表更新失败: {e}"); return
+        for r in rows:
+            key = (r[2] or "", r[0])
+            if self.more and key < (self.cursor[0] or "", self.cursor[1]): continue
+            pos = self._position(key)
+            self.beginInsertRows(QModelIndex(), pos, pos)
+            self.rows.insert(pos, self._row(*r)); self.keys.insert(pos, key)
+            self.endInsertRows()
+
+    def email_id(self, index): return self.rows[index.row()][0] if index.isValid() else None
+
+class MailListDelegate(QStyledItemDelegate):
+    """直接画 发件人 / 日期 / 标题 / 预览 四段文字，代替每行一个 QFrame + 四个 QLabel；字体和度量只建一次"""
+    ROW_HEIGHT = 76
+    PAD_X = 15; PAD_Y = 10
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.f_sender = QFont(); self.f_sender.setPixelSize(14); self.f_sender.setWeight(QFont.Weight.Bold)
+        self.f_subject = QFont(); self.f_subject.setPixelSize(13); self.f_subject.setWeight(QFont.Weight.Medium)
+        self.f_small = QFont(); self.f_small.setPixelSize(12)
+        self.m_sender = QFontMetrics(self.f_sender); self.m_subject = QFontMetrics(self.f_subject); self.m_small = QFontMetrics(self.f_small)
+
+    def sizeHint(self, option, index): return QSize(option.rect.width(), self.ROW_HEIGHT)
+
+    def paint(self, p, option, index):
+        row = index.data(MAIL_ROW_ROLE)
+        if row is None: return
+        _, sender, date_text, subject, preview = row
+        sel = bool(option.state & QStyle.StateFlag.State_Selected)
+        c1, c2, c3 = ("white", "#EEE", "#DDD") if sel else ("#222", "#444", "#999")
+        r = option.rect; p.save()
+        p.fillRect(r, QColor("#007AFF") if sel else QColor("white"))
+        p.setPen(QPen(QColor("#F5F5F5"))); p.drawLine(r.left(), r.bottom(), r.right(), r.bottom())
+        x = r.left() + self.PAD_X; w = r.width() - 2 * self.PAD_X; y = r.top() + self.PAD_Y
+        # 第一行：发件人 (左) + 日期 (右)
+        dw = self.m_small.horizontalAdvance(date_text) + 8
+        p.setFont(self.f_small); p.setPen(QColor(c3))
+        p.drawText(QRect(x + w - dw, y, dw, 20), Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter, date_text)
+        p.setFont(self.f_sender); p.setPen(QColor(c1))
+        p.drawText(QRect(x, y, w - dw, 20), Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter, self.m_sender.elidedText(sender, Qt.TextElideMode.ElideRight, w - dw))
+        # 第二行：标题；第三行：预览
+        p.setFont(self.f_subject); p.setPen(QColor(c2))
+        p.drawText(QRect(x, y + 22, w, 18), Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter, self.m_subject.elidedText(subject, Qt.TextElideMode.ElideRight, w))
+        p.setFont(self.f_small); p.setPen(QColor(c3))
+        p.drawText(QRect(x, y + 42, w, 18), Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter, self.m_small.elidedText(preview, Qt.TextElideMode.ElideRight, w))
+        p.restore()
+
+class MailListView(QTableView):
+    """邮件列表：单列表格 + 固定行高，Qt 只为可见行调用 delegate；选中一封发 mail_selected(email_id)
+    不用 QListView：它每次插行都给所有行重新排版 (每行回调一次 rowCount)，加载到几万行后每翻一页卡 100ms 以上；
+    表格的行位置由表头按固定行高算出来，翻到 10 万行每页仍是几毫秒"""
+    mail_selected = pyqtSignal(int)
+    def __init__(self, account_email=None, parent=None):
+        super().__init__(parent)
+        self.mail_model = MailListModel(account_email, self); self.setModel(self.mail_model)
+        self.setItemDelegate(MailListDelegate(self))
+        self.horizontalHeader().hide(); self.horizontalHeader().setStretchLastSection(True)
+        rows = self.verticalHeader(); rows.hide()
+        rows.setSectionResizeMode(QHeaderView.ResizeMode.Fixed); rows.setDefaultSectionSize(MailListDelegate.ROW_HEIGHT)
+        self.setShowGrid(False); self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.selectionModel().currentChanged.connect(self.on_current_changed)
+        self.mail_model.fetchMore()   # 表格不会自己取第一页
+
+    def on_current_changed(self, current, previous):
+        email_id = self.mail_model.email_id(current)
+        if email_id is not None: self.mail_selected.emit(email_id)
+
+    def reload(self, account_email=None): self.mail_model.reload(account_email); self.mail_model.fetchMore()
+
+class MailWindow(QWidget):
+    """邮件窗口：左边账号切换 + 搜索 + 虚拟列表 (MailListView)，右边阅读器 (MailReaderHeader + 正文)
+    主窗口点 ✉️ 打开；同步 / 回填有新邮件时主窗口调 apply_delta 插行"""
+    def __init__(self, parent=None):
+        super().__init__(parent, Qt.WindowType.Window)
+        self.setWindowTitle("邮件"); self.resize(1100, 720); self.setStyleSheet(MAIL_STYLESHEET)
+        self.compose = None; self.popup = None
+        root = QHBoxLayout(self); root.setContentsMargins(0, 0, 0, 0); root.setSpacing(0)
+
+        # 1. 左侧：账号 + 列表
+        left = QFrame(objectName="MailListPanel"); left.setFixedWidth(360)
+        ll = QVBoxLayout(left); ll.setContentsMargins(0, 0, 0, 0); ll.setSpacing(0)
+        bar = QHBoxLayout(); bar.setContentsMargins(12, 10, 12, 10); bar.setSpacing(8)
+        self.combo_account = QComboBox(); self.combo_account.addItem("全部账号", None)
+        for a in config.ACCOUNTS: self.combo_account.addItem(a.get('name', a['email']), a['email'])
+        self.combo_account.currentIndexChanged.connect(lambda _: self.run_search())
+        btn_new = QPushButton("✏️ 写邮件", objectName="HeaderActionBtn"); btn_new.clicked.connect(lambda: self.open_compose())
+        bar.addWidget(self.combo_account, 1); bar.addWidget(btn_new)
+        ll.addLayout(bar)
+        # 搜索：停止输入 SEARCH_DELAY 毫秒后查 (mail_search.search，全部账号)，范围来自 ⚙ 弹出的勾选框
+        sbar = QHBoxLayout(); sbar.setContentsMargins(12, 0, 12, 10); sbar.setSpacing(8)
+        self.search_box = QLineEdit(); self.search_box.setPlaceholderText("🔍 搜索邮件"); self.search_box.setClearButtonEnabled(True)
+        self.search_timer = QTimer(self); self.search_timer.setSingleShot(True); self.search_timer.setInterval(SEARCH_DELAY)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_box.textChanged.connect(lambda _: self.search_timer.start())
+        self.search_box.returnPressed.connect(self.run_search)
+        self.filter_popup = SearchFilterPopup(self); self.filter_popup.filterChanged.connect(self.run_search)
+        self.btn_filter = QPushButton("⚙", objectName="HeaderActionBtn"); self.btn_filter.setToolTip("搜索范围")
+        self.btn_filter.clicked.connect(self.show_filter)
+        sbar.addWidget(self.search_box, 1); sbar.addWidget(self.btn_filter)
+        ll.addLayout(sbar)
+        self.list_view = MailListView(); self.list_view.mail_selected.connect(self.show_mail)
+        ll.addWidget(self.list_view, 1)
+        root.addWidget(left)
+
+        # 2. 右侧：阅读器
+        right = QFrame(objectName="MailReaderPanel")
+        rl = QVBoxLayout(right); rl.setContentsMargins(0, 0, 0, 0); rl.setSpacing(0)
+        self.header = MailReaderHeader(); self.header.action_trigger.connect(self.on_action)
+        self.body = QTextBrowser(); self.body.setOpenExternalLinks(True)
+        self.body.setStyleSheet("border:none; padding:0 24px; font-size:14px;")
+        rl.addWidget(self.header); rl.addWidget(self.body, 1)
+        root.addWidget(right, 1)
+
+    def apply_delta(self, email_ids): self.list_view.mail_model.apply_delta(email_ids)
+
+    def show_filter(self):
+        self.filter_popup.move(self.btn_filter.mapToGlobal(self.btn_filter.rect().bottomLeft())); self.filter_popup.show()
+
+    def run_search(self):
+        self.search_timer.stop()
+        text = self.search_box.text().strip()
+        if not text: self.list_view.reload(self.combo_account.currentData()); return
+        try: rows = mail_search.search(text, self.filter_popup.scopes(), limit=SEARCH_LIMIT, mark=("", ""))
+        except Exception as e: print(f"搜索失败: {e}"); rows = []
+        self.list_view.mail_model.show_results(rows)
+
+    def show_mail(self, email_id):
+        try: row = db_manager.email_detail(email_id)
+        except Exception as e: print(f"读取邮件失败: {e}"); row = None
+        if row is None: return
+        subject, sender, recipient, cc, date_str, attachments, body_text, body_plain, body_html = row
+        text = body_text or body_plain or ""
+        self.header.update_data(subject, sender, recipient, cc, date_str, attachments, text, self.on_person)
+        if body_html: self.body.setHtml(body_html)
+        else: self.body.setPlainText(text)
+
+    def on_person(self, name, email_addr, pos):
+        self.popup = PersonPopup(name, email_addr, self); self.popup.action_signal.connect(self.on_person_action)
+        self.popup.move(pos); self.popup.show()
+
+    def on_person_action(self, action, email_addr):
+        if action == "compose": self.open_compose("new", {"to": email_addr})
+        elif action == "history": self.search_box.setText(email_addr); self.run_search()
+
+    def on_action(self, action, data):
+        if action == "delete": QMessageBox.information(self, "提示", "暂不支持删除服务器上的邮件"); return
+        self.open_compose(action, data)
+
+    def open_compose(self, mode="new", data=None):
+        self.compose = ComposeWindow(); self.compose.set_initial_data(mode, data); self.compose.show()
 
 # 写信窗口 (增强版)
 class ComposeWindow(QDialog):
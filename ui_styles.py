@@ -14,6 +14,8 @@ QMainWindow { background-color: #FFFFFF; }
 QFrame#UnifiedHeader { background-color: #FFFFFF; border-bottom: 1px solid #E5E5E5; }
 QPushButton#SyncBtn { background-color: #007AFF; color: white; border-radius: 6px; padding: 6px 16px; font-size: 13px; font-weight: 600; }
 QPushButton#SyncBtn:hover { background-color: #006ADB; }
+QPushButton#MailBtn { background-color: #F2F4F8; color: #333; border-radius: 6px; padding: 6px 16px; font-size: 13px; font-weight: 600; }
+QPushButton#MailBtn:hover { background-color: #E6E8EC; }
 
 /* === Calendar === */
 QFrame#CalendarContainer { background-color: #FFFFFF; }
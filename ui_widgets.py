@@ -1,8 +1,8 @@
 # ui_widgets.py
-# V26.0 - New: 优雅的进度胶囊 & Toast
-from PyQt6.QtWidgets import QWidget, QLabel, QHBoxLayout, QVBoxLayout, QFrame, QProgressBar, QGraphicsDropShadowEffect
-from PyQt6.QtCore import Qt, QTimer, QPropertyAnimation, QEasingCurve, QPoint
-from PyQt6.QtGui import QColor, QPainter, QBrush, QPen
+# V29.7 - New: DebouncedSaver (停止输入一会儿才保存，连续输入也有最长等待上限)
+from PyQt6.QtWidgets import QWidget, QLabel, QHBoxLayout, QVBoxLayout, QFrame, QProgressBar, QGraphicsDropShadowEffect, QTableView
+from PyQt6.QtCore import Qt, QTimer, QPropertyAnimation, QEasingCurve, QPoint, QObject, QEvent, QRect
+from PyQt6.QtGui import QColor, QPainter, QBrush, QPen, QFontMetrics
 
 # === 1. 简单的 Toast (保留) ===
 class ToastOverlay(QWidget):
@@ -124,4 +124,64 @@ class ProgressPill(QWidget):
         self.opacity_anim.setStartValue(1)
         self.opacity_anim.setEndValue(0)
         self.opacity_anim.finished.connect(self.hide)
-        self.opacity_anim.start()
\ No newline at end of file
+        self.opacity_anim.start()
+# === 3. 日历绘制辅助 ===
+class CellTextCache:
+    """paintCell 用：字体 / 度量只建一次，省略号截断后的标题按 (日期, 格宽, 数据版本) 缓存
+    数据版本变了 (set_meeting_data) 整个缓存作废；拖动窗口大小会产生很多种格宽，超过上限就清空重来"""
+    MAX_ENTRIES = 512
+    def __init__(self, font):
+        self.font = font; self.metrics = QFontMetrics(font); self.version = None; self._cache = {}
+
+    def elided(self, date, width, version, titles, limit=3):
+        if version != self.version or len(self._cache) > self.MAX_ENTRIES: self._cache.clear(); self.version = version
+        key = (date, width)
+        out = self._cache.get(key)
+        if out is None:
+            out = self._cache[key] = tuple(self.metrics.elidedText(t, Qt.TextElideMode.ElideRight, width) for t in titles[:limit])
+        return out
+
+class CellHoverTracker(QObject):
+    """跟踪 QCalendarWidget 里鼠标悬停的格子；换格子时只重绘离开和进入的两格，而不是整张 6x7 网格
+    paintCell 里用 tracker.is_hovered(rect) 判断当前格子是否悬停"""
+    def __init__(self, calendar):
+        super().__init__(calendar)
+        self.view = calendar.findChild(QTableView); self.rect = QRect()
+        if self.view is not None:
+            self.view.setMouseTracking(True); self.view.viewport().setMouseTracking(True)
+            self.view.viewport().installEventFilter(self)
+
+    def is_hovered(self, rect): return not self.rect.isNull() and rect == self.rect
+
+    def _move_to(self, rect):
+        if rect == self.rect: return
+        old, self.rect = self.rect, rect
+        vp = self.view.viewport()
+        if not old.isNull(): vp.update(old)
+        if not rect.isNull(): vp.update(rect)
+
+    def eventFilter(self, obj, e):
+        if e.type() == QEvent.Type.MouseMove:
+            idx = self.view.indexAt(e.position().toPoint())
+            self._move_to(self.view.visualRect(idx) if idx.isValid() else QRect())
+        elif e.type() == QEvent.Type.Leave: self._move_to(QRect())
+        return False
+
+# === 4. 防抖保存 ===
+class DebouncedSaver(QObject):
+    """touch() 标记有改动：停止输入 idle_ms 后保存；一直在输入的话，最多 max_ms 也会保存一次
+    flush() 立即保存 (失焦 / 关闭时调用)；save_fn 只在有改动时被调用"""
+    def __init__(self, save_fn, idle_ms=800, max_ms=5000, parent=None):
+        super().__init__(parent)
+        self.save_fn = save_fn; self.dirty = False
+        self.idle = QTimer(self); self.idle.setSingleShot(True); self.idle.setInterval(idle_ms); self.idle.timeout.connect(self.flush)
+        self.cap = QTimer(self); self.cap.setSingleShot(True); self.cap.setInterval(max_ms); self.cap.timeout.connect(self.flush)
+
+    def touch(self):
+        self.dirty = True; self.idle.start()
+        if not self.cap.isActive(): self.cap.start()
+
+    def flush(self):
+        self.idle.stop(); self.cap.stop()
+        if not self.dirty: return
+        self.dirty = False; self.save_fn()